@@ -0,0 +1,67 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Benchmarks for the message module -- reading, writing, and querying messages.
+'''
+import soscoap as coap
+from   soscoap import message as msgModule
+
+def createMessages():
+    '''Returns a list of (name, CoapMessage) for representative message shapes.'''
+    empty             = msgModule.CoapMessage()
+    empty.messageType = coap.MessageType.ACK
+    
+    token             = msgModule.CoapMessage()
+    token.messageType = coap.MessageType.ACK
+    token.codeClass   = coap.CodeClass.Success
+    token.codeDetail  = coap.SuccessResponseCode.Changed
+    token.tokenLength = 4
+    token.token       = b'\x35\x61\x0a\x7f'
+    
+    path = msgModule.CoapMessage()
+    path.messageType = coap.MessageType.CON
+    path.codeDetail  = coap.RequestCode.GET
+    path.tokenLength = 2
+    path.token       = b'\x35\x61'
+    for segment in ('sensors', 'room', '12', 'temperature'):
+        path.addOption(msgModule.CoapOption(coap.OptionType.UriPath, segment))
+    path.addOption(msgModule.CoapOption(coap.OptionType.UriQuery, 'unit=C'))
+    
+    json = msgModule.CoapMessage()
+    json.messageType = coap.MessageType.NON
+    json.codeDetail  = coap.RequestCode.POST
+    json.tokenLength = 2
+    json.token       = b'\x35\x61'
+    json.addOption(msgModule.CoapOption(coap.OptionType.UriPath, 'rss'))
+    json.addOption(msgModule.CoapOption(coap.OptionType.ContentFormat, 
+                                        coap.MediaType.Json))
+    json.payloadStr('{"v":-69,"t":1490000000,"n":"node-12","u":"dBm"}')
+    
+    return [('empty', empty), ('token', token), ('path', path), ('json', json)]
+
+def run(runner):
+    buffer = bytearray(1024)
+    for name, msg in createMessages():
+        msgBytes = bytes(msgModule.serialize(msg))
+        runner.run('buildFrom.' + name, lambda: msgModule.buildFrom(msgBytes), 2000)
+        runner.run('buildFrom.lazy.' + name, 
+                   lambda: msgModule.buildFrom(msgBytes, lazy=True), 2000)
+        runner.run('serialize.' + name, lambda: msgModule.serialize(msg), 2000)
+        runner.run('serializeInto.' + name, 
+                   lambda: msgModule.serializeInto(msg, buffer), 2000)
+    
+    msg = msgModule.buildFrom(msgModule.serialize(createMessages()[2][1]))
+    runner.run('CoapMessage.findOption', 
+               lambda: msg.findOption(coap.OptionType.UriQuery), 5000)
+    runner.run('CoapMessage.absolutePath', msg.absolutePath, 5000)
+    
+    def addOptions():
+        msg = msgModule.CoapMessage()
+        msg.addOption(msgModule.CoapOption(coap.OptionType.ContentFormat, 0))
+        msg.addOption(msgModule.CoapOption(coap.OptionType.UriPath, 'cli'))
+        msg.addOption(msgModule.CoapOption(coap.OptionType.UriPath, 'stats'))
+        msg.addOption(msgModule.CoapOption(coap.OptionType.ETag, b'\x01\x02'))
+    runner.run('CoapMessage.addOption x4', addOptions, 2000)
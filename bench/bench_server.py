@@ -0,0 +1,81 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Benchmarks for the server module -- request handling over a stub MessageSocket,
+and a UDP loopback round trip through a real MessageSocket.
+'''
+import asyncore
+import socket
+from   soscoap import message as msgModule
+from   soscoap.msgsock import MessageSocket
+from   soscoap.server import CoapServer
+
+class StubMessageSocket(object):
+    '''Stands in for a MessageSocket, like the mock in test_server.py, but without
+    per-call mock overhead. Discards sent messages.'''
+    def registerForReceive(self, handler):
+        pass
+        
+    def send(self, message, onSent=None):
+        if onSent:
+            onSent(message)
+        
+    def sendRaw(self, msgBytes, address, onSent=None):
+        pass
+
+# CON GET /ver
+verGetMsg  = b'\x40\x01\x6C\x29\xB3\x76\x65\x72'
+# NON POST /rss with Content-Format JSON
+jsonPostMsg = b'\x51\x02\xe9\xe8\x7b\xb3\x72\x73\x73\x11\x32\xff\x7b\x22\x76\x22\x3a\x2d\x36\x39\x7d'
+
+address = ('::1', 42683, 0, 0)
+
+def getResource(resource):
+    if resource.path == '/ver':
+        resource.type  = 'string'
+        resource.value = '0.1'
+        
+def postResource(resource):
+    pass
+
+def run(runner):
+    for pooled in (False, True):
+        server = CoapServer(StubMessageSocket(), pooled=pooled)
+        server.registerForResourceGet(getResource)
+        server.registerForResourcePost(postResource)
+        suffix = '.pooled' if pooled else ''
+        
+        runner.run('server.get' + suffix, lambda: server._handleMessage(
+                            msgModule.buildFrom(verGetMsg, address)), 2000)
+        runner.run('server.post.json' + suffix, lambda: server._handleMessage(
+                            msgModule.buildFrom(jsonPostMsg, address)), 2000)
+                            
+    server.registerStaticResource('/ver', '0.1')
+    runner.run('server.get.static', lambda: server._handleMessage(
+                            msgModule.buildFrom(verGetMsg, address)), 2000)
+                            
+    runLoopback(runner)
+
+def runLoopback(runner, port=56830):
+    '''Measures a GET round trip from a client socket to a CoapServer over the 
+    loopback interface. Runs the asyncore loop in this thread.'''
+    server = CoapServer(port=port)
+    server.registerForResourceGet(getResource)
+    client = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    client.settimeout(1.0)
+    target = ('::1', port)
+    
+    def roundTrip():
+        client.sendto(verGetMsg, target)
+        # read request, then write reply
+        asyncore.loop(timeout=1.0, count=2)
+        client.recvfrom(1024)
+        
+    try:
+        runner.run('udp.roundtrip', roundTrip, 200)
+    finally:
+        client.close()
+        server._msgSocket.close()
@@ -0,0 +1,114 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Common tools to run the benchmarks in this directory, and to save and compare 
+their results.
+'''
+from   __future__ import print_function
+import gc
+import json
+import platform
+import sys
+import timeit
+
+class BenchResult(object):
+    '''Measurements for a single benchmark.
+    
+    Attributes:
+        :name:       str Benchmark name
+        :opsPerSec:  float Mean operations per second over all samples
+        :percentiles: dict Latency in microseconds per operation, keyed by 
+                           percentile (50, 90, 99)
+    '''
+    def __init__(self, name, opsPerSec, percentiles):
+        self.name        = name
+        self.opsPerSec   = opsPerSec
+        self.percentiles = percentiles
+        
+    def toDict(self):
+        return {'opsPerSec': self.opsPerSec, 
+                'percentiles': dict((str(p), v) for p,v in self.percentiles.items())}
+
+class BenchRunner(object):
+    '''Runs benchmark functions, and collects their results. Each benchmark runs
+    a fixed count of warmup calls, then a fixed count of samples of 'inner' calls 
+    each, with garbage collection disabled, so results are comparable between 
+    runs on the same host. Latency percentiles are over the mean time per call 
+    within each sample; use inner=1 to measure individual calls.
+    
+    Attributes:
+        :samples: int Count of timed samples per benchmark
+        :scale:   float Multiplier for the inner count of each benchmark, to 
+                        trade precision for run time
+        :pattern: str Only run benchmarks whose name contains this text
+        :results: list BenchResult for each benchmark run
+    '''
+    def __init__(self, samples=50, scale=1.0, pattern=None):
+        self.samples = samples
+        self.scale   = scale
+        self.pattern = pattern
+        self.results = []
+        
+    def run(self, name, func, inner=1000):
+        '''Runs and reports a benchmark.
+        
+        :param func: function Operation to measure; accepts no arguments
+        :param inner: int Count of calls per sample
+        '''
+        if self.pattern and self.pattern not in name:
+            return
+        inner = max(1, int(inner * self.scale))
+        timer = timeit.default_timer
+        
+        for i in range(max(inner // 10, 1)):
+            func()
+        
+        gcEnabled = gc.isenabled()
+        gc.disable()
+        try:
+            times = []
+            for s in range(self.samples):
+                start = timer()
+                for i in range(inner):
+                    func()
+                times.append((timer() - start) / inner)
+        finally:
+            if gcEnabled:
+                gc.enable()
+        
+        times.sort()
+        percentiles = dict((p, times[min(len(times)-1, len(times) * p // 100)] * 1e6)
+                           for p in (50, 90, 99))
+        result = BenchResult(name, len(times) / sum(times), percentiles)
+        self.results.append(result)
+        print('{0:<32} {1:>11,.0f} ops/s   p50 {2:>8.2f} us   p90 {3:>8.2f} us   p99 {4:>8.2f} us'
+              .format(name, result.opsPerSec, percentiles[50], percentiles[90], 
+                      percentiles[99]))
+        return result
+        
+    def save(self, filename):
+        '''Writes results to a JSON file'''
+        data = {'python':   sys.version.split()[0],
+                'platform': platform.platform(),
+                'results':  dict((r.name, r.toDict()) for r in self.results)}
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            
+    def compare(self, filename):
+        '''Prints the change in ops/s for each result relative to a saved JSON 
+        file.'''
+        with open(filename) as f:
+            data = json.load(f)
+        if data['python'] != sys.version.split()[0]:
+            print('Note: baseline is from Python {0}'.format(data['python']))
+        print('\nChange vs. {0}'.format(filename))
+        for result in self.results:
+            base = data['results'].get(result.name)
+            if base:
+                change = (result.opsPerSec / base['opsPerSec'] - 1) * 100
+                print('{0:<32} {1:>+8.1f}%'.format(result.name, change))
+            else:
+                print('{0:<32} {1:>9}'.format(result.name, 'new'))
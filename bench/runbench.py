@@ -0,0 +1,46 @@
+#!/usr/bin/python
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Runs the benchmarks in this directory. Reports ops/s and latency percentiles 
+for each benchmark.
+
+Options:
+   | -k <text>   -- Only run benchmarks whose name contains the text
+   | -n <count>  -- Samples per benchmark; default 50
+   | -x <scale>  -- Multiplier for calls per sample; default 1.0
+   | -s <file>   -- Save results to a JSON file
+   | -c <file>   -- Compare results with a JSON file saved previously
+
+Run on POSIX with:
+   ``$ PYTHONPATH=.. ./runbench.py -s baseline.json``
+'''
+from   __future__ import print_function
+from   optparse import OptionParser
+import random
+import bench_codec
+import bench_server
+from   benchutil import BenchRunner
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-k', type='string', dest='pattern', default=None)
+    parser.add_option('-n', type='int', dest='samples', default=50)
+    parser.add_option('-x', type='float', dest='scale', default=1.0)
+    parser.add_option('-s', type='string', dest='saveFile', default=None)
+    parser.add_option('-c', type='string', dest='compareFile', default=None)
+    (options, args) = parser.parse_args()
+    
+    # Server message IDs start from a random value.
+    random.seed(5683)
+    runner = BenchRunner(options.samples, options.scale, options.pattern)
+    bench_codec.run(runner)
+    bench_server.run(runner)
+    
+    if options.saveFile:
+        runner.save(options.saveFile)
+    if options.compareFile:
+        runner.compare(options.compareFile)
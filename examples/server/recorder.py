@@ -15,8 +15,10 @@ from   __future__ import print_function
 import logging
 import asyncore
 import sys
+import threading
 from   soscoap  import MessageType
 from   soscoap  import RequestCode
+from   soscoap.dedup    import DuplicateCache
 from   soscoap.resource import SosResourceTransfer
 from   soscoap.msgsock  import MessageSocket
 from   soscoap.server   import CoapServer
@@ -34,6 +36,7 @@ class ValueRecorder(object):
         :uripath:  str URI for resource
         :filename: str Name of target file for recording
         :_chanfile: File Recording target
+        :_writeLock: Lock Serializes writes to _chanfile from the handler threads
         :_server:   CoapServer Provides CoAP message protocol
     
     Usage:
@@ -52,11 +55,18 @@ class ValueRecorder(object):
         self.filename  = filename
         # Must be defined for use by close().
         self._chanfile = None
+        self._writeLock = threading.Lock()
         
-        self._server = CoapServer()
-        self._server.registerForResourceGet(self._getResource)
-        self._server.registerForResourcePut(self._putResource)
-        self._server.registerForResourcePost(self._postResource)
+        # Record a retransmitted request only once.
+        self._server = CoapServer(dedup=DuplicateCache())
+        self._server.registerStaticResource('/ver', VERSION)
+        # File writes block, so run the handlers off the network loop. The 
+        # server replies 4.04 for any other path, and 4.05 for any other method
+        # on uripath, like GET.
+        self._server.registerForResourcePut(self._putResource, blocking=True,
+                                            path=uripath)
+        self._server.registerForResourcePost(self._postResource, blocking=True,
+                                             path=uripath)
         
     def close(self):
         '''Releases system resources.
@@ -64,17 +74,6 @@ class ValueRecorder(object):
         if self._chanfile:
             self._chanfile.close() 
                 
-    def _getResource(self, resource):
-        '''Sets the value for the provided resource, for a GET request.
-        '''
-        log.debug('Resource path is {0}'.format(resource.path))
-        if resource.path == '/ver':
-            resource.type  = 'string'
-            resource.value = VERSION
-            log.debug('Got resource value')
-        else:
-            log.debug('Unknown path')
-    
     def _postResource(self, resource):
         '''Records the value for the provided resource, for a POST request.
         
@@ -82,13 +81,8 @@ class ValueRecorder(object):
                                1. int Time
                                2. int Value
         '''
-        log.debug('Resource path is {0}'.format(resource.path))
-        if resource.path == self.uripath:
-            self._chanfile.writelines((resource.value, '\n'))
-            self._chanfile.flush()
-            log.debug('POST resource value done')
-        else:
-            raise NotImplementedError('Unknown path')
+        self._recordValue(resource.value)
+        log.debug('POST resource value done')
     
     def _putResource(self, resource):
         '''Records the value for the provided resource, for a PUT request.
@@ -97,13 +91,16 @@ class ValueRecorder(object):
                                1. int Time
                                2. int Value
         '''
-        log.debug('Resource path is {0}'.format(resource.path))
-        if resource.path == self.uripath:
-            self._chanfile.writelines((resource.value, '\n'))
+        self._recordValue(resource.value)
+        log.debug('PUT resource value done')
+    
+    def _recordValue(self, value):
+        '''Writes a value to the file. Handlers run on several threads, so the
+        lock keeps each line whole.
+        '''
+        with self._writeLock:
+            self._chanfile.writelines((value, '\n'))
             self._chanfile.flush()
-            log.debug('PUT resource value done')
-        else:
-            raise NotImplementedError('Unknown path')
     
     def start(self):
         '''Creates the server, and opens the file for this recorder.
@@ -58,6 +58,15 @@ def _enum(**enums):
 
 COAP_PORT = 5683
 
+EXCHANGE_LIFETIME = 247
+'''Seconds from the start of a confirmable exchange to its end, from section 4.8.2
+of the spec, with default transmission parameters'''
+
+MAX_TRANSMIT_WAIT = 93
+'''Seconds from the first transmission of a confirmable message until the sender
+gives up on an acknowledgement, from section 4.8.2 of the spec, with default
+transmission parameters'''
+
 BYTESTR_ENCODING = 'latin1'
 '''Used to convert a Python3 str resource to a byte sequence'''
 
@@ -115,13 +124,16 @@ OptionType = _enum(
     UriQuery      = OptionType(15,'Uri-Query',      True, 'string', (0,255), None),
     Accept        = OptionType(17,'Accept',         False,'uint',   (0,2),   None),
     LocationQuery = OptionType(20,'Location-Query', True, 'string', (0,255), None),
+    Block2        = OptionType(23,'Block2',         False,'uint',   (0,3),   None),
+    Block1        = OptionType(27,'Block1',         False,'uint',   (0,3),   None),
+    Size2         = OptionType(28,'Size2',          False,'uint',   (0,4),   None),
     ProxyUri      = OptionType(35,'Proxy-Uri',      False,'string', (1,1034),None),
     ProxyScheme   = OptionType(39,'Proxy-Scheme',   False,'string', (1,255), None),
     Size1         = OptionType(60,'Size1',          False,'uint',   (0,4),   None),
 )
 '''OptionType enum -- If-Match, etc. Values are OptionType objects. Uses option 
-   number for reverse lookup.'''
+   number for reverse lookup. Block options are defined in RFC 7959.'''
 
 MediaType = _enum(TextPlain=0, LinkFormat=40, Xml=41, OctetStream=42, Exi=47, 
-                  Json=50)
+                  Json=50, Cbor=60, SenmlJson=110, SenmlCbor=112)
 '''Enum for CoAP Content-Formats registry.'''
@@ -0,0 +1,326 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides an asyncio transport for SOS, so a CoapServer or CoapClient may share an
+event loop with other services. Requires Python 3.5 or later.
+
+Usage:
+    #. server = AsyncCoapServer(port) -- Create instance within a running loop
+    #. Register event handlers as for CoapServer
+    #. await server.serve() -- Listens until closed; or await server.open() to
+       listen without waiting
+    #. await server.close() -- Stop listening
+'''
+import asyncio
+import logging
+import socket
+import soscoap
+from   soscoap.client import CoapClient
+import soscoap.event as event
+import soscoap.message as msgModule
+import soscoap.probe as probe
+from   soscoap.server import CoapServer
+
+log = logging.getLogger(__name__)
+
+class AsyncMessageSocket(asyncio.DatagramProtocol):
+    '''Source for network CoAP messages, based on an asyncio datagram endpoint.
+    Provides the same contract as msgsock.MessageSocket, and listens on the
+    provided port for the provided local address, or any interface.
+
+    Events:
+        Register a handler for an event via the 'registerFor<Event>' method.
+
+        :Receive: Triggered with the received CoAP message
+        :ReceiveBatch: Triggered with a list of the received CoAP message, 
+                       before Receive. asyncio delivers one datagram at a time,
+                       so the list has a single entry.
+        :QueueLevel: Triggered with (True, depth) when the transport pauses
+                     writing, and (False, depth) when it resumes. depth is the
+                     size in bytes of the transport write buffer.
+
+    Attributes:
+        :lazyDecode: boolean If True, received messages decode options on demand;
+                             see message.buildFrom()
+        :transport:  DatagramTransport for the endpoint, or None until open()
+        :closed:     Future Done when the transport is closed; None until open()
+        :_opening:   Task Binds the endpoint; None until open()
+        :_loop:      Event loop for the endpoint; None until open()
+        :_localPort: int Port for the endpoint
+        :_localHost: str IPv6 address for the endpoint, including any scope 
+                         zone; '::' for any interface
+        :_reusePort: boolean Set SO_REUSEPORT for the endpoint
+        :_remote:    tuple AF_INET6 address for the connected destination, or None
+        :_msgPool:   ObjectPool Optional source for received messages
+        :_waterMarks: tuple (high, low) write buffer limits in bytes for the 
+                      transport, or None for the asyncio defaults
+        :_receiveHook: EventHook Triggered when message received
+        :_receiveBatchHook: EventHook Triggered when message received, as a list
+        :_queueLevelHook: EventHook Triggered when the transport pauses or 
+                          resumes writing
+        :_receivedCount:  int Count of datagrams received
+        :_sentCount:      int Count of datagrams sent
+
+    .. automethod:: soscoap.aio.AsyncMessageSocket.__init__
+    '''
+    def __init__(self, localPort=soscoap.COAP_PORT, remote=None, lazyDecode=False,
+                       msgPool=None, highWater=None, lowWater=None, reusePort=False,
+                       localHost='', scopeId=0):
+        '''Call open() to bind the endpoint.
+
+        :param localPort: int Port for the endpoint; 0 for an ephemeral port
+        :param remote: tuple AF_INET6 4-tuple for remote address
+        :param lazyDecode: boolean Decode received message options on demand
+        :param msgPool: ObjectPool Optional source for received messages
+        :param highWater: int Transport write buffer size in bytes that triggers a
+                              high QueueLevel
+        :param lowWater: int Transport write buffer size in bytes that ends a high
+                             QueueLevel
+        :param reusePort: boolean Set SO_REUSEPORT, so other processes may bind
+                                  the same port
+        :param localHost: str Local IPv6 address to bind; '' for any interface
+        :param scopeId: int Interface index for a link-local localHost
+        '''
+        self.lazyDecode   = lazyDecode
+        self.transport    = None
+        self.closed       = None
+        self._opening     = None
+        self._loop        = None
+        self._localPort   = localPort
+        self._localHost   = localHost if localHost else '::'
+        if scopeId:
+            # asyncio resolves a 2-tuple local address; embed the scope zone
+            self._localHost = '{0}%{1}'.format(self._localHost, scopeId)
+        self._reusePort   = reusePort
+        self._remote      = remote
+        self._msgPool     = msgPool
+        self._waterMarks  = (highWater, lowWater) if highWater or lowWater else None
+        self._receiveHook = event.EventHook()
+        self._receiveBatchHook = event.EventHook()
+        self._queueLevelHook   = event.EventHook()
+        self._receivedCount    = 0
+        self._sentCount        = 0
+
+    async def open(self, loop=None):
+        '''Binds the endpoint on the provided loop, or the running loop. Safe to
+        call more than once.'''
+        if self._opening is None:
+            self._opening = asyncio.ensure_future(self._open(loop))
+        await self._opening
+        return self
+
+    async def _open(self, loop):
+        loop = loop if loop else asyncio.get_event_loop()
+        self._loop  = loop
+        self.closed = loop.create_future()
+        await loop.create_datagram_endpoint(lambda: self,
+                                            local_addr=(self._localHost, self._localPort),
+                                            remote_addr=self._remote[:2]
+                                                        if self._remote else None,
+                                            family=socket.AF_INET6,
+                                            reuse_port=self._reusePort or None)
+
+    def close(self):
+        '''Closes the transport; await closed for completion.'''
+        if self.transport:
+            self.transport.close()
+
+    def getsockname(self):
+        '''Returns the bound local address.'''
+        return self.transport.get_extra_info('sockname')
+
+    def registerForReceive(self, handler):
+        self._receiveHook.register(handler)
+
+    def registerForReceiveBatch(self, handler):
+        self._receiveBatchHook.register(handler)
+
+    def registerForQueueLevel(self, handler):
+        self._queueLevelHook.register(handler)
+
+    def pauseReading(self):
+        '''Stops reading from the transport.'''
+        self.transport.pause_reading()
+
+    def resumeReading(self):
+        self.transport.resume_reading()
+
+    def enableCallFromThread(self):
+        '''No preparation required for callFromThread().'''
+        pass
+
+    def callFromThread(self, func, *args):
+        '''Runs the provided function with arguments on the loop thread, soon.
+        Safe to call from any thread after open().
+
+        :raises RuntimeError: If called before open()
+        '''
+        if self._loop is None:
+            raise RuntimeError('callFromThread() requires open() for the loop')
+        self._loop.call_soon_threadsafe(func, *args)
+
+    def stats(self):
+        '''Returns a dict of counters and queue sizes, like MessageSocket.stats().
+        The transport does not report kernel drops, and sendQueue is the size of
+        the transport write buffer in bytes.'''
+        return {'received':    self._receivedCount,
+                'sent':        self._sentCount,
+                'kernelDrops': None,
+                'sendQueue':   self.queueDepth()}
+
+    def queueDepth(self):
+        '''Returns the size in bytes of the transport write buffer.'''
+        return self.transport.get_write_buffer_size() if self.transport else 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self._waterMarks:
+            transport.set_write_buffer_limits(*self._waterMarks)
+
+    def pause_writing(self):
+        log.warning('Transport write buffer high')
+        self._queueLevelHook.trigger(True, self.queueDepth())
+
+    def resume_writing(self):
+        log.info('Transport write buffer low')
+        self._queueLevelHook.trigger(False, self.queueDepth())
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def error_received(self, exc):
+        log.warning('Socket error: {0}'.format(exc))
+
+    def datagram_received(self, data, addr):
+        self._receivedCount += 1
+        if probe.receive.enabled:
+            probe.receive.fire(addr, len(data), data)
+
+        try:
+            if self._msgPool:
+                coapmsg = msgModule.buildFrom(bytestr=data, lazy=self.lazyDecode,
+                                              message=self._msgPool.acquire(addr))
+            else:
+                coapmsg = msgModule.buildFrom(address=addr, bytestr=data,
+                                              lazy=self.lazyDecode)
+        except Exception:
+            log.exception('Error reading message from {0}'.format(addr))
+            return
+        coapmsg.endpoint = self
+        if probe.decode.enabled:
+            probe.decode.fire(addr, len(data), coapmsg)
+
+        self._receiveBatchHook.trigger([coapmsg])
+        self._receiveHook.trigger(coapmsg)
+        if self._msgPool:
+            self._msgPool.release(coapmsg)
+
+    def send(self, message, onSent=None):
+        '''Sends the provided message via the transport.
+
+        :param onSent: function Optional callback, with the message as its
+                                argument, after the message is sent; for example
+                                to release the message to an ObjectPool
+        '''
+        msgArray = msgModule.serialize(message)
+        if probe.serialize.enabled:
+            probe.serialize.fire(message.address, len(msgArray), msgArray)
+
+        self._sendto(msgArray, message.address)
+        if onSent:
+            onSent(message)
+
+    def sendRaw(self, msgBytes, address, onSent=None):
+        '''Sends the provided serialized message via the transport.
+
+        :param msgBytes: bytes/bytearray CoAP-formatted message
+        :param address: tuple Destination address
+        :param onSent: function Optional callback, with msgBytes as its argument,
+                                after the message is sent
+        '''
+        self._sendto(msgBytes, address)
+        if onSent:
+            onSent(msgBytes)
+
+    def _sendto(self, msgArray, address):
+        if self.transport is None:
+            log.warning('Dropping message to {0}; transport not open'.format(address))
+            return
+        # A connected transport rejects an explicit address.
+        self.transport.sendto(msgArray, None if self._remote else address)
+        self._sentCount += 1
+        if probe.send.enabled:
+            probe.send.fire(address, len(msgArray), msgArray)
+
+
+class AsyncCoapServer(CoapServer):
+    '''CoapServer that runs in an asyncio event loop. Replaces start() with the
+    open(), serve(), and close() coroutines. Accepts the same arguments as
+    CoapServer, except bufsize and zeroCopy. readBatch has no effect, since 
+    asyncio delivers one datagram at a time. rcvbuf, sndbuf, and dropStats are
+    not supported; the constructor raises ValueError if any is set. After 
+    addEndpoint(), await open() again to listen on the new endpoint.
+    '''
+    def _createSocket(self, port, **kwargs):
+        for name in ('rcvbuf', 'sndbuf', 'dropStats'):
+            if kwargs.get(name):
+                raise ValueError('AsyncCoapServer does not support {0}'.format(name))
+        return AsyncMessageSocket(port, lazyDecode=kwargs.get('lazyDecode', False),
+                                        msgPool=kwargs.get('msgPool'),
+                                        reusePort=kwargs.get('reusePort', False),
+                                        localHost=kwargs.get('localHost', ''),
+                                        scopeId=kwargs.get('scopeId', 0))
+
+    def _sockets(self):
+        '''Returns the list of AsyncMessageSocket for the server.'''
+        return getattr(self._msgSocket, 'endpoints', [self._msgSocket])
+
+    async def open(self):
+        '''Starts to listen for requests, and returns.'''
+        for msgSocket in self._sockets():
+            await msgSocket.open()
+
+    async def serve(self):
+        '''Listens for requests until closed.'''
+        await self.open()
+        for msgSocket in self._sockets():
+            await msgSocket.closed
+
+    async def close(self):
+        '''Stops listening, and waits for the sockets to close.'''
+        for msgSocket in self._sockets():
+            msgSocket.close()
+            if msgSocket.closed:
+                await msgSocket.closed
+
+    def start(self):
+        '''Not available; the asyncore loop does not drive this server.'''
+        raise RuntimeError('Use serve() from an asyncio loop')
+
+
+class AsyncCoapClient(CoapClient):
+    '''CoapClient that runs in an asyncio event loop. Replaces start() with the
+    open() coroutine, and close() is a coroutine.
+    '''
+    def _createSocket(self, sourcePort, remote):
+        return AsyncMessageSocket(localPort=sourcePort, remote=remote)
+
+    async def open(self):
+        '''Starts networking, and returns.'''
+        await self._msgSocket.open()
+
+    async def close(self):
+        '''Closes the socket, and waits for completion.'''
+        self._msgSocket.close()
+        if self._msgSocket.closed:
+            await self._msgSocket.closed
+
+    def start(self):
+        '''Not available; the asyncore loop does not drive this client.'''
+        raise RuntimeError('Use open() from an asyncio loop')
@@ -0,0 +1,153 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides support for block-wise transfer of a representation, as defined in
+RFC 7959. A block option value packs the block number, the 'more' flag, and the
+size exponent (SZX), where the block size is 2**(SZX+4) bytes.
+'''
+import logging
+import soscoap
+
+log = logging.getLogger(__name__)
+
+MAX_SZX = 6
+'''Largest size exponent; 1024 byte blocks'''
+
+DEFAULT_SZX = 5
+'''Default largest size exponent for a server reply; 512 byte blocks. A 1024 byte
+block, with the header, token, and options, does not fit in the default receive
+buffer for a MessageSocket, msgsock.SOCKET_BUFSIZE.'''
+
+def decodeBlock(value):
+    '''Splits a block option value into its fields.
+
+    :param value: int Block option value
+    :returns: tuple (num, more, szx)
+    '''
+    return (value >> 4, bool(value & 0x08), value & 0x07)
+
+def encodeBlock(num, more, szx):
+    '''Packs block option fields into an option value.
+
+    :returns: int Block option value
+    '''
+    return (num << 4) | (0x08 if more else 0) | szx
+
+def blockSize(szx):
+    '''Returns the size in bytes of a block for the provided size exponent.'''
+    return 1 << (szx + 4)
+
+def isProducer(value):
+    '''Returns True if the provided resource value is a producer -- a file-like
+    object with a read() method, or an iterator/generator of byte chunks.
+    '''
+    return (hasattr(value, 'read') or hasattr(value, '__next__')
+                                   or hasattr(value, 'next'))
+
+def _toBytes(chunk):
+    '''Encodes a Python 3 str chunk with the default string encoding.'''
+    if isinstance(chunk, str) and not isinstance(chunk, bytes):
+        return chunk.encode(soscoap.BYTESTR_ENCODING)
+    return chunk
+
+class BlockProducer(object):
+    '''Reads a representation one block at a time from a producer, so the server
+    never holds more than about two blocks of it in memory. Reads one byte past
+    the requested block to learn if more blocks follow.
+
+    Usage:
+        #. bp = BlockProducer(source) -- Create instance
+        #. data, more = bp.readBlock(size) -- Read successive blocks
+        #. bp.close() -- When done, or abandoned
+
+    Attributes:
+        :offset:   int Count of bytes already returned by readBlock()/skip()
+        :mediaType: int Content-Format for the representation, or None
+        :expires:  float Time at which an idle transfer may be discarded;
+                         maintained by the owner
+        :_source:  Producer object
+        :_read:    Reads the next chunk from _source; returns an empty chunk at
+                   the end
+        :_pending: bytearray Bytes read from _source but not yet returned
+
+    .. automethod:: soscoap.block.BlockProducer.__init__
+    '''
+    __slots__ = ('offset', 'mediaType', 'expires', '_source', '_read', '_pending')
+
+    def __init__(self, source, mediaType=None):
+        '''
+        :param source: file-like object, iterator of str/bytes chunks, or a
+                       str/bytes-like object
+        :param mediaType: int Content-Format for the representation, or None
+        '''
+        self.offset    = 0
+        self.mediaType = mediaType
+        self.expires   = 0
+        self._pending  = bytearray()
+        if hasattr(source, 'read'):
+            self._source = source
+            self._read   = self._readFile
+        elif isinstance(source, (str, bytes, bytearray)):
+            self._source = None
+            self._pending.extend(_toBytes(source))
+            self._read   = lambda size: b''
+        else:
+            self._source = iter(source)
+            self._read   = self._readIterator
+
+    def _readFile(self, size):
+        chunk = self._source.read(size)
+        return chunk if chunk else b''
+
+    def _readIterator(self, size):
+        for chunk in self._source:
+            if chunk:
+                return chunk
+        return b''
+
+    def _fill(self, size):
+        '''Reads from the source until _pending holds at least size bytes, or the
+        source is exhausted.
+        '''
+        pending = self._pending
+        while len(pending) < size:
+            chunk = self._read(size - len(pending))
+            if not chunk:
+                break
+            pending.extend(_toBytes(chunk))
+
+    def readBlock(self, size):
+        '''Reads the next block.
+
+        :param size: int Block size in bytes
+        :returns: tuple (bytearray data, bool True if more blocks follow)
+        '''
+        self._fill(size + 1)
+        data = self._pending[:size]
+        del self._pending[:size]
+        self.offset += len(data)
+        return (data, len(self._pending) > 0)
+
+    def skip(self, offset):
+        '''Discards bytes up to the provided offset, to resume a transfer for a
+        block past the start.
+
+        :returns: bool True if the offset was reached
+        '''
+        while self.offset < offset:
+            data, more = self.readBlock(min(offset - self.offset, 1024))
+            if not data:
+                return False
+        return self.offset == offset
+
+    def close(self):
+        '''Closes the source, if supported.'''
+        closer = getattr(self._source, 'close', None)
+        if closer:
+            closer()
+        self._source = None
+        self._pending = bytearray()
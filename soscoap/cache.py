@@ -0,0 +1,165 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides the ResponseCache class, to serve repeated GET requests for a resource
+from a serialized reply while it is fresh, as described in RFC 7252, Sec. 5.6.
+'''
+import logging
+import math
+import time
+from   soscoap import CodeClass
+from   soscoap import MessageType
+from   soscoap import OptionType
+from   soscoap import SuccessResponseCode
+from   soscoap.message import CoapMessage
+from   soscoap.message import CoapOption
+from   soscoap.message import MessageTemplate
+
+log = logging.getLogger(__name__)
+
+class CacheEntry(object):
+    '''Cached representation of a resource.
+
+    Attributes:
+        :expires:   float Time at which the representation is stale
+        :etag:      bytes ETag for the representation, or None
+        :payload:   bytes Representation
+        :mediaType: int Content-Format for the representation, or None
+        :maxAge:    int Max-Age in the templates; the seconds remaining when
+                        they were built
+        :content:   MessageTemplate 2.05 Content reply with the representation
+        :valid:     MessageTemplate 2.03 Valid reply without the representation
+    '''
+    __slots__ = ('expires', 'etag', 'payload', 'mediaType', 'maxAge', 'content',
+                 'valid')
+
+    def __init__(self, expires, etag, payload, mediaType):
+        self.expires   = expires
+        self.etag      = etag
+        self.payload   = payload
+        self.mediaType = mediaType
+        self.maxAge    = None
+        self.content   = None
+        self.valid     = None
+
+class ResponseCache(object):
+    '''Fresh GET replies for resources, keyed by path and query. A handler opts a
+    resource into the cache by setting its maxAge, and optionally its etag. The
+    cache rebuilds the reply templates at most once per second for an entry, so
+    the Max-Age option counts down the remaining freshness.
+
+    Usage:
+        #. cache = ResponseCache() -- Create instance
+        #. server = CoapServer(responseCache=cache) -- Server calls lookup() for
+           each GET request, store() for each reply with a Max-Age, and
+           invalidate() for each PUT or POST request
+
+    Attributes:
+        :maxEntries: int Maximum count of entries
+        :hitCount:   int Count of requests served from the cache
+        :_entries:   dict For each path, a dict of CacheEntry keyed by query
+        :_count:     int Count of entries
+
+    .. automethod:: soscoap.cache.ResponseCache.__init__
+    '''
+    def __init__(self, maxEntries=1024):
+        '''
+        :param maxEntries: int Maximum count of entries
+        '''
+        self.maxEntries = maxEntries
+        self.hitCount   = 0
+        self._entries   = {}
+        self._count     = 0
+
+    def lookup(self, path, query, now=None):
+        '''Returns the fresh entry for the provided path and query, with templates
+        current for its remaining Max-Age, or None.
+
+        :param query: str First Uri-Query value, or None
+        '''
+        entries = self._entries.get(path)
+        if not entries:
+            return None
+        entry = entries.get(query)
+        if entry is None:
+            return None
+        if now is None:
+            now = time.time()
+        if entry.expires <= now:
+            self._remove(path, query)
+            return None
+
+        maxAge = int(math.ceil(entry.expires - now))
+        if maxAge != entry.maxAge:
+            self._buildTemplates(entry, maxAge)
+        self.hitCount += 1
+        return entry
+
+    def store(self, path, query, payload, mediaType, maxAge, etag=None, now=None):
+        '''Caches a 2.05 Content representation, unless the cache is full.
+
+        :param payload: bytes-like Representation; copied
+        :param maxAge: int Seconds the representation is fresh
+        :param etag: bytes ETag for the representation, or None
+        '''
+        if now is None:
+            now = time.time()
+        entries = self._entries.get(path)
+        if not entries or query not in entries:
+            if self._count >= self.maxEntries:
+                self._purge(now)
+                if self._count >= self.maxEntries:
+                    log.debug('Response cache full; not caching {0}'.format(path))
+                    return
+            entries = self._entries.setdefault(path, {})
+            self._count += 1
+        entry = CacheEntry(now + maxAge, bytes(etag) if etag else None,
+                           bytes(payload) if payload else b'', mediaType)
+        entries[query] = entry
+        self._buildTemplates(entry, maxAge)
+
+    def invalidate(self, path):
+        '''Removes all entries for the provided path.'''
+        entries = self._entries.pop(path, None)
+        if entries:
+            self._count -= len(entries)
+
+    def _remove(self, path, query):
+        entries = self._entries[path]
+        del entries[query]
+        self._count -= 1
+        if not entries:
+            del self._entries[path]
+
+    def _purge(self, now):
+        '''Removes all stale entries.'''
+        for path, entries in list(self._entries.items()):
+            for query, entry in list(entries.items()):
+                if entry.expires <= now:
+                    self._remove(path, query)
+
+    def _buildTemplates(self, entry, maxAge):
+        '''Serializes the replies for the entry with the provided Max-Age.'''
+        entry.maxAge  = maxAge
+        entry.content = MessageTemplate(self._createReply(entry, SuccessResponseCode.Content,
+                                                          maxAge))
+        entry.valid   = MessageTemplate(self._createReply(entry, SuccessResponseCode.Valid,
+                                                          maxAge)) if entry.etag else None
+
+    def _createReply(self, entry, code, maxAge):
+        msg             = CoapMessage()
+        msg.messageType = MessageType.ACK
+        msg.codeClass   = CodeClass.Success
+        msg.codeDetail  = code
+        if entry.etag:
+            msg.addOption( CoapOption(OptionType.ETag, entry.etag) )
+        msg.addOption( CoapOption(OptionType.MaxAge, maxAge) )
+        if code == SuccessResponseCode.Content:
+            if entry.mediaType is not None:
+                msg.addOption( CoapOption(OptionType.ContentFormat, entry.mediaType) )
+            msg.payload = entry.payload
+        return msg
@@ -0,0 +1,235 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3), 
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides a compact CBOR (RFC 7049) encoder and decoder, for the CBOR and 
+SenML+CBOR content formats.
+
+Python types map to CBOR as follows. Decoding a tagged item returns the item 
+without the tag. Decoding 'undefined' returns None.
+
+    | int -- unsigned or negative integer
+    | bytes/bytearray -- byte string
+    | str -- text string
+    | list/tuple -- array
+    | dict -- map
+    | bool, None -- simple value
+    | float -- double precision float; decodes half and single precision also
+'''
+import logging
+import struct
+import sys
+
+log = logging.getLogger(__name__)
+
+if sys.version_info.major == 2:
+    _textType  = unicode
+    _bytesType = (str, bytearray)
+    _intTypes  = (int, long)
+else:
+    _textType  = str
+    _bytesType = (bytes, bytearray, memoryview)
+    _intTypes  = (int,)
+
+_BREAK = object()
+'''Marks the end of an indefinite length item'''
+
+def dumps(value):
+    '''Returns a bytearray with the CBOR encoding of the provided value.
+    
+    :raises TypeError: If value includes a type that cannot be encoded
+    '''
+    buf = bytearray()
+    _encode(value, buf)
+    return buf
+
+def loads(data):
+    '''Returns the value decoded from the provided CBOR bytes.
+    
+    :param data: bytes/bytearray/memoryview CBOR encoded data
+    :raises ValueError: If data is not well-formed CBOR
+    '''
+    buf = bytearray(data) if sys.version_info.major == 2 else memoryview(data)
+    try:
+        value, pos = _decode(buf, 0)
+    except (IndexError, struct.error):
+        raise ValueError('CBOR data too short')
+    except TypeError as e:
+        # For example, an array as a map key
+        raise ValueError('CBOR malformed item: {0}'.format(e))
+    if value is _BREAK:
+        raise ValueError('CBOR unexpected break')
+    if pos != len(buf):
+        raise ValueError('CBOR extra data after item')
+    return value
+
+def _encodeHead(major, value, buf):
+    '''Appends the initial byte and any following argument bytes for an item.'''
+    major <<= 5
+    if value < 24:
+        buf.append(major | value)
+    elif value < 0x100:
+        buf.append(major | 24)
+        buf.append(value)
+    elif value < 0x10000:
+        buf.append(major | 25)
+        buf.extend(struct.pack('>H', value))
+    elif value < 0x100000000:
+        buf.append(major | 26)
+        buf.extend(struct.pack('>I', value))
+    else:
+        buf.append(major | 27)
+        buf.extend(struct.pack('>Q', value))
+
+def _encode(value, buf):
+    if value is None:
+        buf.append(0xF6)
+    elif value is True:
+        buf.append(0xF5)
+    elif value is False:
+        buf.append(0xF4)
+    elif isinstance(value, _intTypes):
+        if value >= 0:
+            _encodeHead(0, value, buf)
+        else:
+            _encodeHead(1, -1 - value, buf)
+    elif isinstance(value, float):
+        buf.append(0xFB)
+        buf.extend(struct.pack('>d', value))
+    elif isinstance(value, _textType):
+        encoded = value.encode('utf-8')
+        _encodeHead(3, len(encoded), buf)
+        buf.extend(encoded)
+    elif isinstance(value, _bytesType):
+        _encodeHead(2, len(value), buf)
+        buf.extend(value)
+    elif isinstance(value, (list, tuple)):
+        _encodeHead(4, len(value), buf)
+        for item in value:
+            _encode(item, buf)
+    elif isinstance(value, dict):
+        _encodeHead(5, len(value), buf)
+        for key, item in value.items():
+            _encode(key, buf)
+            _encode(item, buf)
+    else:
+        raise TypeError('Cannot encode type {0} in CBOR'.format(type(value)))
+
+def _decodeArgument(info, buf, pos):
+    '''Reads the argument for an item from its additional information bits.
+    
+    :return: tuple (argument, position of next byte); argument is None for an
+                   indefinite length
+    '''
+    if info < 24:
+        return (info, pos)
+    elif info == 24:
+        return (buf[pos], pos + 1)
+    elif info == 25:
+        return (struct.unpack_from('>H', buf, pos)[0], pos + 2)
+    elif info == 26:
+        return (struct.unpack_from('>I', buf, pos)[0], pos + 4)
+    elif info == 27:
+        return (struct.unpack_from('>Q', buf, pos)[0], pos + 8)
+    elif info == 31:
+        return (None, pos)
+    else:
+        raise ValueError('CBOR reserved additional information {0}'.format(info))
+
+def _decode(buf, pos):
+    '''Decodes the item at pos.
+    
+    :return: tuple (value, position of next byte)
+    '''
+    initial = buf[pos]
+    major   = initial >> 5
+    info    = initial & 0x1F
+    if major == 7:
+        return _decodeSimple(info, buf, pos + 1)
+        
+    arg, pos = _decodeArgument(info, buf, pos + 1)
+    if arg is None and (major < 2 or major == 6):
+        raise ValueError('CBOR indefinite length for major type {0}'.format(major))
+    if major == 0:
+        return (arg, pos)
+    elif major == 1:
+        return (-1 - arg, pos)
+    elif major == 2 or major == 3:
+        if arg is None:
+            chunks = []
+            while True:
+                chunk, pos = _decode(buf, pos)
+                if chunk is _BREAK:
+                    break
+                chunks.append(chunk)
+            value = b''.join(bytes(c) for c in chunks) if major == 2 else u''.join(chunks)
+        else:
+            if pos + arg > len(buf):
+                raise ValueError('CBOR data too short')
+            value = bytes(buf[pos : pos+arg])
+            pos  += arg
+            if major == 3:
+                value = value.decode('utf-8')
+        return (value, pos)
+    elif major == 4:
+        items = []
+        while arg is None or len(items) < arg:
+            item, pos = _decode(buf, pos)
+            if item is _BREAK:
+                if arg is None:
+                    break
+                raise ValueError('CBOR unexpected break')
+            items.append(item)
+        return (items, pos)
+    elif major == 5:
+        items = {}
+        count = 0
+        while arg is None or count < arg:
+            key, pos = _decode(buf, pos)
+            if key is _BREAK:
+                if arg is None:
+                    break
+                raise ValueError('CBOR unexpected break')
+            items[key], pos = _decode(buf, pos)
+            count += 1
+        return (items, pos)
+    else:    # major == 6; ignore tag
+        return _decode(buf, pos)
+
+def _decodeSimple(info, buf, pos):
+    '''Decodes a simple value or float.'''
+    if info == 20:
+        return (False, pos)
+    elif info == 21:
+        return (True, pos)
+    elif info == 22 or info == 23:
+        return (None, pos)
+    elif info == 25:
+        return (_halfToFloat(struct.unpack_from('>H', buf, pos)[0]), pos + 2)
+    elif info == 26:
+        return (struct.unpack_from('>f', buf, pos)[0], pos + 4)
+    elif info == 27:
+        return (struct.unpack_from('>d', buf, pos)[0], pos + 8)
+    elif info == 31:
+        return (_BREAK, pos)
+    elif info < 24:
+        return (info, pos)
+    elif info == 24:
+        return (buf[pos], pos + 1)
+    else:
+        raise ValueError('CBOR reserved simple value {0}'.format(info))
+
+def _halfToFloat(half):
+    '''Converts an IEEE 754 half precision value, per Appendix D of the spec.'''
+    exp  = (half >> 10) & 0x1F
+    mant = half & 0x3FF
+    if exp == 0:
+        value = mant * 2.0**-24
+    elif exp != 31:
+        value = (mant + 1024) * 2.0**(exp - 25)
+    else:
+        value = float('inf') if mant == 0 else float('nan')
+    return -value if half & 0x8000 else value
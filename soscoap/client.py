@@ -8,7 +8,11 @@
 Provides an SOS CoapClient, the main SOS interface for a client-based CoAP 
 application.
 '''
-import asyncore
+# asyncore was removed in Python 3.12; use soscoap.aio there.
+try:
+    import asyncore
+except ImportError:
+    asyncore = None
 import logging
 import random
 import socket
@@ -70,7 +74,7 @@ class CoapClient(object):
         if msgSocket:
             self._msgSocket = msgSocket
         else:
-            self._msgSocket = MessageSocket(localPort=sourcePort, remote=destTuple)
+            self._msgSocket = self._createSocket(sourcePort, destTuple)
 
         self._msgSocket.registerForReceive(self._handleMessage)
 
@@ -79,6 +83,14 @@ class CoapClient(object):
         # A random start is recommended in Sec. 4.4.
         self._nextMessageId = random.randint(0, 0xFFFF)
 
+    def _createSocket(self, sourcePort, remote):
+        '''Creates the MessageSocket for the client. Allows a subclass to use 
+        another transport.
+        
+        :param remote: tuple AF_INET6 address for the destination, or None
+        '''
+        return MessageSocket(localPort=sourcePort, remote=remote)
+
     def close(self):
         '''Releases system resources'''
         self._msgSocket.close()
@@ -0,0 +1,148 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3), 
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides a registry of codecs for message payloads, keyed by Content-Format 
+:const:`soscoap.MediaType` value. Includes codecs for text, JSON, CBOR, and 
+SenML in JSON and CBOR.
+
+A SenML payload decodes to a list of resolved records, per Section 4.6 of 
+RFC 8428. Each record is a dict keyed by the JSON labels, like 'n' and 'v', with
+any base values applied. Encoding accepts a list of records in the same form.
+
+Usage::
+
+    from soscoap import content
+    content.register(MediaType.Xml, content.ContentCodec(myDecode, myEncode))
+'''
+import json
+import logging
+import sys
+import soscoap as coap
+from   soscoap import cbor
+
+log = logging.getLogger(__name__)
+
+class ContentCodec(object):
+    '''Decodes and encodes a message payload for a Content-Format.
+    
+    Attributes:
+        :decode: function Accepts bytes/bytearray/memoryview payload and returns
+                          the application value
+        :encode: function Accepts the application value and returns the payload
+                          bytes
+    '''
+    __slots__ = ('decode', 'encode')
+    
+    def __init__(self, decode, encode):
+        self.decode = decode
+        self.encode = encode
+
+codecs = {}
+'''ContentCodec for each supported Content-Format, keyed by MediaType value'''
+
+def register(mediaType, codec):
+    '''Adds or replaces the codec for a Content-Format.
+    
+    :param mediaType: int :const:`soscoap.MediaType` value
+    :param codec: ContentCodec
+    '''
+    codecs[mediaType] = codec
+    
+def decode(mediaType, payload):
+    '''Returns the application value for the provided payload.
+    
+    :raises NotImplementedError: If no codec for mediaType
+    '''
+    try:
+        codec = codecs[mediaType]
+    except KeyError:
+        raise NotImplementedError('MediaType {0} not implemented'.format(mediaType))
+    return codec.decode(payload)
+    
+def encode(mediaType, value):
+    '''Returns the payload bytes for the provided application value.
+    
+    :raises NotImplementedError: If no codec for mediaType
+    '''
+    try:
+        codec = codecs[mediaType]
+    except KeyError:
+        raise NotImplementedError('MediaType {0} not implemented'.format(mediaType))
+    return codec.encode(value)
+
+#
+# Codec functions
+#
+
+def _decodeText(payload):
+    return str(payload) if sys.version_info.major == 2 \
+      else str(payload, encoding=coap.BYTESTR_ENCODING)
+      
+def _encodeText(value):
+    return bytearray(value, coap.BYTESTR_ENCODING)
+
+def _decodeJson(payload):
+    return json.loads(_decodeText(payload))
+    
+def _encodeJson(value):
+    return _encodeText(json.dumps(value, separators=(',',':')))
+
+_SENML_LABELS = {'bver': -1, 'bn': -2, 'bt': -3, 'bu': -4, 'bv': -5, 'bs': -6,
+                 'n': 0, 'u': 1, 'v': 2, 'vs': 3, 'vb': 4, 's': 5, 't': 6, 'ut': 7,
+                 'vd': 8}
+'''SenML CBOR integer label for each JSON label, per Section 6 of RFC 8428'''
+
+_SENML_NAMES = dict((num, name) for (name, num) in _SENML_LABELS.items())
+
+_SENML_BASE = ('bn', 'bt', 'bu', 'bv', 'bs', 'bver')
+'''SenML base field labels, per Section 4.1 of RFC 8428'''
+
+def _resolveSenml(records):
+    '''Returns resolved records from the provided SenML pack, with base values
+    applied to each record and removed. Keeps any other label, including an
+    integer label for an unknown SenML CBOR field.'''
+    resolved = []
+    base     = {}
+    for record in records:
+        for key in _SENML_BASE:
+            if key in record:
+                base[key] = record[key]
+        entry = dict((k,v) for (k,v) in record.items() if k not in _SENML_BASE)
+        if 'bn' in base:
+            entry['n'] = base['bn'] + entry.get('n', '')
+        if 'bt' in base:
+            entry['t'] = base['bt'] + entry.get('t', 0)
+        if 'bu' in base and 'u' not in entry:
+            entry['u'] = base['bu']
+        if 'bv' in base and 'v' in entry:
+            entry['v'] = base['bv'] + entry['v']
+        if 'bs' in base and 's' in entry:
+            entry['s'] = base['bs'] + entry['s']
+        resolved.append(entry)
+    return resolved
+
+def _decodeSenmlJson(payload):
+    return _resolveSenml(_decodeJson(payload))
+    
+def _decodeSenmlCbor(payload):
+    records = [dict((_SENML_NAMES.get(k, k), v) for (k,v) in record.items())
+               for record in cbor.loads(payload)]
+    return _resolveSenml(records)
+    
+def _encodeSenmlCbor(records):
+    return cbor.dumps([dict((_SENML_LABELS.get(k, k), v) for (k,v) in record.items())
+                       for record in records])
+
+register(coap.MediaType.TextPlain,   ContentCodec(_decodeText, _encodeText))
+register(coap.MediaType.LinkFormat,  ContentCodec(_decodeText, _encodeText))
+register(coap.MediaType.Xml,         ContentCodec(_decodeText, _encodeText))
+register(coap.MediaType.OctetStream, ContentCodec(lambda payload: payload, 
+                                                  lambda value: value))
+register(coap.MediaType.Json,        ContentCodec(_decodeJson, _encodeJson))
+register(coap.MediaType.Cbor,        ContentCodec(cbor.loads, cbor.dumps))
+register(coap.MediaType.SenmlJson,   ContentCodec(_decodeSenmlJson, _encodeJson))
+register(coap.MediaType.SenmlCbor,   ContentCodec(_decodeSenmlCbor, _encodeSenmlCbor))
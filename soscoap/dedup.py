@@ -0,0 +1,141 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides the DuplicateCache class, to detect a retransmitted confirmable request
+and repeat its reply, as described in RFC 7252, Sec. 4.5.
+'''
+import array
+import logging
+import socket
+import struct
+import time
+import soscoap
+
+log = logging.getLogger(__name__)
+
+_PENDING = b''
+'''Reply for a request still in progress'''
+
+_PORT_MID = struct.Struct('!HH')
+'''Peer port and message ID, packed in an entry key'''
+
+def _packKey(address, messageId):
+    '''Returns the bytes key for a peer address and message ID -- the 16 byte
+    IPv6 host, or the encoded host text if not a plain IPv6 address, followed by
+    the port and message ID.'''
+    host = address[0]
+    try:
+        host = socket.inet_pton(socket.AF_INET6, host)
+    except (socket.error, ValueError):
+        host = host.encode('utf-8')
+    return host + _PORT_MID.pack(address[1], messageId)
+
+class DuplicateCache(object):
+    '''Bounded cache of the serialized reply for each recent confirmable request,
+    keyed by peer address and message ID. Entries expire after a lifetime, by
+    default EXCHANGE_LIFETIME. The oldest entry is evicted past a maximum count.
+
+    Stores the reply bytes in a dict, keyed by a packed bytes key for the peer
+    and message ID. The lifetime is the same for all entries, so arrival order is
+    also expiry order; ring buffers of the keys and their expiry times, in
+    arrival order, find the entries to expire or evict. An entry takes about
+    120 bytes, plus the reply bytes, so 100k entries take about 12 MB.
+
+    Usage:
+        #. cache = DuplicateCache() -- Create instance
+        #. server = CoapServer(dedup=cache) -- Server calls check() for each
+           confirmable request, and store() for its reply
+
+    Attributes:
+        :maxEntries:     int Maximum count of entries
+        :lifetime:       float Seconds an entry is retained
+        :duplicateCount: int Count of duplicates detected
+        :_replies:  dict Reply bytes keyed by packed (host, port, message ID);
+                         empty while the request is in progress
+        :_keys:     list Ring buffer of entry keys, in arrival order
+        :_expiries: array Ring buffer of entry expiry times, as doubles, parallel
+                          to _keys
+        :_head:     int Position of the oldest entry in the ring buffers
+        :_count:    int Count of entries in the ring buffers
+
+    .. automethod:: soscoap.dedup.DuplicateCache.__init__
+    '''
+    def __init__(self, maxEntries=100000, lifetime=soscoap.EXCHANGE_LIFETIME):
+        '''
+        :param maxEntries: int Maximum count of entries
+        :param lifetime: float Seconds an entry is retained
+        '''
+        self.maxEntries     = maxEntries
+        self.lifetime       = lifetime
+        self.duplicateCount = 0
+        self._replies       = {}
+        self._keys          = []
+        self._expiries      = array.array('d')
+        self._head          = 0
+        self._count         = 0
+
+    def check(self, address, messageId, now=None):
+        '''Looks up a request. Records a new request as in progress.
+
+        :param address: tuple Peer address
+        :param messageId: int Request message ID
+        :param now: float Current time.time()
+        :returns: None for a new request; otherwise the bytes of the reply, or
+                  empty bytes if the request is still in progress
+        '''
+        if now is None:
+            now = time.time()
+        self._purge(now)
+
+        key   = _packKey(address, messageId)
+        reply = self._replies.get(key)
+        if reply is not None:
+            self.duplicateCount += 1
+            return reply
+
+        if self._count >= self.maxEntries:
+            self._removeOldest()
+        self._replies[key] = _PENDING
+        self._append(now + self.lifetime, key)
+        return None
+
+    def store(self, address, messageId, msgBytes):
+        '''Records the reply for a request, if still cached.
+
+        :param msgBytes: bytes Serialized reply
+        '''
+        key = _packKey(address, messageId)
+        if key in self._replies:
+            self._replies[key] = bytes(msgBytes)
+
+    def _append(self, expiry, key):
+        '''Adds an entry at the end of the ring buffers. The buffers grow until
+        they hold maxEntries, and then wrap.'''
+        keys = self._keys
+        if len(keys) < self.maxEntries:
+            keys.append(key)
+            self._expiries.append(expiry)
+        else:
+            pos                 = (self._head + self._count) % self.maxEntries
+            keys[pos]           = key
+            self._expiries[pos] = expiry
+        self._count += 1
+
+    def _removeOldest(self):
+        '''Removes the oldest entry.'''
+        head = self._head
+        del self._replies[self._keys[head]]
+        self._keys[head] = None
+        # Wraps only when the buffers are full.
+        self._head   = (head + 1) % self.maxEntries
+        self._count -= 1
+
+    def _purge(self, now):
+        '''Removes expired entries.'''
+        expiries = self._expiries
+        while self._count and expiries[self._head] <= now:
+            self._removeOldest()
@@ -0,0 +1,159 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides the EndpointManager class, to serve CoAP on several sockets from one
+event loop.
+'''
+import logging
+
+log = logging.getLogger(__name__)
+
+class EndpointManager(object):
+    '''Group of message sockets -- endpoints -- bound to different ports,
+    interfaces, or link-local scopes, all read by one event loop. Provides the
+    same contract as msgsock.MessageSocket, so a CoapServer or CoapClient uses it
+    in place of a single socket.
+
+    Each endpoint sets itself as the 'endpoint' attribute of a message it receives.
+    The manager sends a message via its 'endpoint' attribute when set, so a reply
+    goes out on the socket the request arrived on, and otherwise via the first
+    endpoint.
+
+    Usage:
+        #. manager = EndpointManager(MessageSocket, lazyDecode=True) -- Create
+           instance with the factory and common arguments for an endpoint
+        #. manager.addEndpoint(5683) -- Add endpoints
+        #. Register event handlers as for MessageSocket; they apply to all
+           endpoints, including those added later
+
+    Attributes:
+        :endpoints:       list Message sockets, in the order added
+        :_createSocket:   function Creates a message socket; accepts a local
+                                   port and keyword arguments
+        :_socketArgs:     dict Keyword arguments for each endpoint
+        :_registrations:  list (method name, handler) for each registration,
+                               replayed on each endpoint
+        :_callFromThread: boolean True if enableCallFromThread() was called
+
+    .. automethod:: soscoap.endpoint.EndpointManager.__init__
+    '''
+    def __init__(self, createSocket, **socketArgs):
+        '''
+        :param createSocket: function Creates a message socket, like the
+                                      MessageSocket constructor
+        :param socketArgs: Keyword arguments for each endpoint, like lazyDecode
+        '''
+        self.endpoints       = []
+        self._createSocket   = createSocket
+        self._socketArgs     = socketArgs
+        self._registrations  = []
+        self._callFromThread = False
+
+    def addEndpoint(self, port, host='', scopeId=0, **socketArgs):
+        '''Creates and adds an endpoint.
+
+        :param port: int Local port; 0 for an ephemeral port
+        :param host: str Local IPv6 address; '' for any interface
+        :param scopeId: int Interface index for a link-local host
+        :param socketArgs: Keyword arguments for this endpoint, which override
+                           the common arguments
+        :returns: The new message socket
+        '''
+        args = dict(self._socketArgs)
+        args.update(socketArgs)
+        if host or scopeId:
+            args['localHost'] = host
+            args['scopeId']   = scopeId
+        endpoint = self._createSocket(port, **args)
+
+        for methodName, handler in self._registrations:
+            self._registerOn(endpoint, methodName, handler)
+        self.endpoints.append(endpoint)
+        log.info('Added endpoint [{0}]:{1}'.format(host, port))
+        return endpoint
+
+    def registerForReceive(self, handler):
+        self._register('registerForReceive', handler)
+
+    def registerForReceiveBatch(self, handler):
+        self._register('registerForReceiveBatch', handler)
+
+    def registerForQueueLevel(self, handler):
+        '''Registers for the QueueLevel event of each endpoint. Unlike for a 
+        MessageSocket, the handler is triggered with (isHigh, depth, endpoint),
+        so it may pause reading from only the endpoint with the high queue.'''
+        self._register('registerForQueueLevel', handler)
+
+    def _register(self, methodName, handler):
+        self._registrations.append((methodName, handler))
+        for endpoint in self.endpoints:
+            self._registerOn(endpoint, methodName, handler)
+
+    def _registerOn(self, endpoint, methodName, handler):
+        if methodName == 'registerForQueueLevel':
+            handler = self._bindEndpoint(handler, endpoint)
+        getattr(endpoint, methodName)(handler)
+
+    def _bindEndpoint(self, handler, endpoint):
+        '''Returns a QueueLevel handler that adds the endpoint to the arguments.'''
+        return lambda isHigh, depth: handler(isHigh, depth, endpoint)
+
+    def send(self, message, onSent=None):
+        '''Sends the provided message via its endpoint, or the first endpoint.'''
+        (message.endpoint or self.endpoints[0]).send(message, onSent)
+
+    def sendRaw(self, msgBytes, address, onSent=None):
+        '''Sends the provided serialized message via the first endpoint.'''
+        self.endpoints[0].sendRaw(msgBytes, address, onSent)
+
+    def pauseReading(self):
+        '''Stops reading from all endpoints.'''
+        for endpoint in self.endpoints:
+            endpoint.pauseReading()
+
+    def resumeReading(self):
+        for endpoint in self.endpoints:
+            endpoint.resumeReading()
+
+    def enableCallFromThread(self):
+        '''Prepares the first endpoint for callFromThread(). All endpoints share
+        the loop, so one is enough.'''
+        if not self._callFromThread:
+            self.endpoints[0].enableCallFromThread()
+            self._callFromThread = True
+
+    def callFromThread(self, func, *args):
+        self.endpoints[0].callFromThread(func, *args)
+
+    def queueDepth(self):
+        '''Returns the sum of the queueDepth() for all endpoints -- a count of 
+        messages for MessageSocket, or bytes for AsyncMessageSocket.'''
+        return sum(endpoint.queueDepth() for endpoint in self.endpoints)
+
+    def stats(self):
+        '''Returns a dict of the MessageSocket.stats() counters, summed across
+        endpoints, and the count of 'endpoints'. A counter is None if not
+        available for any endpoint.
+        '''
+        totals = {}
+        for endpoint in self.endpoints:
+            for key, value in endpoint.stats().items():
+                if value is None:
+                    totals.setdefault(key, None)
+                else:
+                    totals[key] = (totals.get(key) or 0) + value
+        totals['endpoints'] = len(self.endpoints)
+        return totals
+
+    def getsockname(self):
+        '''Returns the bound local address of the first endpoint.'''
+        return self.endpoints[0].getsockname()
+
+    def close(self):
+        '''Closes all endpoints.'''
+        for endpoint in self.endpoints:
+            endpoint.close()
@@ -29,6 +29,9 @@ class EventHook(object):
     def clear(self):
         del self.__handlers[:]
 
+    def __len__(self):
+        return len(self.__handlers)
+
     def trigger(self, *args, **kwargs):
         for h in self.__handlers:
             h(*args, **kwargs)
@@ -0,0 +1,325 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides an in-memory transport, to connect CoapServer and CoapClient instances
+in one process without sockets, for testing and benchmarking. Delivery runs on a
+virtual clock, so a run with the same seed is repeatable and never sleeps.
+
+Usage:
+    #. net = LoopbackNetwork(latency=0.01, loss=0.05, seed=1) -- Create instance
+    #. server = CoapServer(net.socket(5683)) -- Create endpoints
+    #. client = CoapClient(net.socket(5684))
+    #. Send messages, with the address of the destination endpoint
+    #. net.run() -- Deliver messages until none remain in flight
+'''
+import collections
+import heapq
+import logging
+import random
+import soscoap.event as event
+import soscoap.message as msgModule
+import soscoap.probe as probe
+
+log = logging.getLogger(__name__)
+
+LOOPBACK_HOST = '::1'
+'''Host for the address of a loopback endpoint'''
+
+class LoopbackNetwork(object):
+    '''Delivers datagrams among LoopbackSocket endpoints through bounded in-memory
+    queues, with optional latency, loss, and reordering. A datagram sent to an
+    address without an endpoint is dropped.
+
+    Attributes:
+        :latency:     float Virtual seconds from send to delivery
+        :loss:        float Probability [0.0, 1.0] a datagram is dropped in flight
+        :reorder:     float Probability [0.0, 1.0] a datagram is delayed by
+                            reorderDelay, so later datagrams overtake it
+        :reorderDelay: float Additional virtual seconds for a reordered datagram
+        :queueSize:   int Maximum count of datagrams in flight to an endpoint;
+                          the network drops a datagram past it
+        :now:         float Current virtual time in seconds
+        :_random:     Random Source for loss and reordering
+        :_inFlight:   list Heap of (delivery time, sequence, destination address,
+                           source address, bytes) for datagrams in flight
+        :_sequence:   int Orders datagrams with the same delivery time
+        :_calls:      deque (func, args) scheduled by callFromThread()
+        :_endpoints:  dict LoopbackSocket, keyed by address
+
+    .. automethod:: soscoap.loopback.LoopbackNetwork.__init__
+    '''
+    def __init__(self, latency=0.0, loss=0.0, reorder=0.0, reorderDelay=None,
+                       queueSize=1024, seed=None):
+        '''
+        :param latency: float Virtual seconds from send to delivery
+        :param loss: float Probability a datagram is dropped
+        :param reorder: float Probability a datagram is delayed, so others
+                              overtake it
+        :param reorderDelay: float Delay for a reordered datagram; defaults to
+                                   twice latency, or 1 ms with no latency
+        :param queueSize: int Maximum count of datagrams in flight to an endpoint
+        :param seed: Seed for the random source, for a repeatable run
+        '''
+        self.latency      = latency
+        self.loss         = loss
+        self.reorder      = reorder
+        self.reorderDelay = reorderDelay if reorderDelay is not None \
+                                         else (2 * latency if latency else 0.001)
+        self.queueSize    = queueSize
+        self.now          = 0.0
+        self._random      = random.Random(seed)
+        self._inFlight    = []
+        self._sequence    = 0
+        self._calls       = collections.deque()
+        self._endpoints   = {}
+
+    def socket(self, port, lazyDecode=False, msgPool=None):
+        '''Creates an endpoint with the provided port.
+
+        :param port: int Port for the endpoint; 0 for the next unused port
+        :param lazyDecode: boolean Decode received message options on demand
+        :param msgPool: ObjectPool Optional source for received messages
+        :returns: LoopbackSocket
+        '''
+        if not port:
+            port = 49152
+            while self.address(port) in self._endpoints:
+                port += 1
+        return LoopbackSocket(self, self.address(port), lazyDecode, msgPool)
+
+    def address(self, port):
+        '''Returns the AF_INET6 style address for an endpoint port.'''
+        return (LOOPBACK_HOST, port, 0, 0)
+
+    def _attach(self, endpoint):
+        if endpoint.address in self._endpoints:
+            raise ValueError('Address in use: {0}'.format(endpoint.address))
+        self._endpoints[endpoint.address] = endpoint
+
+    def _detach(self, endpoint):
+        self._endpoints.pop(endpoint.address, None)
+
+    def _transmit(self, data, source, dest):
+        '''Puts a datagram in flight, unless lost or the destination queue is full.
+
+        :returns: boolean True if in flight
+        '''
+        if self.loss and self._random.random() < self.loss:
+            log.debug('Lost datagram to {0}'.format(dest))
+            return False
+        endpoint = self._endpoints.get(dest)
+        if endpoint is None:
+            log.debug('No endpoint for datagram to {0}'.format(dest))
+            return False
+        if endpoint._queued >= self.queueSize:
+            endpoint._dropCount += 1
+            return False
+
+        delay = self.latency
+        if self.reorder and self._random.random() < self.reorder:
+            delay += self.reorderDelay
+        self._sequence += 1
+        heapq.heappush(self._inFlight, (self.now + delay, self._sequence, dest,
+                                        source, bytes(data)))
+        endpoint._queued += 1
+        return True
+
+    def callFromThread(self, func, *args):
+        '''Schedules the provided function with arguments to run on the next
+        step(). Safe to call from any thread.'''
+        self._calls.append((func, args))
+
+    def pending(self):
+        '''Returns the count of datagrams in flight.'''
+        return len(self._inFlight)
+
+    def step(self):
+        '''Runs scheduled calls, and then advances the clock to the next delivery
+        time, and delivers all datagrams due then.
+
+        :returns: int Count of datagrams delivered
+        '''
+        calls = self._calls
+        while calls:
+            func, args = calls.popleft()
+            func(*args)
+
+        inFlight = self._inFlight
+        if not inFlight:
+            return 0
+        self.now = inFlight[0][0]
+        count    = 0
+        while inFlight and inFlight[0][0] <= self.now:
+            deliverAt, seq, dest, source, data = heapq.heappop(inFlight)
+            endpoint = self._endpoints.get(dest)
+            if endpoint:
+                endpoint._queued -= 1
+                endpoint._deliver(data, source)
+                count += 1
+        return count
+
+    def run(self, maxSteps=None):
+        '''Runs step() until no datagrams remain in flight, or for maxSteps.
+
+        :returns: int Count of datagrams delivered
+        '''
+        count = 0
+        steps = 0
+        while (self._inFlight or self._calls) and (maxSteps is None or steps < maxSteps):
+            count += self.step()
+            steps += 1
+        return count
+
+
+class LoopbackSocket(object):
+    '''Endpoint on a LoopbackNetwork. Provides the same contract as
+    msgsock.MessageSocket.
+
+    Events:
+        Register a handler for an event via the 'registerFor<Event>' method.
+
+        :Receive: Triggered with the received CoAP message
+        :ReceiveBatch: Triggered with a list of the received CoAP message,
+                       before Receive. The list has a single entry.
+        :QueueLevel: Never triggered; the network drops a datagram past its
+                     queue size instead
+
+    Attributes:
+        :address:    tuple Local address
+        :lazyDecode: boolean If True, received messages decode options on demand
+        :readPaused: boolean If True, holds received datagrams until resumeReading()
+        :_network:   LoopbackNetwork for the endpoint
+        :_msgPool:   ObjectPool Optional source for received messages
+        :_held:      deque (bytes, address) received while reading paused
+        :_queued:    int Count of datagrams in flight to the endpoint
+        :_receiveHook: EventHook Triggered when message received
+        :_receiveBatchHook: EventHook Triggered when message received, as a list
+        :_queueLevelHook:   EventHook Never triggered
+        :_receivedCount:    int Count of datagrams received
+        :_sentCount:        int Count of datagrams sent
+        :_dropCount:        int Count of datagrams to the endpoint dropped for a
+                                full queue
+
+    .. automethod:: soscoap.loopback.LoopbackSocket.__init__
+    '''
+    def __init__(self, network, address, lazyDecode=False, msgPool=None):
+        '''Use LoopbackNetwork.socket() to create an instance.'''
+        self.address        = address
+        self.lazyDecode     = lazyDecode
+        self.readPaused     = False
+        self._network       = network
+        self._msgPool       = msgPool
+        self._held          = collections.deque()
+        self._queued        = 0
+        self._receiveHook   = event.EventHook()
+        self._receiveBatchHook = event.EventHook()
+        self._queueLevelHook   = event.EventHook()
+        self._receivedCount = 0
+        self._sentCount     = 0
+        self._dropCount     = 0
+        network._attach(self)
+
+    def registerForReceive(self, handler):
+        self._receiveHook.register(handler)
+
+    def registerForReceiveBatch(self, handler):
+        self._receiveBatchHook.register(handler)
+
+    def registerForQueueLevel(self, handler):
+        self._queueLevelHook.register(handler)
+
+    def getsockname(self):
+        return self.address
+
+    def close(self):
+        '''Detaches from the network; datagrams in flight to it are dropped.'''
+        self._network._detach(self)
+
+    def pauseReading(self):
+        self.readPaused = True
+
+    def resumeReading(self):
+        self.readPaused = False
+        while self._held and not self.readPaused:
+            data, address = self._held.popleft()
+            self._deliver(data, address)
+
+    def enableCallFromThread(self):
+        '''No preparation required for callFromThread().'''
+        pass
+
+    def callFromThread(self, func, *args):
+        self._network.callFromThread(func, *args)
+
+    def queueDepth(self):
+        '''Returns 0; a send is immediately in flight.'''
+        return 0
+
+    def stats(self):
+        '''Returns a dict of counters, like MessageSocket.stats(). kernelDrops
+        counts datagrams dropped for a full queue to this endpoint.'''
+        return {'received':    self._receivedCount,
+                'sent':        self._sentCount,
+                'kernelDrops': self._dropCount,
+                'sendQueue':   0}
+
+    def send(self, message, onSent=None):
+        '''Sends the provided message to its address.
+
+        :param onSent: function Optional callback, with the message as its
+                                argument, after the message is sent
+        '''
+        msgBytes = msgModule.serialize(message)
+        if probe.serialize.enabled:
+            probe.serialize.fire(message.address, len(msgBytes), msgBytes)
+        self._sendto(msgBytes, message.address)
+        if onSent:
+            onSent(message)
+
+    def sendRaw(self, msgBytes, address, onSent=None):
+        '''Sends the provided serialized message.
+
+        :param onSent: function Optional callback, with msgBytes as its argument,
+                                after the message is sent
+        '''
+        self._sendto(msgBytes, address)
+        if onSent:
+            onSent(msgBytes)
+
+    def _sendto(self, msgBytes, address):
+        self._sentCount += 1
+        if probe.send.enabled:
+            probe.send.fire(address, len(msgBytes), msgBytes)
+        self._network._transmit(msgBytes, self.address, tuple(address))
+
+    def _deliver(self, data, address):
+        '''Builds a message from a datagram, and triggers the receive events.'''
+        if self.readPaused:
+            self._held.append((data, address))
+            return
+        self._receivedCount += 1
+        if probe.receive.enabled:
+            probe.receive.fire(address, len(data), data)
+
+        try:
+            if self._msgPool:
+                coapmsg = msgModule.buildFrom(bytestr=data, lazy=self.lazyDecode,
+                                              message=self._msgPool.acquire(address))
+            else:
+                coapmsg = msgModule.buildFrom(address=address, bytestr=data,
+                                              lazy=self.lazyDecode)
+        except Exception:
+            log.exception('Error reading message from {0}'.format(address))
+            return
+        coapmsg.endpoint = self
+        if probe.decode.enabled:
+            probe.decode.fire(address, len(data), coapmsg)
+
+        self._receiveBatchHook.trigger([coapmsg])
+        self._receiveHook.trigger(coapmsg)
+        if self._msgPool:
+            self._msgPool.release(coapmsg)
@@ -6,16 +6,64 @@
 # http://opensource.org/licenses/LGPL-3.0
 '''
 Provides CoapMessage and CoapOption classes. Provides functions to build a message 
-from a raw byte array, and to serialize the message back out bytes.
+from a raw byte array, and to serialize the message back out bytes. Also provides
+the MessageTemplate class for a pre-serialized message, and the buildBatch() 
+function to decode many messages into a columnar MessageBatch.
 '''
+import array
 import functools
 import json
 import logging
 import soscoap as coap
+from   soscoap import content
+import struct
 import sys
 import numbers
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 log = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('!BBH')
+'''Fixed header bytes -- Ver/T/TKL byte, Code byte, Message ID'''
+
+if sys.version_info.major == 2:
+    # Python2 memoryview indexing yields 1-char str rather than int, so we must 
+    # copy to a bytearray to read ordinals.
+    def _asBuffer(bytestr):
+        return bytearray(bytestr)
+
+    def buf2int(buf):
+        '''Returns the integer for the provided big endian buffer.'''
+        return functools.reduce(lambda sum, elem: (sum << 8) + elem, buf, 0)
+
+    def _decodeString(buf):
+        return str(buf)
+
+    def _stringBytes(value):
+        return bytearray(value, coap.BYTESTR_ENCODING)
+
+    def _uintBytes(value, length):
+        return bytearray(int2buf(value, length))
+else:
+    def _asBuffer(bytestr):
+        return memoryview(bytestr)
+
+    def buf2int(buf):
+        '''Returns the integer for the provided big endian buffer.'''
+        return int.from_bytes(buf, 'big')
+
+    def _decodeString(buf):
+        return str(buf, coap.BYTESTR_ENCODING)
+
+    def _stringBytes(value):
+        return value.encode(coap.BYTESTR_ENCODING)
+
+    def _uintBytes(value, length):
+        return value.to_bytes(length, 'big')
     
 def int2buf(intVal, length):
     '''
@@ -35,6 +83,9 @@ def int2buf(intVal, length):
         pos      = pos - 1
     return buf
 
+_UNSET = object()
+'''Marks a memoized value not yet computed'''
+
 class CoapOption(object):
     '''A CoAP message option.
     
@@ -44,7 +95,9 @@ class CoapOption(object):
                 message; or the value to write into a network message. Stored 
                 as a plain str if the type stores a string; otherwise stored as 
                 bytes/bytearray.
+       :length: int Length of the value in a network message
     '''
+    __slots__ = ('type', 'value', 'length')
     
     def __init__(self, optionType, value=None):
         self.type   = optionType
@@ -98,19 +151,43 @@ class CoapMessage(object):
                          :const:`soscoap.ClientResponseCode`,
                          :const:`soscoap.ServerResponseCode`
        :messageId:   int Message ID
-       :token:       bytes/bytearray Token bytes, or None
+       :token:       bytes/bytearray/memoryview Token bytes, or None
        :options:     list CoapOption objects for this message; ordered by increasing
                           option number
-       :payload:     bytes/bytearray Payload contents, or None
+       :payload:     bytes/bytearray/memoryview Payload contents, or None
+       :endpoint:    MessageSocket on which the message was received, and on 
+                     which to send a reply; None for the default socket
+       :unknownCritical: int Number of the first critical (odd-numbered) option
+                     read that is not in :const:`soscoap.OptionType`, or None.
+                     RFC 7252, Sec. 5.4.1, requires rejection of the message.
+       :_rawOptions: list For a lazily built message, one entry per option -- either
+                          a (number, start, end) tuple locating the option value
+                          in _optionSrc, or the CoapOption once decoded. None
+                          after all options are decoded.
+       :_optionSrc:  Source buffer for _rawOptions values
+       :_index:      dict Lists of decoded options, keyed by option number; built
+                          on first use, and None until then
+       :_path:       Memoized absolutePath() value, or _UNSET
+       :_query:      Memoized firstQuery() value, or _UNSET
+       :_format:     Memoized contentFormat() value, or _UNSET
+       :_typed:      Memoized typedPayload() value, or _UNSET
+       :_typedSrc:   Payload object from which _typed was decoded
+       
+    Modify the options only via addOption(), or by assigning the options 
+    attribute. Otherwise the index and memoized values are not updated.
        
     Supported Option types:
-       :UriPath:
-       :ContentFormat:
+       All types in :const:`soscoap.OptionType`. An option number not in the enum
+       is read with an opaque value, and if critical, recorded in unknownCritical.
     
     .. [1] http://datatracker.ietf.org/doc/rfc7252/
 
     .. automethod:: soscoap.message.CoapMessage.__init__
     '''
+    __slots__ = ('address', 'version', 'messageType', 'tokenLength', 'codeClass', 
+                 'codeDetail', 'messageId', 'token', '_options', 'payload', 
+                 'endpoint', 'unknownCritical', '_rawOptions', '_optionSrc', '_index', '_path', '_query', '_format',
+                 '_typed', '_typedSrc')
     
     def __init__(self, address=None):
         '''Minimally initializes a message.'''
@@ -124,6 +201,67 @@ class CoapMessage(object):
         self.token       = None
         self.options     = []
         self.payload     = None
+        self.endpoint    = None
+        self.unknownCritical = None
+        
+    @property
+    def options(self):
+        '''list CoapOption objects for this message; decodes any options not yet
+        decoded in a lazily built message.'''
+        if self._rawOptions is not None:
+            self._options    = [self._decodeRawOption(i) for i in range(len(self._rawOptions))]
+            self._rawOptions = None
+            self._optionSrc  = None
+        return self._options
+        
+    @options.setter
+    def options(self, options):
+        self._options    = options
+        self._rawOptions = None
+        self._optionSrc  = None
+        self._index      = None
+        self._invalidate()
+        
+    def _invalidate(self):
+        '''Resets the memoized values derived from the options.'''
+        self._path   = _UNSET
+        self._query  = _UNSET
+        self._format = _UNSET
+        self._typed  = _UNSET
+        
+    def _decodeRawOption(self, index):
+        '''Returns the CoapOption for the entry at the provided index in 
+        _rawOptions, decoding and caching it if necessary. Used for a lazily
+        built message.
+        '''
+        entry = self._rawOptions[index]
+        if isinstance(entry, CoapOption):
+            return entry
+        optnum, start, end     = entry
+        option                 = _buildOption(optnum, self._optionSrc[start:end])
+        self._rawOptions[index] = option
+        return option
+            
+    def retain(self):
+        '''Copies the token, option values, and payload that are views over the 
+        source buffer for the message, so the message remains valid after the 
+        buffer is reused or modified. See buildFrom().
+        '''
+        if isinstance(self.token, memoryview):
+            self.token = bytes(self.token)
+        if isinstance(self.payload, memoryview):
+            self.payload = bytes(self.payload)
+            
+        if self._rawOptions is not None:
+            self._optionSrc = bytes(self._optionSrc)
+            options = [entry for entry in self._rawOptions if isinstance(entry, CoapOption)]
+        else:
+            options = self._options
+        for option in options:
+            if isinstance(option.value, memoryview):
+                option.value = bytes(option.value)
+        # typedPayload() may be a view
+        self._typed = _UNSET
             
     def __str__(self):
         return 'CoapMessage( t:{0} p:{1})'.format(
@@ -134,8 +272,28 @@ class CoapMessage(object):
         '''Returns the full string path for the resource transferred in this message,
         or None if not present.
         '''
-        relative = '/'.join([opt.value for opt in self.options if opt.isPathElement()])
-        return '/' + relative if relative else None
+        if self._path is _UNSET:
+            relative   = '/'.join([opt.value for opt in self.findOption(coap.OptionType.UriPath)])
+            self._path = '/' + relative if relative else None
+        return self._path
+        
+    def firstQuery(self):
+        '''Returns the str value of the first Uri-Query option, or None if not 
+        present.
+        '''
+        if self._query is _UNSET:
+            queryList   = self.findOption(coap.OptionType.UriQuery)
+            self._query = queryList[0].value if queryList else None
+        return self._query
+        
+    def contentFormat(self):
+        '''Returns the int value of the Content-Format option, or None if not 
+        present.
+        '''
+        if self._format is _UNSET:
+            cfList       = self.findOption(coap.OptionType.ContentFormat)
+            self._format = cfList[0].value if cfList else None
+        return self._format
         
     def payloadStr(self, text):
         '''Sets the payload from the provided string, using the default string 
@@ -154,23 +312,29 @@ class CoapMessage(object):
           
     def typedPayload(self):
         '''Returns the payload interpreted per the Content-Format option, or the 
-        raw payload if no such option.
+        raw payload if no such option. Decodes with the codec registered in 
+        :mod:`soscoap.content`, and memoizes the result until the payload or 
+        options change.
+        
+        :raises NotImplementedError: If no codec for the Content-Format
         '''
-        cf = self.findOption(coap.OptionType.ContentFormat)
-        if cf:
-            if cf[0].value == coap.MediaType.TextPlain:
-                return self.strPayload()
-            elif cf[0].value == coap.MediaType.OctetStream:
-                return self.payload
-            elif cf[0].value == coap.MediaType.Json:
-                return self.jsonPayload()
+        payload = self.payload
+        if self._typed is _UNSET or self._typedSrc is not payload:
+            cf = self.contentFormat()
+            if cf is None or payload is None:
+                self._typed = payload
             else:
-                raise NotImplementedError('MediaType {0} not implemented'.format(cf.value))
-        else:
-            return self.payload
+                self._typed = content.decode(cf, payload)
+            self._typedSrc = payload
+        return self._typed
         
     def lastOptionNumber(self):
         '''Returns the number of the last option in the options list.'''
+        if self._rawOptions is not None:
+            if not self._rawOptions:
+                return 0
+            last = self._rawOptions[-1]
+            return last.type.number if isinstance(last, CoapOption) else last[0]
         return self.options[-1].type.number if len(self.options) else 0
         
     def findOption(self, optionType):
@@ -179,61 +343,197 @@ class CoapMessage(object):
         
         :param optionType: soscoap.OptionType
         '''
-        return [o for o in self.options if o.type == optionType]
+        if self._rawOptions is not None:
+            # Only decode the options of interest.
+            optnum = optionType.number
+            return [self._decodeRawOption(i) for (i,entry) in enumerate(self._rawOptions)
+                    if (entry.type.number if isinstance(entry, CoapOption) else entry[0])
+                        == optnum]
+        if self._index is None:
+            index = {}
+            for o in self._options:
+                try:
+                    index[o.type.number].append(o)
+                except KeyError:
+                    index[o.type.number] = [o]
+            self._index = index
+        return list(self._index.get(optionType.number, ()))
         
     def addOption(self, option):
         '''Adds an option to this message.
         
         :param option: soscoap.CoapOption the option to add
         '''
-        # must insert in ascending option type order
-        for (i,o) in enumerate(self.options):
-            if o.type.number > option.type.number:
-                self.options.insert(i, option)
-                break;
+        options = self.options
+        number  = option.type.number
+        # must insert in ascending option type order, after any options with 
+        # the same number
+        if not options or options[-1].type.number <= number:
+            options.append(option)
         else:
-            self.options.append(option)
+            lo, hi = 0, len(options)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if options[mid].type.number > number:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            options.insert(lo, option)
+            
+        if self._index is not None:
+            try:
+                self._index[number].append(option)
+            except KeyError:
+                self._index[number] = [option]
+        self._invalidate()
+
+class MessageTemplate(object):
+    '''Pre-serialized message, for repeated sends of the same content. Serializes
+    the code, options and payload once. Each rendering then only writes the 
+    message type, message ID, and token.
+    
+    Attributes:
+       :_verBits: int Version bits for the first header byte
+       :_code:    int Code header byte
+       :_tail:    bytes Serialized options and payload
+       
+    .. automethod:: soscoap.message.MessageTemplate.__init__
+    '''
+    __slots__ = ('_verBits', '_code', '_tail')
+    
+    def __init__(self, msg):
+        '''Serializes the provided message. Ignores its message type, message ID 
+        and token.
+        '''
+        msgBytes      = serialize(msg)
+        self._verBits = msgBytes[0] & 0xC0
+        self._code    = msgBytes[1]
+        self._tail    = bytes(msgBytes[4 + msg.tokenLength:])
+        
+    def render(self, messageType, messageId, token=None):
+        '''Returns a bytearray for the message with the provided attributes.
+        
+        :param messageType: int :const:`soscoap.MessageType` enum value
+        :param messageId:   int Message ID
+        :param token:       bytes/bytearray/memoryview Token bytes, or None
+        '''
+        tkl      = len(token) if token else 0
+        msgBytes = bytearray(4 + tkl + len(self._tail))
+        _HEADER.pack_into(msgBytes, 0, self._verBits | (messageType & 0x3) << 4 | tkl,
+                                       self._code, messageId & 0xFFFF)
+        if tkl:
+            msgBytes[4 : 4+tkl] = token
+        msgBytes[4+tkl:] = self._tail
+        return msgBytes
+        
+#
+# Option codecs
+#
+
+class OptionCodec(object):
+    '''Encodes and decodes the value for an option, based on its value format.
+    
+    Attributes:
+        :format: str Value format, as for OptionType.valueFormat
+        :decode: function Accepts the raw value bytes and returns the application
+                          value
+        :encode: function Accepts a CoapOption and returns the raw value bytes
+    '''
+    def __init__(self, format, decode, encode):
+        self.format = format
+        self.decode = decode
+        self.encode = encode
+
+def _encodeString(option):
+    return bytearray(option.value, coap.BYTESTR_ENCODING)
+
+def _encodeUint(option):
+    return bytearray(int2buf(option.value, option.length))
+
+_formatCodecs = {
+    'empty':  OptionCodec('empty',  lambda buf: None, lambda option: b''),
+    'opaque': OptionCodec('opaque', lambda buf: buf,  lambda option: option.value),
+    'string': OptionCodec('string', _decodeString,    _encodeString),
+    'uint':   OptionCodec('uint',   buf2int,          _encodeUint),
+}
+'''OptionCodec for each option value format'''
+
+_optionCodecs = dict((number, (optionType, _formatCodecs[optionType.valueFormat]))
+                     for (number, optionType) in coap.OptionType._reverse.items())
+'''(OptionType, OptionCodec) tuple for each known option, keyed by option number'''
+
+MAX_OPTION_NUMBER = 0xFFFF
+'''Largest option number, per Sec. 12.2 of the spec'''
+
+def _lookupOption(number):
+    '''Returns the (OptionType, OptionCodec) tuple for an option number. For a
+    number not in the OptionType enum, returns a temporary OptionType with an 
+    opaque value; does not register it, so a peer cannot grow _optionCodecs.
+    '''
+    entry = _optionCodecs.get(number)
+    if entry is None:
+        optionType = type(coap.OptionType.IfMatch)(number, 'Unknown', True, 'opaque',
+                                                   (0,65535), None)
+        entry = (optionType, _formatCodecs['opaque'])
+        log.debug('Option number {0} not in OptionType enum'.format(number))
+    return entry
 
 #
 # Build functions
 #
 
-def buildFrom(bytestr, address=None):
+def buildFrom(bytestr, address=None, lazy=False, message=None):
     '''Creates a CoapMessage from a raw byte source.
     
-    :param bytestr: str Bytes comprising the message
+    On Python3, the token, opaque option values, and payload for the message are 
+    memoryview slices over bytestr rather than copies, so bytestr must not be 
+    modified while the message is in use. Use CoapMessage.retain() to copy them.
+    
+    :param bytestr: bytes/bytearray/memoryview Bytes comprising the message
     :param addr:    4-tuple IPv6 address (adress, port, ?, ?)
+    :param lazy:    boolean If True, only scans the options to record their 
+                    location. Each CoapOption is decoded on first access via 
+                    findOption(), absolutePath(), or the options attribute.
+    :param message: CoapMessage Newly initialized message to populate, for 
+                    example from an ObjectPool; if None, creates a message
     '''
     tooShortText = 'source byte string too short'
     if len(bytestr) < 4:
         raise RuntimeError(tooShortText)
         
-    msg     = CoapMessage(address)
-    # Ensure we have a string of ordinals (Python3 bytes) for consistency
-    msgords = bytearray(bytestr) if sys.version_info.major == 2 else bytestr
+    msg     = message if message else CoapMessage(address)
+    # Ensure we have a buffer of ordinals for consistency
+    msgords = _asBuffer(bytestr)
+    msglen  = len(msgords)
     _readFixedBytes(msg, msgords)
-    log.debug('Building message for ID {0}'.format(msg.messageId))
     pos = 4
     
     # Read token
     if msg.tokenLength:
-        if len(msgords) < pos + msg.tokenLength:
+        end = pos + msg.tokenLength
+        if msglen < end:
             raise RuntimeError(tooShortText)
         # TODO Test for excessive token length
-        msg.token = msgords[pos : pos+msg.tokenLength]
-        pos      += msg.tokenLength
+        msg.token = msgords[pos : end]
+        pos       = end
     else:
         msg.token = None
         
+    if lazy:
+        msg._rawOptions = []
+        msg._optionSrc  = msgords
+        
     # Read options and payload
-    while pos < len(msgords):
+    while pos < msglen:
         if msgords[pos] == 0xFF:
             pos += 1
-            if pos < len(msgords):
-                msg.payload = msgords[pos : len(msgords)]
-                pos         = len(msgords)
+            if pos < msglen:
+                msg.payload = msgords[pos : msglen]
+                pos         = msglen
             else:
                 raise NotImplementedError('Must generate a message format error')
+        elif lazy:
+            pos = _scanOption(msg, msgords, pos)
         else:
             pos = _readOption(msg, msgords, pos)
             
@@ -249,7 +549,7 @@ def serialize(msg):
     nextByte   |=  msg.tokenLength & 0xF
     msgBytes[0] = nextByte
     
-    nextByte    = (msg.codeClass  & 0x0E) << 5
+    nextByte    = (msg.codeClass  & 0x07) << 5
     nextByte   |=  msg.codeDetail & 0x1F
     msgBytes[1] = nextByte
     
@@ -261,22 +561,15 @@ def serialize(msg):
     
     lastOptnum = 0   # supports encoding delta between option numbers
     for option in msg.options:
-        delta = option.type.number - lastOptnum
-        if (delta > 12):
-            raise NotImplementedError('Option delta greater than 12')
-        
-        headerByte  = (delta & 0xF) << 4
-        headerByte |= option.length
-        msgBytes.append(headerByte)
-        lastOptnum  = option.type.number
-        log.debug('option.value type is {0}'.format(type(option.value)))
+        number = option.type.number
+        msgBytes.extend(_optionHeader(number - lastOptnum, option.length))
+        lastOptnum  = number
         if option.length > 0:
-            if option.type.valueFormat == 'string':
-                msgBytes.extend(bytearray(option.value, coap.BYTESTR_ENCODING))
-            elif option.type.valueFormat == 'uint':
-                msgBytes.extend(bytearray(int2buf(option.value, option.length)))
-            else:
-                raise NotImplementedError('Value format {0}'.format(option.type.valueFormat))
+            try:
+                codec = _optionCodecs[number][1]
+            except KeyError:
+                codec = _formatCodecs[option.type.valueFormat]
+            msgBytes.extend(codec.encode(option))
     
     if msg.payload:
         msgBytes.append(0xFF)
@@ -284,17 +577,199 @@ def serialize(msg):
     
     return msgBytes
 
+def serializedSize(msg):
+    '''Returns the length of the CoAP-formatted bytes for the provided message.
+    '''
+    size       = 4 + msg.tokenLength
+    lastOptnum = 0
+    for option in msg.options:
+        number     = option.type.number
+        length     = option.length
+        size      += 1 + length
+        if number - lastOptnum > 12:
+            size  += _extendedSize(number - lastOptnum)
+        if length > 12:
+            size  += _extendedSize(length)
+        lastOptnum = number
+        
+    if msg.payload:
+        size += 1 + len(msg.payload)
+    return size
+
+def serializeInto(msg, buffer, offset=0):
+    '''Writes the CoAP-formatted bytes for the provided message into a buffer
+    supplied by the caller, in a single pass. Does not size the message first, so
+    the caller grows the buffer only when a write does not fit.
+    
+    :param buffer: bytearray Target for message bytes
+    :param offset: int Position in buffer for the first message byte
+    :return: int Count of bytes written
+    :raises IndexError: If the message does not fit in the buffer
+    '''
+    limit = len(buffer)
+    tkl   = msg.tokenLength
+    pos   = offset + 4 + tkl
+    if pos > limit:
+        raise _shortBuffer(buffer, offset)
+    
+    _HEADER.pack_into(buffer, offset,
+                      (msg.version & 0x3) << 6 | (msg.messageType & 0x3) << 4 
+                                               | tkl & 0xF,
+                      (msg.codeClass & 0x07) << 5 | msg.codeDetail & 0x1F,
+                      msg.messageId & 0xFFFF)
+    # A memoryview slice write is faster than a bytearray slice write, and fails
+    # rather than resize the buffer. An index write past the end raises
+    # IndexError, but check the end of a slice write to raise the same.
+    view = memoryview(buffer)
+    if tkl:
+        view[pos-tkl : pos] = msg.token
+    
+    lastOptnum = 0
+    for option in msg.options:
+        number     = option.type.number
+        length     = option.length
+        delta      = number - lastOptnum
+        if delta < 13 and length < 13:
+            buffer[pos] = (delta << 4) | length
+            pos        += 1
+        else:
+            buffer[pos] = (_nibble(delta) << 4) | _nibble(length)
+            pos         = _writeExtendedInto(delta, buffer, pos + 1)
+            pos         = _writeExtendedInto(length, buffer, pos)
+        lastOptnum = number
+        if length > 0:
+            end = pos + length
+            if end > limit:
+                raise _shortBuffer(buffer, offset)
+            valueFormat = option.type.valueFormat
+            if valueFormat == 'uint':
+                view[pos : end] = _uintBytes(option.value, length)
+            elif valueFormat == 'string':
+                view[pos : end] = _stringBytes(option.value)
+            else:
+                view[pos : end] = option.value
+            pos = end
+    
+    if msg.payload:
+        end = pos + 1 + len(msg.payload)
+        if end > limit:
+            raise _shortBuffer(buffer, offset)
+        view[pos]         = 0xFF
+        view[pos+1 : end] = msg.payload
+        pos = end
+    
+    return pos - offset
+
+def _shortBuffer(buffer, offset):
+    return IndexError('buffer too short ({0}) for message'.format(len(buffer) - offset))
+
+def _extendedSize(value):
+    '''Returns the count of extended bytes for an option delta or length value'''
+    return 0 if value < 13 else (1 if value < 269 else 2)
+
+def _nibble(value):
+    '''Returns the option header nibble for an option delta or length value'''
+    return value if value < 13 else (13 if value < 269 else 14)
+
+def _writeExtendedInto(value, buffer, pos):
+    '''Writes any extended bytes required for an option delta or length value 
+    into buffer at pos.
+    
+    :return: int Position of the next byte after the extended bytes
+    '''
+    if value < 13:
+        return pos
+    elif value < 269:
+        buffer[pos] = value - 13
+        return pos + 1
+    elif value < 65805:
+        value        -= 269
+        buffer[pos]   = value >> 8
+        buffer[pos+1] = value & 0xFF
+        return pos + 2
+    else:
+        raise ValueError('Option delta or length too large: {0}'.format(value))
+
+def _optionHeader(delta, length):
+    '''Returns a bytearray for the header of an option, including any extended 
+    delta and length bytes, per Section 3.1 of the spec.
+    '''
+    header = bytearray(1)
+    dnibble = _writeExtended(delta, header)
+    lnibble = _writeExtended(length, header)
+    header[0] = (dnibble << 4) | lnibble
+    return header
+
+def _writeExtended(value, header):
+    '''Appends any extended bytes required for an option delta or length value 
+    to the provided header.
+    
+    :return: int Nibble value for the option header byte
+    '''
+    if value < 13:
+        return value
+    elif value < 269:
+        header.append(value - 13)
+        return 13
+    elif value < 65805:
+        value -= 269
+        header.append(value >> 8)
+        header.append(value & 0xFF)
+        return 14
+    else:
+        raise ValueError('Option delta or length too large: {0}'.format(value))
+
 def _readFixedBytes(msg, ords):
     '''Sets the CoapMessage attributes from the first four network bytes as ordinals.
     Used to initially build the message.
     '''
-    msg.version     = (ords[0] & 0xC0) >> 6
-    msg.messageType = (ords[0] & 0x30) >> 4
-    msg.tokenLength = (ords[0] & 0x0F)
-    msg.codeClass   = (ords[1] & 0xE0) >> 5
-    msg.codeDetail  = (ords[1] & 0x1F)
-    msg.messageId   = (ords[2] << 8) + ords[3]
+    first, code, msg.messageId = _HEADER.unpack_from(ords)
+    msg.version     = first >> 6
+    msg.messageType = (first & 0x30) >> 4
+    msg.tokenLength = (first & 0x0F)
+    msg.codeClass   = code >> 5
+    msg.codeDetail  = (code & 0x1F)
+    
+def _readOptionHeader(msg, ords, pos):
+    '''Reads the header for the next option from the network bytes as ordinals,
+    including any extended delta and length bytes.
+    
+    :param pos: int Position of next byte in ords
+    :return:    tuple (option number, position of value, value length)
+    '''
+    first   = ords[pos]
+    delta, bytepos = _readExtended(first >> 4, ords, pos + 1)
+    optlen, bytepos = _readExtended(first & 0x0F, ords, bytepos)
+    if bytepos + optlen > len(ords):
+        raise RuntimeError('source byte string too short')
+    optnum  = msg.lastOptionNumber() + delta
+    if optnum > MAX_OPTION_NUMBER:
+        raise RuntimeError('Message format error: option number {0} too large'.format(
+                                                                            optnum))
+    if optnum & 1 and msg.unknownCritical is None and optnum not in _optionCodecs:
+        msg.unknownCritical = optnum
+    return (optnum, bytepos, optlen)
+
+def _readExtended(nibble, ords, pos):
+    '''Reads an option delta or length value from its 4-bit nibble in the option 
+    header byte, and any extended bytes that follow, per Section 3.1 of the spec.
     
+    :param pos: int Position of next byte after the bytes already read
+    :return:    tuple (value, position of next byte)
+    '''
+    if nibble < 13:
+        return (nibble, pos)
+    elif nibble == 13:
+        if pos >= len(ords):
+            raise RuntimeError('source byte string too short')
+        return (ords[pos] + 13, pos + 1)
+    elif nibble == 14:
+        if pos + 1 >= len(ords):
+            raise RuntimeError('source byte string too short')
+        return ((ords[pos] << 8) + ords[pos+1] + 269, pos + 2)
+    else:
+        raise RuntimeError('Message format error: Option nibble 15 but not payload marker')
+
 def _readOption(msg, ords, pos):
     '''Reads the next option from the network bytes as ordinals, and appends it 
     to the options for the provided CoapMessage. Used to initially build the message.
@@ -303,68 +778,245 @@ def _readOption(msg, ords, pos):
     :return:    int Position of next byte after this option; may be past the end
                     of bytestr
     '''
-    delta = (ords[pos] & 0xF0) >> 4
-    if (delta > 12):
-        if (delta == 15):   # 0xF
-            raise NotImplementedError(
-                        'Message format error: Delta 15 but not payload marker')
-        else:
-            raise NotImplementedError('Option delta of 13 or 14')
-    optlen  = ords[pos] & 0x0F
-    optnum  = msg.lastOptionNumber() + delta
-    bytepos = pos + 1 
-    optval  = ords[bytepos : bytepos+optlen]
+    optnum, bytepos, optlen = _readOptionHeader(msg, ords, pos)
+    option = _buildOption(optnum, ords[bytepos : bytepos+optlen])
     
-    optionType = coap.OptionType._reverse[optnum]
+    # OK to violate encapsulation because we're building the message privately.
+    msg.options.append(option)
+    
+    return bytepos + optlen
+    
+def _scanOption(msg, ords, pos):
+    '''Reads the location of the next option from the network bytes as ordinals,
+    and appends it to the raw options for the provided CoapMessage. Does not 
+    decode the option value. Used to initially build a lazy message.
+    
+    :param pos: int Position of next byte in ords
+    :return:    int Position of next byte after this option; may be past the end
+                    of bytestr
+    '''
+    optnum, bytepos, optlen = _readOptionHeader(msg, ords, pos)
+    end = bytepos + optlen
+    msg._rawOptions.append((optnum, bytepos, end))
+    return end
+    
+def _buildOption(optnum, optval):
+    '''Creates a CoapOption from the number and raw value for an option.
+    
+    :param optval: bytes/bytearray/memoryview Raw option value
+    :return:       CoapOption
+    '''
+    optionType, codec = _lookupOption(optnum)
     
     option        = CoapOption(optionType)
-    option.length = optlen
+    option.length = len(optval)
+    option.value  = codec.decode(optval)
+    return option
+
+#
+# Batch functions
+#
+
+class MessageBatch(object):
+    '''Columnar representation of many messages read by buildBatch(). Each 
+    attribute below except buffer is an array with one element per message. The
+    arrays are NumPy arrays if NumPy is used, otherwise array.array.
     
-    if (optionType == coap.OptionType.UriPath or optionType == coap.OptionType.UriHost
-        or optionType == coap.OptionType.UriQuery):
-        if optionType.valueFormat == 'string':
-            option.value = _readOptionValue(optval, optionType.valueFormat)
-        else:
-            raise NotImplementedError('Option value must be string')
-                
-    elif optionType == coap.OptionType.ContentFormat:
-        if optionType.valueFormat == 'uint':
-            option.value = _readOptionValue(optval, optionType.valueFormat)
-            try:
-                coap.MediaType._reverse[option.value]
-            except KeyError:
-                log.warn('Content-Format undefined: {0}'.format(option.value))
-        else:
-            raise NotImplementedError('Option value must be uint')
-                
-    elif optionType == coap.OptionType.MaxAge:
-        # TODO: Must add code to enforce this request
-        if optionType.valueFormat == 'uint':
-            option.value = _readOptionValue(optval, optionType.valueFormat)
-        else:
-            raise NotImplementedError('Option value must be uint')
-                
-    elif optionType == coap.OptionType.Observe:
-        if optionType.valueFormat == 'uint':
-            option.value = _readOptionValue(optval, optionType.valueFormat)
-        else:
-            raise NotImplementedError('Option value must be uint')
+    Offset attributes are positions in buffer; a length of zero means the 
+    element is not present in the message.
+    
+    Attributes:
+       :buffer:        bytes/bytearray Concatenated message bytes
+       :offsets:       Start position of each message in buffer, plus a final 
+                       element for the end of the last message
+       :valid:         1 if the message was read successfully, or 0 for a format
+                       error; the other attributes may be incomplete if 0
+       :version:       CoAP version
+       :messageType:   :const:`soscoap.MessageType` enum value
+       :tokenLength:   TKL value; the token starts at offset + 4
+       :codeClass:     :const:`soscoap.CodeClass` enum value
+       :codeDetail:    Detail part of message code
+       :messageId:     Message ID
+       :pathOffset:    Position of the header for the first Uri-Path option
+       :pathLength:    Length from pathOffset through the last Uri-Path value
+       :contentFormat: Content-Format option value, or -1 if not present
+       :payloadOffset: Position of the payload, after the marker
+       :payloadLength: Length of the payload
+    '''
+    def __init__(self, buffer, offsets):
+        self.buffer  = buffer
+        self.offsets = offsets
+        
+    def __len__(self):
+        return len(self.offsets) - 1
         
+    def path(self, index):
+        '''Returns the full string path for the message at the provided index, or
+        None if not present.'''
+        pos = int(self.pathOffset[index])
+        end = pos + int(self.pathLength[index])
+        buf = _asBuffer(self.buffer)
+        segments = []
+        while pos < end:
+            first  = buf[pos]
+            pos    = _readExtended(first >> 4, buf, pos + 1)[1]
+            optlen, pos = _readExtended(first & 0x0F, buf, pos)
+            segments.append(_decodeString(buf[pos : pos+optlen]))
+            pos   += optlen
+        return '/' + '/'.join(segments) if segments else None
+        
+    def payload(self, index):
+        '''Returns the payload bytes for the message at the provided index, or 
+        None if not present.'''
+        length = int(self.payloadLength[index])
+        if not length:
+            return None
+        pos = int(self.payloadOffset[index])
+        return _asBuffer(self.buffer)[pos : pos+length]
+
+_URI_PATH       = coap.OptionType.UriPath.number
+_CONTENT_FORMAT = coap.OptionType.ContentFormat.number
+
+def buildBatch(source, offsets=None, useNumpy=None):
+    '''Reads many messages into a columnar MessageBatch, without creating a 
+    CoapMessage for each. With NumPy, reads the fixed header fields with 
+    vectorized operations. Options are scanned only to locate the Uri-Path, 
+    Content-Format, and payload.
+    
+    A message with a format error does not stop the read; see MessageBatch.valid.
+    
+    :param source:   Sequence of bytes for each message; or if offsets is 
+                     provided, bytes/bytearray with the concatenated messages
+    :param offsets:  Sequence of int start position for each message in source, 
+                     plus a final element for the end of the last message
+    :param useNumpy: boolean True to use NumPy arrays, False to use array.array;
+                     if None, uses NumPy if available
+    :return: MessageBatch
+    '''
+    if offsets is None:
+        offsets = array.array('l', [0])
+        for datagram in source:
+            offsets.append(offsets[-1] + len(datagram))
+        source  = b''.join([bytes(datagram) for datagram in source])
     else:
-        raise NotImplementedError('Option number {0} not implemented'.format(optnum))
+        offsets = array.array('l', offsets)
+    if useNumpy is None:
+        useNumpy = numpy is not None
+        
+    batch = MessageBatch(source, offsets)
+    count = len(batch)
+    if useNumpy:
+        _readBatchHeaders(batch, numpy.frombuffer(source, dtype=numpy.uint8),
+                                 numpy.frombuffer(offsets, dtype=offsets.typecode))
+    else:
+        _readBatchHeadersLoop(batch, source, offsets, count)
+        
+    # Scan options for each message
+    buf         = _asBuffer(source)
+    pathOffset  = array.array('l', [0]) * count
+    pathLength  = array.array('l', [0]) * count
+    contentFmt  = array.array('l', [-1]) * count
+    payOffset   = array.array('l', [0]) * count
+    payLength   = array.array('l', [0]) * count
+    valid       = batch.valid
+    tokenLength = batch.tokenLength
+    for i in range(count):
+        if not valid[i]:
+            continue
+        try:
+            _scanBatchOptions(buf, offsets[i] + 4 + int(tokenLength[i]), offsets[i+1],
+                              i, pathOffset, pathLength, contentFmt, payOffset, payLength)
+        except (RuntimeError, IndexError):
+            valid[i] = 0
+            
+    if useNumpy:
+        batch.pathOffset    = numpy.array(pathOffset, dtype=numpy.int64)
+        batch.pathLength    = numpy.array(pathLength, dtype=numpy.int64)
+        batch.contentFormat = numpy.array(contentFmt, dtype=numpy.int64)
+        batch.payloadOffset = numpy.array(payOffset, dtype=numpy.int64)
+        batch.payloadLength = numpy.array(payLength, dtype=numpy.int64)
+    else:
+        batch.pathOffset    = pathOffset
+        batch.pathLength    = pathLength
+        batch.contentFormat = contentFmt
+        batch.payloadOffset = payOffset
+        batch.payloadLength = payLength
+    return batch
+
+def _readBatchHeaders(batch, buf, offsets):
+    '''Sets the MessageBatch fixed header attributes with NumPy vectorized 
+    operations.
     
-    # OK to violate encapsulation because we're building the message privately.
-    msg.options.append(option)
-    log.debug('Found option {0} at pos {1}'.format(option, pos))
+    :param buf:     numpy.ndarray uint8 message bytes
+    :param offsets: numpy.ndarray message offsets
+    '''
+    starts  = offsets[:-1]
+    lengths = offsets[1:] - starts
+    valid   = lengths >= 4
+    # Read from position 0 for a short message, to avoid an index error.
+    starts  = numpy.where(valid, starts, 0)
+    if len(buf) < 4:
+        buf = numpy.zeros(4, dtype=numpy.uint8)
     
-    return bytepos + optlen
+    first = buf[starts]
+    code  = buf[starts + 1]
+    tkl   = first & 0x0F
+    
+    batch.valid       = (valid & (lengths >= 4 + tkl)).astype(numpy.uint8)
+    batch.version     = first >> 6
+    batch.messageType = (first >> 4) & 0x03
+    batch.tokenLength = tkl
+    batch.codeClass   = code >> 5
+    batch.codeDetail  = code & 0x1F
+    batch.messageId   = (buf[starts + 2].astype(numpy.uint16) << 8) | buf[starts + 3]
+    
+def _readBatchHeadersLoop(batch, source, offsets, count):
+    '''Sets the MessageBatch fixed header attributes, one message at a time.'''
+    for name in ('valid', 'version', 'messageType', 'tokenLength', 'codeClass', 
+                 'codeDetail'):
+        setattr(batch, name, array.array('B', [0]) * count)
+    batch.messageId = array.array('H', [0]) * count
     
-def _readOptionValue(value, format):
-    if format == 'string':
-        return str(value) if sys.version_info.major == 2 \
-                           else str(value, coap.BYTESTR_ENCODING)
-    elif format == 'uint':
-        return functools.reduce(lambda sum, elem: (sum << 8) + elem, value, 0)
+    for i in range(count):
+        start = offsets[i]
+        if offsets[i+1] - start < 4:
+            continue
+        first, code, batch.messageId[i] = _HEADER.unpack_from(source, start)
+        batch.valid[i]       = 1 if offsets[i+1] - start >= 4 + (first & 0x0F) else 0
+        batch.version[i]     = first >> 6
+        batch.messageType[i] = (first & 0x30) >> 4
+        batch.tokenLength[i] = first & 0x0F
+        batch.codeClass[i]   = code >> 5
+        batch.codeDetail[i]  = code & 0x1F
         
-    else:
-        raise NotImplementedError('Option format {0} not implemented'.format(format))
+def _scanBatchOptions(buf, pos, end, i, pathOffset, pathLength, contentFmt, 
+                                        payOffset, payLength):
+    '''Scans the options for a message in a batch, and sets the option and 
+    payload columns at index i.
+    
+    :param pos: int Position of the first option
+    :param end: int Position after the end of the message
+    '''
+    optnum = 0
+    while pos < end:
+        first = buf[pos]
+        if first == 0xFF:
+            if pos + 1 >= end:
+                raise RuntimeError('Message format error: payload marker without payload')
+            payOffset[i] = pos + 1
+            payLength[i] = end - pos - 1
+            return
+        header      = pos
+        delta, pos  = _readExtended(first >> 4, buf, pos + 1)
+        optlen, pos = _readExtended(first & 0x0F, buf, pos)
+        optnum     += delta
+        if pos + optlen > end:
+            raise RuntimeError('source byte string too short')
+        
+        if optnum == _URI_PATH:
+            if not pathLength[i]:
+                pathOffset[i] = header
+            pathLength[i] = pos + optlen - pathOffset[i]
+        elif optnum == _CONTENT_FORMAT:
+            contentFmt[i] = buf2int(buf[pos : pos+optlen])
+        pos += optlen
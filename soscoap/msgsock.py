@@ -7,19 +7,53 @@
 '''
 Provides the MessageSocket class.
 '''
-import asyncore
+# asyncore was removed in Python 3.12; use soscoap.aio there.
+try:
+    import asyncore
+except ImportError:
+    asyncore = None
+import collections
+import errno
 import logging
 import soscoap.message as msgModule
 import socket
+import struct
 import soscoap
 import soscoap.event as event
-import sys
+import soscoap.probe as probe
 
 log = logging.getLogger(__name__)
 
+_Dispatcher = asyncore.dispatcher if asyncore else object
+
 SOCKET_BUFSIZE = 1024
+'''Default size for a received datagram'''
+
+MAX_BUFSIZE = 65527
+'''Largest UDP payload for IPv6 without jumbograms'''
+
+_NO_DATA = (errno.EAGAIN, errno.EWOULDBLOCK)
+'''errno values when no datagram is ready to read, or the socket cannot accept
+another to send'''
+
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+'''Linux socket option to report the count of datagrams dropped by the kernel,
+as ancillary data for a received datagram'''
+
+SO_MEMINFO = getattr(socket, 'SO_MEMINFO', 55)
+'''Linux socket option to read socket memory use, as an array of uint32. The
+first value is the size of the receive queue in bytes.'''
+
+_MEMINFO_DROPS = 8
+'''Index of the kernel drop count in the SO_MEMINFO values'''
+
+HIGH_WATER = 1024
+'''Default count of queued outgoing messages that triggers the QueueLevel event'''
+
+LOW_WATER = 256
+'''Default count of queued outgoing messages that ends a high QueueLevel'''
                 
-class MessageSocket(asyncore.dispatcher):
+class MessageSocket(_Dispatcher):
     '''Source for network CoAP messages. Implemented as a select/poll-based socket,
     based on the the built-in asyncore module. Listens on the CoAP port for any
     interface.
@@ -28,74 +62,477 @@ class MessageSocket(asyncore.dispatcher):
         Register a handler for an event via the 'registerFor<Event>' method.
         
         :Receive: Triggered with the received CoAP message
+        :ReceiveBatch: Triggered with a list of the messages received in a
+                       batch read, before Receive is triggered for each message.
+                       Only when readBatch is more than 1.
+        :QueueLevel: Triggered with (True, depth) when the count of outgoing 
+                     messages reaches highWater, and then with (False, depth)
+                     when it falls to lowWater
     
     Attributes:
-        :_outgoing: List (queue) of messages ready to send
+        :lazyDecode: boolean If True, received messages decode options on demand;
+                             see message.buildFrom()
+        :bufsize:    int Maximum size of a received datagram; a longer datagram
+                         is truncated
+        :zeroCopy:   boolean If True, receives into a reusable buffer; see 
+                             __init__()
+        :readBatch:  int Maximum count of datagrams to read per read event
+        :highWater:  int Outgoing queue depth that triggers a high QueueLevel
+        :lowWater:   int Outgoing queue depth that ends a high QueueLevel
+        :readPaused: boolean If True, does not read from the socket; see 
+                             pauseReading()
+        :_ancBufsize: int Size for ancillary data to receive the kernel drop 
+                          count, or 0 to not receive it
+        :_receivedCount:  int Count of datagrams received
+        :_sentCount:      int Count of datagrams sent
+        :_sendErrorCount: int Count of datagrams dropped on a send error
+        :_truncatedCount: int Count of datagrams truncated, or possibly truncated
+                              if not reading the drop count
+        :_kernelDrops:    int Count of datagrams dropped by the kernel for lack
+                              of receive buffer, or None if not available
+        :_msgPool:   ObjectPool Optional source for received messages. A message
+                                is released to the pool when the Receive event 
+                                handlers return.
+        :_outgoing: deque (queue) of (message, address, onSent) tuples ready to 
+                    send, where message is a CoapMessage or serialized bytes
+        :_queueHigh: boolean True after the queue reaches highWater, until it 
+                             falls to lowWater
+        :_recvBuffers: list Idle bytearray buffers for zeroCopy receive
         :_receiveHook: EventHook Triggered when message received
+        :_receiveBatchHook: EventHook Triggered when batch of messages received
+        :_queueLevelHook: EventHook Triggered when outgoing queue crosses a water
+                          mark
+        :_waker:    _Waker Runs functions from another thread on the loop; None 
+                           until enableCallFromThread()
 
     .. automethod:: soscoap.msgsock.MessageSocket.__init__
     '''
-    def __init__(self, localPort=soscoap.COAP_PORT, remote=None):
+    def __init__(self, localPort=soscoap.COAP_PORT, remote=None, lazyDecode=False,
+                       msgPool=None, bufsize=SOCKET_BUFSIZE, zeroCopy=False,
+                       readBatch=1, highWater=HIGH_WATER, lowWater=LOW_WATER,
+                       reusePort=False, rcvbuf=None, sndbuf=None, dropStats=False,
+                       localHost='', scopeId=0):
         '''Initializes socket: binds the socket to a port on this host,
         ready to read. Also, optionally connects to an address for client use.
         
+        With zeroCopy, receives each datagram into a preallocated buffer with 
+        recvfrom_into(). The token, opaque option values, and payload of the 
+        message are views over the buffer, valid only until the Receive event
+        handlers return. A handler must call CoapMessage.retain(), or copy the
+        data, to use it past that point.
+        
+        With readBatch more than 1, each read event drains up to readBatch 
+        datagrams, until none is ready, before triggering the events. Receive
+        handlers for a message in a batch return before handlers for the next
+        message run, but a message is not released to msgPool, nor its zeroCopy 
+        buffer reused, until the handlers for the whole batch return.
+        
         :param localPort: int Port for source socket
         :param remote: tuple AF_INET6 4-tuple for remote address
+        :param lazyDecode: boolean Decode received message options on demand
+        :param msgPool: ObjectPool Optional source for received messages
+        :param bufsize: int Maximum size of a received datagram, up to MAX_BUFSIZE
+        :param zeroCopy: boolean Receive into a reusable buffer
+        :param readBatch: int Maximum count of datagrams to read per read event
+        :param highWater: int Outgoing queue depth that triggers a high QueueLevel
+        :param lowWater: int Outgoing queue depth that ends a high QueueLevel
+        :param reusePort: boolean Set SO_REUSEPORT, so other processes may bind 
+                                  the same port, and the kernel balances incoming
+                                  datagrams across them
+        :param rcvbuf: int SO_RCVBUF size in bytes, or None for the system default
+        :param sndbuf: int SO_SNDBUF size in bytes, or None for the system default
+        :param dropStats: boolean Read the count of datagrams dropped by the 
+                                  kernel, with SO_RXQ_OVFL on Linux; see stats()
+        :param localHost: str Local IPv6 address to bind; '' for any interface
+        :param scopeId: int Interface index for a link-local localHost
+        :raises ValueError: If bufsize exceeds MAX_BUFSIZE
+        :raises RuntimeError: If reusePort and the platform lacks SO_REUSEPORT
         '''
         asyncore.dispatcher.__init__(self)
         
+        if bufsize > MAX_BUFSIZE:
+            raise ValueError('bufsize {0} exceeds maximum {1}'.format(bufsize,
+                                                                     MAX_BUFSIZE))
+        self.lazyDecode   = lazyDecode
+        self.bufsize      = bufsize
+        self.zeroCopy     = zeroCopy
+        self.readBatch    = readBatch
+        self._recvBuffers = []
+        self._msgPool     = msgPool
         self._receiveHook = event.EventHook()
-        self._outgoing    = []
+        self._receiveBatchHook = event.EventHook()
+        self.highWater    = highWater
+        self.lowWater     = lowWater
+        self.readPaused   = False
+        self._outgoing    = collections.deque()
+        self._queueHigh   = False
+        self._queueLevelHook = event.EventHook()
+        self._waker       = None
+        self._ancBufsize  = 0
+        self._receivedCount  = 0
+        self._sentCount      = 0
+        self._sendErrorCount = 0
+        self._truncatedCount = 0
+        self._kernelDrops    = None
 
         self.create_socket(socket.AF_INET6, socket.SOCK_DGRAM)
-        self.bind(('', localPort))
+        if reusePort:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise RuntimeError('SO_REUSEPORT not supported on this platform')
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if rcvbuf:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        if sndbuf:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+        if dropStats:
+            self._enableDropStats()
+        self.bind((localHost, localPort, 0, scopeId) if scopeId 
+                                                     else (localHost, localPort))
         if remote:
             self.connect(remote)
         
     def registerForReceive(self, handler):
         self._receiveHook.register(handler)
         
+    def registerForReceiveBatch(self, handler):
+        self._receiveBatchHook.register(handler)
+        
+    def registerForQueueLevel(self, handler):
+        self._queueLevelHook.register(handler)
+        
+    def pauseReading(self):
+        '''Stops reading from the socket, for example while the outgoing queue 
+        is high. Incoming datagrams wait in the socket receive buffer.'''
+        self.readPaused = True
+        
+    def resumeReading(self):
+        self.readPaused = False
+        
+    def getsockname(self):
+        '''Returns the bound local address.'''
+        return self.socket.getsockname()
+        
+    def queueDepth(self):
+        '''Returns the count of outgoing messages waiting to send.'''
+        return len(self._outgoing)
+        
+    def _enableDropStats(self):
+        '''Enables reading the kernel drop count via SO_RXQ_OVFL, if available.'''
+        if not hasattr(self.socket, 'recvmsg'):
+            log.warning('Kernel drop count not available; requires recvmsg()')
+            return
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        except socket.error as e:
+            log.warning('Kernel drop count not available: {0}'.format(e))
+            return
+        self._ancBufsize  = socket.CMSG_SPACE(4)
+        self._kernelDrops = 0
+        
+    def stats(self):
+        '''Returns a dict of counters and queue sizes for the socket:
+        
+        :received:  Count of datagrams received
+        :sent:      Count of datagrams sent
+        :sendErrors: Count of datagrams dropped on a send error
+        :truncated: Count of received datagrams truncated at bufsize
+        :kernelDrops: Count of datagrams dropped by the kernel since the socket
+                      was created, or None if not enabled by dropStats. Also
+                      read from SO_MEMINFO, if available, since SO_RXQ_OVFL 
+                      reports only with a received datagram.
+        :receiveQueueBytes: Size of datagrams waiting in the kernel receive queue,
+                            or None if not available
+        :sendQueue: Count of messages in the outgoing queue
+        :rcvbuf:    SO_RCVBUF size
+        :sndbuf:    SO_SNDBUF size
+        '''
+        memInfo = self._memInfo()
+        drops   = self._kernelDrops
+        if drops is not None and memInfo and len(memInfo) > _MEMINFO_DROPS:
+            drops = max(drops, memInfo[_MEMINFO_DROPS])
+            
+        return {'received':          self._receivedCount,
+                'sent':              self._sentCount,
+                'sendErrors':        self._sendErrorCount,
+                'truncated':         self._truncatedCount,
+                'kernelDrops':       drops,
+                'receiveQueueBytes': memInfo[0] if memInfo else None,
+                'sendQueue':         len(self._outgoing),
+                'rcvbuf': self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+                'sndbuf': self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)}
+                
+    def receiveQueueBytes(self):
+        '''Returns the size of datagrams waiting in the kernel receive queue, or
+        None if not available. Uses SO_MEMINFO on Linux.'''
+        memInfo = self._memInfo()
+        return memInfo[0] if memInfo else None
+        
+    def _memInfo(self):
+        '''Returns the tuple of SO_MEMINFO values, or None if not available.'''
+        try:
+            info = self.socket.getsockopt(socket.SOL_SOCKET, SO_MEMINFO, 
+                                          4 * (_MEMINFO_DROPS+1))
+        except socket.error:
+            return None
+        return struct.unpack('={0}I'.format(len(info) // 4), info)
+        
+    def enableCallFromThread(self):
+        '''Prepares for use of callFromThread(). Must be called from the loop 
+        thread, or before the loop starts.'''
+        if not self._waker:
+            self._waker = _Waker(self._map)
+            
+    def callFromThread(self, func, *args):
+        '''Runs the provided function with arguments on the loop thread, soon.
+        Safe to call from any thread, after enableCallFromThread().
+        '''
+        self._waker.call(func, args)
+        
     def handle_read(self):
-        data, addr = self.socket.recvfrom(SOCKET_BUFSIZE)
-        if log.isEnabledFor(logging.DEBUG):
-            bytestr = bytearray(data) if sys.version_info.major == 2 else data
-            hexstr  = ' '.join(['{:02x}'.format(b) for b in bytestr])
-            log.debug('Receive message from {0}; data (hex) {1}'.format(addr, hexstr))
+        if self.readBatch > 1:
+            self._readBatch()
+        elif self.zeroCopy:
+            buf = self._recvBuffers.pop() if self._recvBuffers \
+                                          else bytearray(self.bufsize)
+            try:
+                self._readMessage(*self._recv(buf))
+            finally:
+                self._recvBuffers.append(buf)
         else:
-            log.info('Receive message from {0}'.format(addr))
-          
-        coapmsg = msgModule.buildFrom(address=addr, bytestr=data)
+            self._readMessage(*self._recv())
+            
+    def _recv(self, buf=None):
+        '''Receives a datagram into the provided buffer, or a new bytes object.
+        Also reads the kernel drop count if enabled.
+        
+        :returns: tuple (datagram, source address); the datagram is a memoryview
+                  over buf if provided
+        '''
+        if self._ancBufsize:
+            if buf is None:
+                data, ancdata, flags, addr = self.socket.recvmsg(self.bufsize,
+                                                                 self._ancBufsize)
+            else:
+                nbytes, ancdata, flags, addr = self.socket.recvmsg_into([buf],
+                                                                 self._ancBufsize)
+                data = memoryview(buf)[:nbytes]
+            # Present only after the first drop
+            for level, kind, value in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                    self._kernelDrops = struct.unpack('=I', value[:4])[0]
+            if flags & socket.MSG_TRUNC:
+                self._truncatedCount += 1
+                log.warning('Datagram from {0} truncated at {1} bytes'.format(
+                                                                addr, self.bufsize))
+        else:
+            if buf is None:
+                data, addr = self.socket.recvfrom(self.bufsize)
+            else:
+                nbytes, addr = self.socket.recvfrom_into(buf)
+                data = memoryview(buf)[:nbytes]
+            if len(data) == self.bufsize:
+                self._truncatedCount += 1
+                log.warning('Datagram from {0} may be truncated at {1} bytes'.format(
+                                                                addr, self.bufsize))
+        self._receivedCount += 1
+        return (data, addr)
+        
+    def _readBatch(self):
+        '''Reads up to readBatch datagrams, and triggers the ReceiveBatch and 
+        Receive events for the messages. Skips a datagram that fails to decode.
+        '''
+        messages = []
+        buffers  = []
+        try:
+            for i in range(self.readBatch):
+                try:
+                    if self.zeroCopy:
+                        buf = self._recvBuffers.pop() if self._recvBuffers \
+                                                      else bytearray(self.bufsize)
+                        buffers.append(buf)
+                        data, addr = self._recv(buf)
+                    else:
+                        data, addr = self._recv()
+                except socket.error as e:
+                    if e.errno in _NO_DATA:
+                        break
+                    if not messages:
+                        raise
+                    log.warning('Ending batch read on socket error: {0}'.format(e))
+                    break
+                    
+                try:
+                    messages.append(self._buildMessage(data, addr))
+                except Exception:
+                    log.exception('Error reading message from {0}'.format(addr))
+                    
+            if messages:
+                self._receiveBatchHook.trigger(messages)
+                for coapmsg in messages:
+                    self._receiveHook.trigger(coapmsg)
+        finally:
+            if self._msgPool:
+                for coapmsg in messages:
+                    self._msgPool.release(coapmsg)
+            self._recvBuffers.extend(buffers)
+        
+    def _readMessage(self, data, addr):
+        '''Builds a message from the provided datagram and triggers the Receive
+        event.
+        '''
+        coapmsg = self._buildMessage(data, addr)
         self._receiveHook.trigger(coapmsg)
+        if self._msgPool:
+            self._msgPool.release(coapmsg)
+            
+    def _buildMessage(self, data, addr):
+        '''Builds a message from the provided datagram.'''
+        if probe.receive.enabled:
+            probe.receive.fire(addr, len(data), data)
+          
+        if self._msgPool:
+            coapmsg = msgModule.buildFrom(bytestr=data, lazy=self.lazyDecode,
+                                          message=self._msgPool.acquire(addr))
+        else:
+            coapmsg = msgModule.buildFrom(address=addr, bytestr=data, lazy=self.lazyDecode)
+        coapmsg.endpoint = self
+        if probe.decode.enabled:
+            probe.decode.fire(addr, len(data), coapmsg)
+        return coapmsg
         
-    def send(self, message):
+    def send(self, message, onSent=None):
         '''Puts the provided message on the outgoing queue for the next write
         opportunity.
+        
+        :param onSent: function Optional callback, with the message as its 
+                                argument, after the message is sent, or dropped
+                                on a socket error; for example to release the 
+                                message to an ObjectPool
+        '''
+        self._enqueue((message, message.address, onSent))
+        
+    def sendRaw(self, msgBytes, address, onSent=None):
+        '''Puts the provided serialized message on the outgoing queue for the 
+        next write opportunity.
+        
+        :param msgBytes: bytes/bytearray CoAP-formatted message
+        :param address: tuple Destination address
+        :param onSent: function Optional callback, with msgBytes as its argument,
+                                after the message is sent, or dropped on a 
+                                socket error
         '''
-        self._outgoing.append(message)
-        log.debug('Added message to outgoing queue')
+        self._enqueue((msgBytes, address, onSent))
+        
+    def _enqueue(self, entry):
+        '''Adds an entry to the outgoing queue, and triggers a high QueueLevel
+        if it reaches highWater.'''
+        outgoing = self._outgoing
+        outgoing.append(entry)
+        if not self._queueHigh and len(outgoing) >= self.highWater:
+            self._queueHigh = True
+            log.warning('Outgoing queue high at {0} messages'.format(len(outgoing)))
+            self._queueLevelHook.trigger(True, len(outgoing))
         
     def handle_write(self):
-        if self._outgoing:
-            message  = self._outgoing.pop(0)
-            msgArray = msgModule.serialize(message)
-            if log.isEnabledFor(logging.DEBUG):
-                hexstr = ' '.join(['{:02x}'.format(b) for b in msgArray])
-                log.debug('Send message to {0}; data (hex) {1}'.format(message.address, hexstr))
+        '''Sends queued messages until the queue is empty or the socket accepts 
+        no more.'''
+        outgoing = self._outgoing
+        while outgoing:
+            message, address, onSent = outgoing[0]
+            if isinstance(message, msgModule.CoapMessage):
+                msgArray = msgModule.serialize(message)
+                if probe.serialize.enabled:
+                    probe.serialize.fire(address, len(msgArray), msgArray)
+            else:
+                msgArray = message
+                
+            try:
+                self.socket.sendto(msgArray, address)
+            except socket.error as e:
+                if e.errno in _NO_DATA:
+                    # Retry on next writable event
+                    break
+                log.warning('Dropping message to {0} on socket error: {1}'.format(
+                                                                        address, e))
+                self._sendErrorCount += 1
             else:
-                log.info('Send message to {0}'.format(message.address))
+                self._sentCount += 1
+                if probe.send.enabled:
+                    probe.send.fire(address, len(msgArray), msgArray)
+            outgoing.popleft()
+            if onSent:
+                onSent(message)
                 
-            self.socket.sendto(msgArray, message.address)
+        if self._queueHigh and len(outgoing) <= self.lowWater:
+            self._queueHigh = False
+            log.info('Outgoing queue low at {0} messages'.format(len(outgoing)))
+            self._queueLevelHook.trigger(False, len(outgoing))
+
+    def readable(self):
+        return not self.readPaused
 
     def writable(self):
-        return self._outgoing
+        return len(self._outgoing) > 0
 
     def log_info(self, message, type='info'):
         '''Override asyncore to output log messages to the logging module'''
-        if type == 'error':
-            level = logging.ERROR
-        elif type == 'warning':
-            level = logging.WARNING
-        else:
-            level = logging.INFO
+        _logInfo(message, type)
+        
+        
+class _Waker(_Dispatcher):
+    '''Wakes the asyncore loop from another thread via a socket pair, and runs
+    the functions queued by call().
+    
+    Attributes:
+        :_calls:  deque (function, args) tuples to run
+        :_writer: socket Write end of the pair; the dispatcher reads the other
+    '''
+    def __init__(self, map=None):
+        _Dispatcher.__init__(self, map=map)
+        reader, self._writer = socket.socketpair()
+        reader.setblocking(False)
+        self._writer.setblocking(False)
+        self._calls = collections.deque()
+        self.set_socket(reader)
+        
+    def call(self, func, args):
+        self._calls.append((func, args))
+        try:
+            self._writer.send(b'\0')
+        except socket.error:
+            # Pair buffer full, so a wakeup is already pending.
+            pass
             
-        log.log(level, message)
+    def handle_read(self):
+        try:
+            self.socket.recv(4096)
+        except socket.error:
+            pass
+        calls = self._calls
+        while calls:
+            func, args = calls.popleft()
+            try:
+                func(*args)
+            except Exception:
+                log.exception('Error in call from thread')
+                
+    def writable(self):
+        return False
+        
+    def handle_close(self):
+        self._writer.close()
+        self.close()
+        
+    def log_info(self, message, type='info'):
+        _logInfo(message, type)
+        
+def _logInfo(message, type):
+    '''Outputs an asyncore log message to the logging module.'''
+    if type == 'error':
+        level = logging.ERROR
+    elif type == 'warning':
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+        
+    log.log(level, message)
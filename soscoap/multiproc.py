@@ -0,0 +1,244 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides CoapServerGroup, which runs a CoapServer in each of several worker
+processes on the same port, to use more than one core. Requires SO_REUSEPORT and
+the 'fork' start method, so runs on Linux and similar platforms.
+'''
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import soscoap
+from   soscoap.msgsock import asyncore
+from   soscoap.server import CoapServer
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+log = logging.getLogger(__name__)
+
+_GAUGES = frozenset(['sendQueue', 'receiveQueueBytes', 'rcvbuf', 'sndbuf', 
+                     'endpoints', 'handlerBacklog', 'observers'])
+'''Stats that measure current state rather than count events; only summed for
+live workers'''
+
+class CoapServerGroup(object):
+    '''Supervisor for a group of worker processes, each with a CoapServer bound
+    to the same port with SO_REUSEPORT. The kernel balances incoming datagrams
+    across the workers by source address, so requests from a peer stay on one
+    worker.
+
+    Register handlers as for a CoapServer, before starting the workers. Each
+    worker inherits the handlers when forked, so a handler runs in the worker
+    process, and any state it keeps is per worker.
+
+    Usage:
+        #. group = CoapServerGroup(workers=4) -- Create instance
+        #. Register event handlers as for CoapServer
+        #. group.start() -- Start workers and supervise them until interrupted
+
+        Alternatively, start the workers with startWorkers(), call supervise()
+        periodically, and call stop() when done.
+
+    Attributes:
+        :workerCount:   int Count of worker processes
+        :port:          int Port for the servers
+        :statsInterval: float Seconds between stats reports from a worker
+        :restartDelay:  float Minimum seconds from the start of a worker to its
+                              restart, to avoid a tight crash loop
+        :_serverArgs:   dict Keyword arguments for each CoapServer
+        :_registrations: list (method name, args) for each registration, replayed
+                              on each CoapServer
+        :_workers:      list multiprocessing.Process for each worker, by index
+        :_startTimes:   list Start time for each worker, by index
+        :_statsByPid:   dict Latest stats reported by each worker process, keyed
+                             by pid; retains the stats for an exited process, for
+                             its counters
+        :_statsQueue:   multiprocessing.Queue for stats reports from workers
+        :_restarts:     int Count of worker restarts
+        :_context:      multiprocessing context for the workers
+
+    .. automethod:: soscoap.multiproc.CoapServerGroup.__init__
+    '''
+    def __init__(self, workers=None, port=soscoap.COAP_PORT, statsInterval=1.0,
+                       restartDelay=1.0, **serverArgs):
+        '''
+        :param workers: int Count of worker processes; defaults to the count of
+                            CPUs
+        :param port: int Port for the servers
+        :param statsInterval: float Seconds between stats reports from a worker
+        :param restartDelay: float Minimum seconds between restarts of a worker
+        :param serverArgs: Other keyword arguments for CoapServer, like pooled
+        '''
+        self.workerCount   = workers if workers else multiprocessing.cpu_count()
+        self.port          = port
+        self.statsInterval = statsInterval
+        self.restartDelay  = restartDelay
+        self._serverArgs   = serverArgs
+        self._registrations = []
+        self._workers      = []
+        self._startTimes   = []
+        self._statsByPid   = {}
+        self._statsQueue   = None
+        self._restarts     = 0
+        self._context      = None
+
+    def registerForResourceGet(self, handler, blocking=False, path=None):
+        self._register('registerForResourceGet', handler, blocking, path)
+
+    def registerForResourcePost(self, handler, blocking=False, path=None):
+        self._register('registerForResourcePost', handler, blocking, path)
+
+    def registerForResourcePut(self, handler, blocking=False, path=None):
+        self._register('registerForResourcePut', handler, blocking, path)
+
+    def registerStaticResource(self, path, value, mediaType=soscoap.MediaType.TextPlain):
+        self._register('registerStaticResource', path, value, mediaType)
+
+    def _register(self, methodName, *args):
+        if self._workers:
+            raise RuntimeError('Must register before starting workers')
+        self._registrations.append((methodName, args))
+
+    def start(self):
+        '''Starts the workers, and supervises them until interrupted.'''
+        self.startWorkers()
+        try:
+            while True:
+                self.supervise(self.statsInterval)
+        except KeyboardInterrupt:
+            log.info('Interrupted; stopping workers')
+        finally:
+            self.stop()
+
+    def startWorkers(self):
+        '''Starts the worker processes, and returns.
+
+        :raises RuntimeError: If the platform lacks SO_REUSEPORT
+        '''
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise RuntimeError('SO_REUSEPORT not supported on this platform')
+        if hasattr(multiprocessing, 'get_context'):
+            self._context = multiprocessing.get_context('fork')
+        else:
+            self._context = multiprocessing
+
+        self._statsQueue = self._context.Queue()
+        self._workers    = [None] * self.workerCount
+        self._startTimes = [0] * self.workerCount
+        for index in range(self.workerCount):
+            self._startWorker(index)
+
+    def _startWorker(self, index):
+        proc = self._context.Process(target=_runWorker,
+                                     name='coap-worker-{0}'.format(index),
+                                     args=(index, self.port, self._serverArgs,
+                                           self._registrations, self._statsQueue,
+                                           self.statsInterval))
+        proc.daemon = True
+        proc.start()
+        self._workers[index]    = proc
+        self._startTimes[index] = time.time()
+        log.info('Started worker {0}, pid {1}'.format(index, proc.pid))
+
+    def supervise(self, timeout=0.0):
+        '''Collects stats reports from workers for up to timeout seconds, and
+        then restarts any worker that has exited.
+        '''
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    index, pid, stats = self._statsQueue.get(timeout=remaining)
+                else:
+                    index, pid, stats = self._statsQueue.get_nowait()
+            except queue.Empty:
+                break
+            self._statsByPid[pid] = stats
+
+        now = time.time()
+        for index, proc in enumerate(self._workers):
+            if not proc.is_alive() and now - self._startTimes[index] >= self.restartDelay:
+                log.warning('Worker {0}, pid {1}, exited with code {2}; restarting'.format(
+                                                        index, proc.pid, proc.exitcode))
+                proc.join()
+                self._restarts += 1
+                self._startWorker(index)
+
+    def stats(self):
+        '''Returns a dict of counters summed across all workers, including those
+        that have exited, as of the last supervise(). A gauge, like sendQueue or
+        observers, is summed only across the workers alive. Also includes the
+        count of 'workers' alive and of 'restarts'.
+        '''
+        livePids = set(proc.pid for proc in self._workers if proc.is_alive())
+        totals   = {}
+        for pid, stats in self._statsByPid.items():
+            isLive = pid in livePids
+            for key, value in stats.items():
+                # Skip an unavailable value, like kernelDrops
+                if value is not None and (isLive or key not in _GAUGES):
+                    totals[key] = totals.get(key, 0) + value
+        totals['workers']  = sum(1 for proc in self._workers if proc.is_alive())
+        totals['restarts'] = self._restarts
+        return totals
+
+    def stop(self, timeout=5.0):
+        '''Terminates the workers, and waits up to timeout seconds for each to
+        exit.'''
+        for proc in self._workers:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in self._workers:
+            proc.join(timeout)
+        log.info('Stopped workers')
+
+def _runWorker(index, port, serverArgs, registrations, statsQueue, statsInterval):
+    '''Entry point for a worker process. Runs a CoapServer, and reports its stats
+    every statsInterval seconds. Uses the asyncio transport if asyncore is not
+    available.
+    '''
+    # Leave an interrupt to the supervisor.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if asyncore:
+        # Ignore any dispatchers inherited from the parent process.
+        asyncore.socket_map.clear()
+        server = _createServer(CoapServer, port, serverArgs, registrations)
+        nextReport = time.time() + statsInterval
+        while True:
+            asyncore.loop(timeout=statsInterval, count=1)
+            now = time.time()
+            if now >= nextReport:
+                statsQueue.put((index, os.getpid(), server.stats()))
+                nextReport = now + statsInterval
+    else:
+        import asyncio
+        from   soscoap.aio import AsyncCoapServer
+
+        loop   = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = _createServer(AsyncCoapServer, port, serverArgs, registrations)
+        loop.run_until_complete(server.open())
+
+        def report():
+            statsQueue.put((index, os.getpid(), server.stats()))
+            loop.call_later(statsInterval, report)
+        loop.call_later(statsInterval, report)
+        loop.run_forever()
+
+def _createServer(serverClass, port, serverArgs, registrations):
+    '''Creates a server for a worker, and replays the handler registrations.'''
+    server = serverClass(port=port, reusePort=True, **serverArgs)
+    for methodName, args in registrations:
+        getattr(server, methodName)(*args)
+    return server
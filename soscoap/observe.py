@@ -0,0 +1,198 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides the ObserveRegistry class, to track the observers of server resources,
+as defined in RFC 7641.
+'''
+import logging
+import time
+import soscoap
+
+log = logging.getLogger(__name__)
+
+MAX_SEQUENCE = 0xFFFFFF
+'''Largest Observe option sequence value, 24 bits'''
+
+CON_INTERVAL = 24 * 60 * 60
+'''Maximum seconds between confirmable notifications to an observer, from 
+Sec. 4.5 of RFC 7641'''
+
+class Observer(object):
+    '''Client registered to observe a resource.
+
+    Attributes:
+        :address:  tuple Peer address
+        :token:    bytes Token from the registration request; each notification
+                         uses it
+        :endpoint: Message socket on which the registration arrived, or None
+        :confirmedAt: float Time of the registration, or of the latest
+                            confirmable notification sent
+    '''
+    __slots__ = ('address', 'token', 'endpoint', 'confirmedAt')
+
+    def __init__(self, address, token, endpoint, confirmedAt):
+        self.address     = address
+        self.token       = token
+        self.endpoint    = endpoint
+        self.confirmedAt = confirmedAt
+
+class ObserveRegistry(object):
+    '''Observers for each resource path, keyed by peer address and token, and the
+    current Observe sequence value for the path. All observers of a path share 
+    its sequence, which still increases for each of them, as RFC 7641 requires.
+
+    A notification to an observer is confirmable if conInterval has passed since
+    the registration or the latest confirmable notification, so a client that 
+    is gone is detected. An observer is removed if it does not acknowledge a 
+    confirmable notification within ackTimeout.
+
+    Attributes:
+        :conInterval: float Maximum seconds between confirmable notifications to
+                            an observer
+        :ackTimeout:  float Seconds to wait for the acknowledgement of a 
+                            confirmable notification
+        :_observers: dict For each path, a dict of Observer keyed by
+                          (peer address, token)
+        :_sequences: dict Current sequence value for each path
+        :_notified:  dict (path, observer key) for the latest notification sent
+                          with a message ID, keyed by (peer address, message ID),
+                          to remove an observer that rejects a notification with
+                          a Reset
+        :_confirming: dict (expiry time, path, Observer) for each confirmable
+                           notification not yet acknowledged, keyed by
+                           (peer address, message ID)
+
+    .. automethod:: soscoap.observe.ObserveRegistry.__init__
+    '''
+    def __init__(self, conInterval=CON_INTERVAL, ackTimeout=soscoap.MAX_TRANSMIT_WAIT):
+        '''
+        :param conInterval: float Maximum seconds between confirmable 
+                                  notifications to an observer
+        :param ackTimeout: float Seconds to wait for the acknowledgement of a
+                                 confirmable notification
+        '''
+        self.conInterval = conInterval
+        self.ackTimeout  = ackTimeout
+        self._observers  = {}
+        self._sequences  = {}
+        self._notified   = {}
+        self._confirming = {}
+
+    def add(self, path, request, now=None):
+        '''Adds or replaces the observer for the peer and token of the provided
+        registration request.
+
+        :param request: CoapMessage GET request with Observe option 0
+        :param now: float Current time.time()
+        :returns: int Current sequence value for the path
+        '''
+        if now is None:
+            now = time.time()
+        token    = bytes(request.token) if request.token else b''
+        observer = Observer(request.address, token, request.endpoint, now)
+        self._observers.setdefault(path, {})[(request.address, token)] = observer
+        return self._sequences.setdefault(path, 0)
+
+    def remove(self, path, address, token):
+        '''Removes the observer for the provided path, peer and token, if any.'''
+        observers = self._observers.get(path)
+        if observers:
+            observers.pop((address, bytes(token) if token else b''), None)
+            if not observers:
+                del self._observers[path]
+
+    def removePath(self, path):
+        '''Removes all observers for the provided path.'''
+        self._observers.pop(path, None)
+
+    def removeByMessageId(self, address, messageId):
+        '''Removes the observer at the provided peer address sent the latest 
+        notification with the provided message ID, if any.
+
+        :param address: tuple Address of the peer that sent the Reset
+        :returns: boolean True if an observer was removed
+        '''
+        key = (address, messageId)
+        self._confirming.pop(key, None)
+        entry = self._notified.pop(key, None)
+        if entry:
+            return self._removeKey(*entry)
+        return False
+
+    def _removeKey(self, path, key):
+        '''Removes the observer for the provided path and (peer address, token).
+
+        :returns: boolean True if an observer was removed
+        '''
+        observers = self._observers.get(path)
+        if observers and observers.pop(key, None):
+            if not observers:
+                del self._observers[path]
+            return True
+        return False
+
+    def recordNotified(self, messageId, path, observer, confirmable=False, now=None):
+        '''Records the message ID of a notification sent to the observer.
+
+        :param confirmable: boolean True if the notification is confirmable; 
+                            then the observer must acknowledge it
+        :param now: float Current time.time(); only needed if confirmable
+        '''
+        sentKey = (observer.address, messageId)
+        self._notified[sentKey] = (path, (observer.address, observer.token))
+        if confirmable:
+            if now is None:
+                now = time.time()
+            observer.confirmedAt      = now
+            self._confirming[sentKey] = (now + self.ackTimeout, path, observer)
+
+    def acknowledge(self, address, messageId):
+        '''Records the acknowledgement of a confirmable notification.
+
+        :param address: tuple Address of the peer that sent the acknowledgement
+        :returns: boolean True if a notification to the peer was waiting for it
+        '''
+        return self._confirming.pop((address, messageId), None) is not None
+
+    def removeUnacknowledged(self, now=None):
+        '''Removes the observers that have not acknowledged a confirmable 
+        notification within ackTimeout.
+
+        :param now: float Current time.time()
+        :returns: int Count of observers removed
+        '''
+        if not self._confirming:
+            return 0
+        if now is None:
+            now = time.time()
+        expired = [sentKey for sentKey, entry in self._confirming.items()
+                           if entry[0] <= now]
+        count   = 0
+        for sentKey in expired:
+            expiry, path, observer = self._confirming.pop(sentKey)
+            key       = (observer.address, observer.token)
+            observers = self._observers.get(path)
+            # Skip if the client has registered again since.
+            if observers and observers.get(key) is observer:
+                self._removeKey(path, key)
+                count += 1
+        return count
+
+    def observers(self, path):
+        '''Returns a list of the Observer for the provided path.'''
+        observers = self._observers.get(path)
+        return list(observers.values()) if observers else []
+
+    def nextSequence(self, path):
+        '''Increments and returns the sequence value for the provided path.'''
+        sequence = (self._sequences.get(path, 0) + 1) & MAX_SEQUENCE
+        self._sequences[path] = sequence
+        return sequence
+
+    def count(self):
+        '''Returns the count of observers for all paths.'''
+        return sum(len(observers) for observers in self._observers.values())
@@ -0,0 +1,126 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides the HandlerPool class, to run blocking work off the event loop.
+'''
+import collections
+import logging
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+log = logging.getLogger(__name__)
+
+class HandlerPool(object):
+    '''Bounded pool of threads that runs tasks, and reports each completion back
+    to the event loop. Tasks submitted with the same key run one at a time, in
+    the order submitted, so the server preserves request order for a peer.
+    Tasks for different keys run concurrently.
+
+    Usage:
+        #. pool = HandlerPool(msgSocket.callFromThread) -- Create instance
+        #. pool.submit(key, task, onDone) -- Runs task(), and then onDone(error)
+           on the loop, where error is the exception raised by task, or None
+        #. pool.shutdown() -- When done
+
+    Attributes:
+        :maxPending: int Maximum count of tasks submitted but not complete
+        :_callFromThread: Schedules a function and its arguments to run on the
+                          event loop
+        :_ready:   Queue Keys with a task ready to run
+        :_pending: dict deque of (task, onDone) tuples not yet started, keyed by
+                        task key. A key is present while a task for it is
+                        pending or running.
+        :_count:   int Count of tasks submitted but not complete
+        :_lock:    Lock Guards _pending and _count
+        :_threads: list Worker threads
+
+    .. automethod:: soscoap.offload.HandlerPool.__init__
+    '''
+    def __init__(self, callFromThread, threads=4, maxPending=256):
+        '''
+        :param callFromThread: function Schedules a function and its arguments
+                                        to run on the event loop
+        :param threads: int Count of worker threads
+        :param maxPending: int Maximum count of tasks submitted but not complete
+        '''
+        self.maxPending      = maxPending
+        self._callFromThread = callFromThread
+        self._ready          = queue.Queue()
+        self._pending        = {}
+        self._count          = 0
+        self._lock           = threading.Lock()
+        self._threads        = []
+        for i in range(threads):
+            thread = threading.Thread(target=self._run,
+                                      name='coap-handler-{0}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, task, onDone):
+        '''Queues a task to run after any earlier task for the same key.
+
+        :param key: Orders tasks; for example the peer address
+        :param task: function No arguments
+        :param onDone: function Runs on the loop after task completes, with the
+                                exception raised by task, or None
+        :returns: boolean False if rejected because maxPending tasks are already
+                  pending
+        '''
+        with self._lock:
+            if self._count >= self.maxPending:
+                return False
+            self._count += 1
+            tasks = self._pending.get(key)
+            if tasks is None:
+                self._pending[key] = collections.deque([(task, onDone)])
+                self._ready.put(key)
+            else:
+                tasks.append((task, onDone))
+        return True
+
+    def pendingCount(self):
+        '''Returns the count of tasks submitted but not complete.'''
+        return self._count
+
+    def shutdown(self):
+        '''Stops the worker threads after the tasks already ready to run.'''
+        for thread in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        '''Worker thread loop.'''
+        while True:
+            key = self._ready.get()
+            if key is None:
+                break
+            with self._lock:
+                task, onDone = self._pending[key].popleft()
+
+            error = None
+            try:
+                task()
+            except Exception as e:
+                error = e
+
+            # Schedule before the next task for the key may start, to keep 
+            # completions in order.
+            try:
+                self._callFromThread(onDone, error)
+            except Exception:
+                log.exception('Error reporting task completion')
+            with self._lock:
+                self._count -= 1
+                if self._pending[key]:
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
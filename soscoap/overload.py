@@ -0,0 +1,109 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides the AdmissionControl class, to shed load when a server falls behind.
+'''
+import logging
+import soscoap.probe as probe
+
+log = logging.getLogger(__name__)
+
+class AdmissionControl(object):
+    '''Decides whether a server admits a request to its handlers, or sheds it with
+    5.03 Service Unavailable and a Max-Age hint, so clients back off. Watches
+    three measures, each optional:
+
+    * Request arrival rate, counted in fixed windows
+    * Outgoing queue depth of the message socket
+    * Handler time, as a moving average of the time from receipt of a request
+      to its reply, including any wait for a blocking handler
+
+    While the handler time average is over its limit, admits one request per
+    window, so the average tracks recovery of the handlers.
+
+    Usage:
+        #. ac = AdmissionControl(maxRate=500, maxHandlerTime=0.05) -- Create
+           instance
+        #. server = CoapServer(admission=ac) -- Server calls admit() and
+           recordHandlerTime()
+
+    Attributes:
+        :maxRate:        int Maximum count of requests admitted per window, or
+                             None for no limit
+        :maxQueue:       int Maximum outgoing queue depth, or None for no limit;
+                             in the unit of the socket's queueDepth() -- a count
+                             of messages for MessageSocket, but bytes in the
+                             transport write buffer for AsyncMessageSocket
+        :maxHandlerTime: float Maximum average handler time in seconds, or None
+                               for no limit
+        :retryAfter:     int Seconds for the Max-Age hint in a shed reply
+        :window:         float Seconds in a rate window
+        :shedCount:      int Count of requests shed
+        :handlerTime:    float Moving average of handler time in seconds
+        :_windowStart:   float Start time of the current window
+        :_windowCount:   int Count of requests admitted in the current window
+        :_weight:        float Weight of a new sample in handlerTime
+
+    .. automethod:: soscoap.overload.AdmissionControl.__init__
+    '''
+    def __init__(self, maxRate=None, maxQueue=None, maxHandlerTime=None,
+                       retryAfter=5, window=1.0, weight=0.2):
+        '''
+        :param maxRate: int Maximum count of requests per window
+        :param maxQueue: int Maximum outgoing queue depth; messages, or bytes for
+                             the asyncio transport
+        :param maxHandlerTime: float Maximum average handler time in seconds
+        :param retryAfter: int Seconds for the Max-Age hint in a shed reply
+        :param window: float Seconds in a rate window
+        :param weight: float Weight of a new sample in the handler time average
+        '''
+        self.maxRate        = maxRate
+        self.maxQueue       = maxQueue
+        self.maxHandlerTime = maxHandlerTime
+        self.retryAfter     = retryAfter
+        self.window         = window
+        self.shedCount      = 0
+        self.handlerTime    = 0.0
+        self._windowStart   = 0.0
+        self._windowCount   = 0
+        self._weight        = weight
+
+    def admit(self, queueDepth, now=None):
+        '''Returns True if a request may run its handler; otherwise counts the
+        request as shed.
+
+        :param queueDepth: int Outgoing queue depth of the message socket, from
+                           its queueDepth()
+        :param now: float Current probe.clock() time
+        '''
+        if now is None:
+            now = probe.clock()
+        if now - self._windowStart >= self.window:
+            self._windowStart = now
+            self._windowCount = 0
+
+        if self.maxQueue is not None and queueDepth >= self.maxQueue:
+            reason = 'queue depth {0}'.format(queueDepth)
+        elif self.maxRate is not None and self._windowCount >= self.maxRate:
+            reason = 'request rate'
+        elif (self.maxHandlerTime is not None and self.handlerTime > self.maxHandlerTime
+                                              and self._windowCount > 0):
+            reason = 'handler time {0:.3f}s'.format(self.handlerTime)
+        else:
+            self._windowCount += 1
+            return True
+
+        self.shedCount += 1
+        log.debug('Shedding request for {0}'.format(reason))
+        return False
+
+    def recordHandlerTime(self, elapsed):
+        '''Adds a sample to the handler time average.
+
+        :param elapsed: float Seconds from receipt of a request to its reply
+        '''
+        self.handlerTime += self._weight * (elapsed - self.handlerTime)
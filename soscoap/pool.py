@@ -0,0 +1,57 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3), 
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides the ObjectPool class.
+'''
+import logging
+
+log = logging.getLogger(__name__)
+
+class ObjectPool(object):
+    '''Free list of reusable instances of a class, to reduce allocation and garbage
+    collection under sustained load. The class must initialize all of its state
+    in __init__(), which is rerun each time an instance is acquired.
+    
+    A pool is opt-in. After an instance is released, the owner must not use it 
+    again, and must not have passed it to code that retains it.
+    
+    Usage:
+        #. pool = ObjectPool(CoapMessage) -- Create instance
+        #. msg  = pool.acquire(address) -- Use like the class constructor
+        #. pool.release(msg) -- When done with msg
+
+    Attributes:
+        :maxSize: int Maximum count of idle instances to retain
+        :_cls:    class Type of pooled instances
+        :_free:   list Idle instances
+
+    .. automethod:: soscoap.pool.ObjectPool.__init__
+    '''
+    def __init__(self, cls, maxSize=256):
+        '''
+        :param cls: class Type of pooled instances
+        :param maxSize: int Maximum count of idle instances to retain
+        '''
+        self.maxSize = maxSize
+        self._cls    = cls
+        self._free   = []
+        
+    def acquire(self, *args, **kwargs):
+        '''Returns an initialized instance, reused from the pool if available.
+        Accepts the same arguments as the class constructor.
+        '''
+        if self._free:
+            obj = self._free.pop()
+        else:
+            obj = self._cls.__new__(self._cls)
+        obj.__init__(*args, **kwargs)
+        return obj
+        
+    def release(self, obj):
+        '''Returns the provided instance to the pool for reuse.'''
+        if len(self._free) < self.maxSize:
+            self._free.append(obj)
@@ -0,0 +1,111 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3), 
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides named instrumentation probes for the message hot path. A probe costs
+only an attribute test when no observer is registered. Register an observer to
+receive a timestamp and details each time a probe fires.
+
+Probes, with the 'size' and 'info' values provided to an observer:
+
+    :receive:   Datagram read from the socket. size: int datagram length; 
+                info: bytes/bytearray/memoryview datagram
+    :decode:    Datagram read into a CoapMessage. size: int datagram length; 
+                info: CoapMessage
+    :dispatch:  Server starts to handle a request. size: None; info: CoapMessage
+    :handler:   Server request handlers have returned. size: None; info: float
+                elapsed seconds in the handlers
+    :serialize: Outgoing message written to bytes. size: int message length;
+                info: bytes/bytearray/memoryview message
+    :send:      Datagram written to the socket. size: int datagram length; 
+                info: bytes/bytearray/memoryview datagram
+
+An observer is a function with the signature::
+
+    observer(name, timestamp, address, size, info)
+    
+where name is the probe name, timestamp is from probe.clock(), and address is 
+the peer address tuple. An observer must not retain a bytearray or memoryview 
+info value beyond its return, because the underlying buffer may be reused.
+
+Usage::
+
+    from soscoap import probe
+    probe.register('receive', probe.logHexDump)
+'''
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+clock = getattr(time, 'perf_counter', time.time)
+'''Timestamp source for probes; monotonic where available'''
+
+class Probe(object):
+    '''A named instrumentation point. A producer must test the 'enabled' 
+    attribute before it prepares the observation and calls fire().
+    
+    Attributes:
+        :name:       str Probe name
+        :enabled:    boolean True if any observer is registered
+        :_observers: list Registered observer functions
+    '''
+    __slots__ = ('name', 'enabled', '_observers')
+    
+    def __init__(self, name):
+        self.name       = name
+        self.enabled    = False
+        self._observers = []
+        
+    def register(self, observer):
+        self._observers.append(observer)
+        self.enabled = True
+        
+    def unregister(self, observer):
+        self._observers.remove(observer)
+        self.enabled = bool(self._observers)
+        
+    def clear(self):
+        del self._observers[:]
+        self.enabled = False
+        
+    def fire(self, address, size, info):
+        '''Notifies observers of an occurrence of this probe.'''
+        timestamp = clock()
+        for observer in self._observers:
+            observer(self.name, timestamp, address, size, info)
+
+receive   = Probe('receive')
+decode    = Probe('decode')
+dispatch  = Probe('dispatch')
+handler   = Probe('handler')
+serialize = Probe('serialize')
+send      = Probe('send')
+
+probes = dict((p.name, p) for p in (receive, decode, dispatch, handler, serialize, send))
+'''Probe for each name'''
+
+def register(name, observer):
+    '''Registers an observer for the named probe.
+    
+    :raises KeyError: If no probe with the name
+    '''
+    probes[name].register(observer)
+    
+def unregister(name, observer):
+    probes[name].unregister(observer)
+    
+def clear():
+    '''Unregisters all observers from all probes.'''
+    for p in probes.values():
+        p.clear()
+        
+def logHexDump(name, timestamp, address, size, info):
+    '''Observer that logs the datagram bytes in hex at DEBUG level. Use with the
+    'receive' and 'send' probes.
+    '''
+    hexstr = ' '.join(['{:02x}'.format(b) for b in bytearray(info)])
+    log.debug('{0} {1}; data (hex) {2}'.format(name, address, hexstr))
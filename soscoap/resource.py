@@ -11,6 +11,9 @@ import logging
 
 log = logging.getLogger(__name__)
 
+_UNSET = object()
+'''Marks a value not yet decoded'''
+
 class SosResourceTransfer(object):
     '''Provides application access to the resource being transferred between client
     and server. This transfer is the core of messaging.
@@ -18,7 +21,11 @@ class SosResourceTransfer(object):
     Attributes:
         :path:    str URI path for the resource
         :pathQuery: str Query for the URI path
-        :value:   object Representation of the resource suitable for messaging
+        :params:  dict Values for the parameters in the path pattern of the 
+                       handler's route, keyed by name; None without a route
+        :value:   object Representation of the resource suitable for messaging.
+                         For a request created by the server, decoded from the
+                         message payload on first access.
         :type:    str Type of the value, using the same classification as 
                       soscoap.OptionType.valueFormat.
         :sourceAddress: str tuple, Address of the host that is the source of the 
@@ -27,16 +34,48 @@ class SosResourceTransfer(object):
         :resultCode:    Detailed outcome of the transfer. The type depends on 
                         resultClass, and may be SuccessResponseCode, ServerResponseCode, 
                         or ClientResponseCode
+        :maxAge:        int Seconds a GET representation remains fresh, for the 
+                            Max-Age option, or None to omit the option
+        :etag:          bytes Entity tag for a GET representation, for the ETag
+                              option, or None to omit the option
+        :_value:        Value, or _UNSET if not yet decoded from _valueSource
+        :_valueSource:  CoapMessage from which to decode the value, or None
     '''
+    __slots__ = ('path', 'pathQuery', 'params', '_value', 'type', 'sourceAddress', 'resultClass',
+                 'resultCode', 'maxAge', 'etag', '_valueSource')
     
     def __init__(self, path, value=None, resourceType=None, sourceAddress=None):
         self.path          = path
         self.pathQuery     = None
+        self.params        = None
         self.value         = value
         self.type          = resourceType
         self.sourceAddress = sourceAddress
         self.resultClass   = None
         self.resultCode    = None
+        self.maxAge        = None
+        self.etag          = None
+        
+    @property
+    def value(self):
+        if self._value is _UNSET:
+            self._value       = self._valueSource.typedPayload()
+            self._valueSource = None
+        return self._value
+        
+    @value.setter
+    def value(self, value):
+        self._value       = value
+        self._valueSource = None
+        
+    def setValueSource(self, message):
+        '''Defers the value to the payload of the provided message, decoded on 
+        first access to the value attribute.
+        
+        :param message: CoapMessage Source for the value
+        '''
+        self._value       = _UNSET
+        self._valueSource = message
 
     def __str__(self):
         attrs = ', '.join(['{0}',
@@ -0,0 +1,146 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved.
+#
+# Released under the GNU Library General Public License, version 3.0 (LGPLv3),
+# as published at the link below.
+# http://opensource.org/licenses/LGPL-3.0
+'''
+Provides the ResourceRouter class, to dispatch a request to the handler for its
+method and path.
+'''
+import logging
+from   soscoap import ClientResponseCode
+
+log = logging.getLogger(__name__)
+
+class Route(object):
+    '''Handler registered for a method and path pattern.
+
+    Attributes:
+        :handler:  function Accepts an SosResourceTransfer
+        :blocking: boolean True if the handler blocks, so runs on a thread pool
+        :pattern:  str Path pattern registered
+    '''
+    __slots__ = ('handler', 'blocking', 'pattern')
+
+    def __init__(self, handler, blocking, pattern):
+        self.handler  = handler
+        self.blocking = blocking
+        self.pattern  = pattern
+
+class _RouteNode(object):
+    '''Node in the route trie, for one Uri-Path segment.
+
+    Attributes:
+        :children:  dict _RouteNode for each literal next segment
+        :param:     _RouteNode for any next segment, or None
+        :paramName: str Name for the segment matched by param
+        :routes:    dict Route for each RequestCode at this path
+    '''
+    __slots__ = ('children', 'param', 'paramName', 'routes')
+
+    def __init__(self):
+        self.children  = {}
+        self.param     = None
+        self.paramName = None
+        self.routes    = {}
+
+def splitPath(path):
+    '''Returns the list of segments in the provided absolute path; an empty list
+    for the root path or None.'''
+    if not path or path == '/':
+        return []
+    return path[1:].split('/')
+
+class ResourceRouter(object):
+    '''Trie of Uri-Path segments, which maps a request method and path to a
+    Route in one lookup. A pattern segment is either literal text, or a
+    parameter like '{id}', which matches any segment. A literal segment takes
+    precedence over a parameter at the same position.
+
+    Usage:
+        #. router = ResourceRouter() -- Create instance
+        #. router.add(RequestCode.GET, '/sensor/{id}', handler) -- Add routes
+        #. route, params, code = router.lookup(RequestCode.GET, '/sensor/7')
+
+    Attributes:
+        :_root:  _RouteNode for the root path
+        :_count: int Count of routes
+
+    .. automethod:: soscoap.router.ResourceRouter.__init__
+    '''
+    def __init__(self):
+        self._root  = _RouteNode()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, method, pattern, handler, blocking=False):
+        '''Adds a route.
+
+        :param method: RequestCode Request method
+        :param pattern: str Absolute path pattern, like '/sensor/{id}/value'
+        :param handler: function Accepts an SosResourceTransfer
+        :param blocking: boolean True if the handler blocks
+        :raises ValueError: If a route exists for the method and pattern, or a
+                            parameter name conflicts with another pattern
+        '''
+        node = self._root
+        for segment in splitPath(pattern):
+            if segment.startswith('{') and segment.endswith('}'):
+                name = segment[1:-1]
+                if node.param is None:
+                    node.param     = _RouteNode()
+                    node.paramName = name
+                elif node.paramName != name:
+                    raise ValueError('Parameter {{{0}}} conflicts with {{{1}}} in {2}'.format(
+                                                        name, node.paramName, pattern))
+                node = node.param
+            else:
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _RouteNode()
+                node = child
+
+        if method in node.routes:
+            raise ValueError('Route exists for {0} {1}'.format(method, pattern))
+        node.routes[method] = Route(handler, blocking, pattern)
+        self._count += 1
+
+    def lookup(self, method, path):
+        '''Finds the route for a request.
+
+        :param method: RequestCode Request method
+        :param path: str Absolute request path, or None
+        :returns: tuple (Route, dict params, None) if found; otherwise
+                  (None, None, ClientResponseCode) -- NotFound if no route for the
+                  path, or MethodNotAllowed if no route for the method
+        '''
+        params = {}
+        node   = self._match(self._root, splitPath(path), 0, params)
+        if node is None:
+            return (None, None, ClientResponseCode.NotFound)
+        route = node.routes.get(method)
+        if route is None:
+            return (None, None, ClientResponseCode.MethodNotAllowed)
+        return (route, params, None)
+
+    def _match(self, node, segments, index, params):
+        '''Returns the node with a route for the segments from index, or None.
+        Adds any parameter values to params.'''
+        if index == len(segments):
+            return node if node.routes else None
+
+        segment = segments[index]
+        child   = node.children.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, params)
+            if found is not None:
+                return found
+        if node.param is not None:
+            found = self._match(node.param, segments, index + 1, params)
+            if found is not None:
+                params[node.paramName] = segment
+                return found
+        return None
@@ -8,9 +8,17 @@
 Provides an SOS CoapServer, the main SOS interface for a server-based CoAP 
 application.
 '''
-import asyncore
+# asyncore was removed in Python 3.12; use soscoap.aio there.
+try:
+    import asyncore
+except ImportError:
+    asyncore = None
+import collections
+import json
 import logging
 import random
+import time
+from   soscoap import ClientResponseCode
 from   soscoap import CodeClass
 from   soscoap import MediaType
 from   soscoap import MessageType
@@ -19,11 +27,22 @@ from   soscoap import RequestCode
 from   soscoap import ServerResponseCode
 from   soscoap import SuccessResponseCode
 import soscoap
+from   soscoap.block import BlockProducer
+import soscoap.block as block
+from   soscoap.endpoint import EndpointManager
 from   soscoap.event import EventHook
 from   soscoap.message import CoapMessage
 from   soscoap.message import CoapOption
+from   soscoap.message import MessageTemplate
+from   soscoap.message import serialize
+from   soscoap.observe import ObserveRegistry
+from   soscoap.offload import HandlerPool
+from   soscoap.pool import ObjectPool
 from   soscoap.resource import SosResourceTransfer
+from   soscoap.router import ResourceRouter
 from   soscoap.msgsock import MessageSocket
+import soscoap.msgsock as msgsock
+import soscoap.probe as probe
 
 log = logging.getLogger(__name__)
 
@@ -36,128 +55,860 @@ class CoapServer(object):
         handler may raise an IgnoreRequestException to silently ignore a request.
         
         :ResourceGet:  Server requests the value for the provided resource, to 
-                       service a client GET request.
+                       service a client GET request. The handler may set the value
+                       to a producer -- a file-like object or an iterator of 
+                       byte chunks -- and the server streams it with block-wise
+                       transfer (RFC 7959 Block2). The server also uses block-wise
+                       transfer for any value larger than one block.
         :ResourcePut:  Server forwards the value for the provided resource, to 
                        service a client PUT request.
         :ResourcePost: Server forwards the value for the provided resource, to 
                        service a client POST request.
+                       
+        Register a handler that blocks, for example on file or database I/O, with
+        blocking=True. Then all handlers for that event run on a thread pool
+        rather than the network loop, and the server sends the reply on the loop 
+        when they complete. Requests from a peer are handled in the order 
+        received. If the pool backlog is full, the server replies 5.03 Service 
+        Unavailable.
+        
+        Register a handler with a path pattern, like path='/sensor/{id}', to
+        run only that handler for a request to a matching path, with any 
+        parameter values in resource.params. A route takes precedence over the
+        handlers registered without a path. If no handler is registered for an 
+        event without a path, the server replies 4.04 Not Found for a path 
+        without a route, or 4.05 Method Not Allowed for a method without a route.
+        
+        A client may observe a resource (RFC 7641) with a GET request that 
+        includes the Observe option. Call notify() with the path when the 
+        resource changes. The server then triggers the ResourceGet event once,
+        and sends the representation to each observer as a non-confirmable
+        notification. A block-wise representation is not observable. At least 
+        once a day, a notification to an observer is confirmable instead, as 
+        RFC 7641 Sec. 4.5 requires. The server removes an observer that rejects
+        a notification with Reset, or has not acknowledged a confirmable 
+        notification within MAX_TRANSMIT_WAIT by the next notify(). The server
+        does not retransmit a notification.
+        
+        A GET handler may set maxAge and etag for the resource, for the Max-Age 
+        and ETag options in the reply. The server replies 2.03 Valid without the 
+        representation to a request with a matching ETag. Pass in a 
+        ResponseCache to serve repeated GET requests for a resource with a 
+        maxAge from its cached reply while fresh. A PUT or POST request for the 
+        path invalidates the cached reply.
+        
+        Pass in a DuplicateCache to detect a retransmitted confirmable request.
+        Then the server repeats the reply to the original rather than trigger the
+        event again, and ignores a duplicate while the original is in progress.
+        
+        Pass in an AdmissionControl to shed load when the server falls behind.
+        Then the server replies 5.03 Service Unavailable with a Max-Age hint 
+        rather than trigger the event for a request.
         
     Usage:
         #. cs = CoapServer() -- Create instance
         #. Register event handlers as needed; for example, cs.registerForResourceGet(). 
+           Register any fixed-value resource with cs.registerStaticResource().
         #. cs.start() -- Start to listen for requests
 
      Attributes:
-        :_msgSocket: MessageSocket to send/receive messages
+        :_msgSocket: MessageSocket to send/receive messages; an EndpointManager
+                     unless provided to the constructor
         :_resourceGetHook:  EventHook triggered when GET resource requested
         :_resourcePutHook:  EventHook triggered when PUT resource requested
         :_resourcePostHook: EventHook triggered when POST resource requested
         :_nextMessageId:    Next sequential value for a new Message ID
+        :_msgPool:      ObjectPool for request and reply messages, or None if
+                        not pooled
+        :_resourcePool: ObjectPool for SosResourceTransfer, or None if not pooled
+        :_newMessage:   Factory for a CoapMessage
+        :_newResource:  Factory for an SosResourceTransfer
+        :_staticResources: dict MessageTemplate for the GET reply to each static
+                           resource, keyed by path
+        :_maxBlockSzx:    int Largest block size exponent for a Block2 reply
+        :_blockTransfers: dict BlockProducer for each Block2 transfer in progress,
+                          keyed by (peer address, token bytes)
+        :_handlerThreads: int Count of threads for blocking handlers
+        :_handlerBacklog: int Maximum count of requests waiting for a blocking
+                          handler
+        :_handlerPool:    HandlerPool Runs blocking handlers; None until one
+                          is registered
+        :_blockingHooks:  set EventHooks with a blocking handler
+        :_router:         ResourceRouter Handlers registered for a path
+        :_observeRegistry: ObserveRegistry Observers for each path
+        :_notifyBatch:    int Maximum count of notifications to send per pass of
+                          the loop
+        :_notifications:  deque [MessageTemplate, path, list of Observer, index 
+                          of next Observer] for each notify() not yet sent to
+                          all observers
+        :_notifyScheduled: boolean True if a pass to send notifications is
+                          scheduled on the loop
+        :_statsPath:    str Path for the stats resource, or None
+        :_requestCount: int Count of requests handled
+        :_ignoreCount:  int Count of requests ignored by a handler
+        :_errorCount:   int Count of requests that generated an error reply
+        :_admission:    AdmissionControl Sheds requests when overloaded, or None
+        :_dedup:        DuplicateCache Detects retransmitted requests, or None
+        :_responseCache: ResponseCache Fresh GET replies, or None
 
     .. automethod:: soscoap.server.CoapServer.__init__
    '''
-    def __init__(self, msgSocket=None, port=soscoap.COAP_PORT):
+    def __init__(self, msgSocket=None, port=soscoap.COAP_PORT, lazyDecode=False,
+                       pooled=False, maxBlockSzx=block.DEFAULT_SZX, zeroCopy=False,
+                       bufsize=msgsock.SOCKET_BUFSIZE, readBatch=1, reusePort=False,
+                       handlerThreads=4, handlerBacklog=256, rcvbuf=None, sndbuf=None,
+                       dropStats=False, endpoints=None, admission=None, dedup=None,
+                       notifyBatch=256, responseCache=None):
         '''Pass in msgSocket only for unit testing.
         Pass in port for non-standard CoAP port.
+        Pass in lazyDecode to decode request options only as needed; see 
+        message.buildFrom().
+        Pass in pooled to recycle messages and SosResourceTransfers; see 
+        pool.ObjectPool. A handler then must not retain the resource it is passed
+        beyond its return.
+        Pass in maxBlockSzx to limit the block size for a Block2 reply, as 
+        2**(maxBlockSzx+4) bytes; 512 bytes by default, so a block fits in the
+        default receive buffer of a client. A client may request smaller blocks.
+        Pass in zeroCopy to receive requests into a reusable buffer, and bufsize
+        for the maximum request size; see msgsock.MessageSocket. With zeroCopy, 
+        a handler must copy a bytes-like resource value to retain it.
+        Pass in readBatch to read up to that many requests per socket read event,
+        and handle them in one pass.
+        Pass in reusePort to share the port with other processes; see 
+        multiproc.CoapServerGroup.
+        Pass in handlerThreads and handlerBacklog to size the thread pool for 
+        blocking handlers; see offload.HandlerPool.
+        Pass in rcvbuf and sndbuf to size the socket buffers, and dropStats to 
+        count datagrams dropped by the kernel; see MessageSocket.stats().
+        Pass in endpoints to listen on more sockets than the one for port, as a 
+        list of (host, port) or (host, port, scopeId) tuples; see addEndpoint().
+        Pass in admission to shed requests when overloaded; see 
+        overload.AdmissionControl.
+        Pass in dedup to answer a retransmitted confirmable request from a cache
+        of replies; see dedup.DuplicateCache.
+        Pass in notifyBatch for the maximum count of Observe notifications to send
+        per pass of the loop, so a notify() for many observers does not stall 
+        the loop.
+        Pass in responseCache to serve a GET request from a cached reply while
+        fresh; see cache.ResponseCache.
         '''
-        self._msgSocket = msgSocket if msgSocket else MessageSocket(port)
-        self._msgSocket.registerForReceive(self._handleMessage)
+        if pooled:
+            self._msgPool      = ObjectPool(CoapMessage)
+            self._resourcePool = ObjectPool(SosResourceTransfer)
+            self._newMessage   = self._msgPool.acquire
+            self._newResource  = self._resourcePool.acquire
+        else:
+            self._msgPool      = None
+            self._resourcePool = None
+            self._newMessage   = CoapMessage
+            self._newResource  = SosResourceTransfer
+            
+        if msgSocket:
+            self._msgSocket = msgSocket
+        else:
+            self._msgSocket = EndpointManager(self._createSocket, lazyDecode=lazyDecode,
+                                                                  msgPool=self._msgPool,
+                                                                  bufsize=bufsize,
+                                                                  zeroCopy=zeroCopy,
+                                                                  readBatch=readBatch,
+                                                                  reusePort=reusePort,
+                                                                  rcvbuf=rcvbuf,
+                                                                  sndbuf=sndbuf,
+                                                                  dropStats=dropStats)
+            self._msgSocket.addEndpoint(port)
+            for endpoint in (endpoints or ()):
+                # (host, port[, scopeId])
+                self._msgSocket.addEndpoint(endpoint[1], endpoint[0], *endpoint[2:])
+        if readBatch > 1:
+            self._msgSocket.registerForReceiveBatch(self._handleBatch)
+        else:
+            self._msgSocket.registerForReceive(self._handleMessage)
+        if not msgSocket:
+            self._msgSocket.registerForQueueLevel(self._handleQueueLevel)
         
         self._resourceGetHook  = EventHook()
         self._resourcePutHook  = EventHook()
         self._resourcePostHook = EventHook()
+        self._staticResources  = {}
+        self._maxBlockSzx      = maxBlockSzx
+        self._blockTransfers   = {}
+        self._handlerThreads   = handlerThreads
+        self._handlerBacklog   = handlerBacklog
+        self._handlerPool      = None
+        self._blockingHooks    = set()
+        self._router           = ResourceRouter()
+        self._observeRegistry  = ObserveRegistry()
+        self._notifyBatch      = notifyBatch
+        self._notifications    = collections.deque()
+        self._notifyScheduled  = False
+        self._statsPath        = None
+        self._requestCount     = 0
+        self._ignoreCount      = 0
+        self._errorCount       = 0
+        self._admission        = admission
+        self._dedup            = dedup
+        self._responseCache    = responseCache
         
         # A random start is recommended in Sec. 4.4.
         self._nextMessageId = random.randint(0, 0xFFFF)
                 
-    def registerForResourceGet(self, handler):
-        self._resourceGetHook.register(handler)
+    def _createSocket(self, port, **kwargs):
+        '''Creates the MessageSocket for the server; see MessageSocket.__init__()
+        for the arguments. Allows a subclass to use another transport.
+        '''
+        return MessageSocket(port, **kwargs)
+        
+    def addEndpoint(self, port, host='', scopeId=0):
+        '''Listens for requests on another socket, in the same event loop. The
+        server replies to a request on the socket it arrived on.
+        
+        :param port: int Local port
+        :param host: str Local IPv6 address, like a link-local address; '' for 
+                         any interface
+        :param scopeId: int Interface index for a link-local host
+        :returns: The new message socket
+        :raises RuntimeError: If a msgSocket was provided to the constructor
+        '''
+        if not isinstance(self._msgSocket, EndpointManager):
+            raise RuntimeError('Server socket not created by server')
+        return self._msgSocket.addEndpoint(port, host, scopeId)
+                
+    def registerForResourceGet(self, handler, blocking=False, path=None):
+        self._registerHandler(self._resourceGetHook, RequestCode.GET, handler,
+                              blocking, path)
+        
+    def registerForResourcePost(self, handler, blocking=False, path=None):
+        self._registerHandler(self._resourcePostHook, RequestCode.POST, handler,
+                              blocking, path)
+        
+    def registerForResourcePut(self, handler, blocking=False, path=None):
+        self._registerHandler(self._resourcePutHook, RequestCode.PUT, handler,
+                              blocking, path)
         
-    def registerForResourcePost(self, handler):
-        self._resourcePostHook.register(handler)
+    def _registerHandler(self, hook, method, handler, blocking, path):
+        '''Registers a handler for an event, or for the event at a path pattern.
+        If blocking, all handlers for the event, or the handler for the path, run
+        on the handler thread pool.
         
-    def registerForResourcePut(self, handler):
-        self._resourcePutHook.register(handler)
+        :param path: str Path pattern; see router.ResourceRouter.add()
+        '''
+        if path is None:
+            hook.register(handler)
+        else:
+            self._router.add(method, path, handler, blocking)
+        if blocking:
+            if not self._handlerPool:
+                self._msgSocket.enableCallFromThread()
+                self._handlerPool = HandlerPool(self._msgSocket.callFromThread,
+                                                threads=self._handlerThreads,
+                                                maxPending=self._handlerBacklog)
+            if path is None:
+                self._blockingHooks.add(hook)
+        
+    def registerStaticResource(self, path, value, mediaType=MediaType.TextPlain):
+        '''Defines a resource with a fixed value for GET requests. Serializes the 
+        reply once, and then serves the resource without triggering the 
+        ResourceGet event.
+        
+        :param path: str URI path for the resource, like '/ver'
+        :param value: str or bytes/bytearray Value for the resource; a str is 
+                      encoded with the default string encoding
+        :param mediaType: int :const:`soscoap.MediaType` for the Content-Format
+                          option, or None to omit the option
+        '''
+        msg             = CoapMessage()
+        msg.messageType = MessageType.ACK
+        msg.codeClass   = CodeClass.Success
+        msg.codeDetail  = SuccessResponseCode.Content
+        if isinstance(value, str):
+            msg.payloadStr(value)
+        else:
+            msg.payload = value
+        if mediaType is not None:
+            msg.addOption( CoapOption(OptionType.ContentFormat, mediaType) )
+            
+        self._staticResources[path] = MessageTemplate(msg)
         
+    def unregisterStaticResource(self, path):
+        del self._staticResources[path]
+        
+    def stats(self):
+        '''Returns a dict of counters for the requests handled, and the counters
+        from the message socket; see MessageSocket.stats(). Includes the count 
+        of requests waiting for a blocking handler as 'handlerBacklog', and of
+        requests shed by admission control as 'shed', of duplicate requests
+        as 'duplicates', of resource 'observers', and of requests served from 
+        the response cache as 'cacheHits'.
+        '''
+        stats = self._msgSocket.stats()
+        stats['requests'] = self._requestCount
+        stats['ignored']  = self._ignoreCount
+        stats['errors']   = self._errorCount
+        stats['handlerBacklog'] = self._handlerPool.pendingCount() \
+                                            if self._handlerPool else 0
+        stats['shed'] = self._admission.shedCount if self._admission else 0
+        stats['duplicates'] = self._dedup.duplicateCount if self._dedup else 0
+        stats['observers']  = self._observeRegistry.count()
+        stats['cacheHits']  = self._responseCache.hitCount if self._responseCache else 0
+        return stats
+        
+    def registerStatsResource(self, path='/stats'):
+        '''Serves the stats() counters as JSON for GET requests to the provided
+        path, without triggering the ResourceGet event.
+        
+        :param path: str URI path for the resource
+        '''
+        self._statsPath = path
+        
+    def _handleQueueLevel(self, isHigh, depth, endpoint=None):
+        '''Stops reading requests while the outgoing queue is high, so replies
+        can drain. Clients retransmit confirmable requests that the socket drops
+        meanwhile. Pauses only the endpoint with the high queue, so the others 
+        keep reading.
+
+        :param endpoint: Message socket that triggered the event; None for the
+                         server's only socket
+        '''
+        target = endpoint or self._msgSocket
+        if isHigh:
+            target.pauseReading()
+        else:
+            target.resumeReading()
+            
+    def _handleBatch(self, messages):
+        '''Handles a list of requests read together from the socket.'''
+        handleMessage = self._handleMessage
+        for message in messages:
+            handleMessage(message)
+            
     def _handleMessage(self, message):
+        if message.messageType == MessageType.RST:
+            # Rejects a notification
+            if self._observeRegistry.removeByMessageId(message.address,
+                                                       message.messageId):
+                log.debug('Removed observer on Reset')
+            return
+        if message.messageType == MessageType.ACK:
+            # Acknowledges a confirmable notification
+            if self._observeRegistry.acknowledge(message.address, message.messageId):
+                log.debug('Observer acknowledged notification')
+            return
+        if self._dedup and message.messageType == MessageType.CON:
+            reply = self._dedup.check(message.address, message.messageId)
+            if reply is not None:
+                if reply:
+                    log.debug('Repeating reply to duplicate request')
+                    (message.endpoint or self._msgSocket).sendRaw(reply, message.address)
+                else:
+                    log.debug('Ignoring duplicate of request in progress')
+                return
+                
         resource = None
+        self._requestCount += 1
         try:
-            resource = SosResourceTransfer(message.absolutePath(), 
-                                           sourceAddress=message.address)
-
-            # only reads the first query segment
-            queryList  = message.findOption(OptionType.UriQuery)
-            resource.pathQuery = queryList[0].value if len(queryList) else None
-
+            if message.unknownCritical is not None:
+                # Sec. 5.4.1: reject a CON request; ignore a NON request
+                log.info('Rejecting request with unknown critical option {0}'.format(
+                                                                message.unknownCritical))
+                if message.messageType == MessageType.CON:
+                    self._sendClientError(message, ClientResponseCode.BadOption)
+                return
+                
+            path = message.absolutePath()
+            if message.codeDetail == RequestCode.GET and path in self._staticResources:
+                log.debug('Handling static resource GET request...')
+                self._sendStaticReply(message, self._staticResources[path])
+                return
+            if message.codeDetail == RequestCode.GET and path == self._statsPath:
+                self._sendStatsReply(message)
+                return
 
+            block2  = None
+            observe = None
+            etags   = None
             if message.codeDetail == RequestCode.GET:
+                block2 = message.findOption(OptionType.Block2)
+                block2 = block2[0].value if block2 else None
+                if block2 and self._continueBlockTransfer(message, block2):
+                    return
+                observe = message.findOption(OptionType.Observe)
+                observe = observe[0].value if observe else None
+                etags   = [bytes(option.value) for option in message.findOption(OptionType.ETag)]
+                if (self._responseCache and block2 is None and observe is None 
+                                        and self._sendCachedReply(message, path, etags)):
+                    return
+            elif self._responseCache:
+                self._responseCache.invalidate(path)
+
+            method = message.codeDetail
+            if method == RequestCode.GET:
                 log.debug('Handling resource GET request...')
                 # Retrieve requested resource via event, and send reply
-                self._resourceGetHook.trigger(resource)
-                self._sendGetReply(message, resource)
+                hook, sendReply, replyArgs = self._resourceGetHook, self._sendGetReply, (
+                                                                     block2, observe, etags)
 
-            elif message.codeDetail == RequestCode.PUT:
+            elif method == RequestCode.PUT:
                 log.debug('Handling resource PUT request...')
-                resource.value = message.typedPayload()
-                self._resourcePutHook.trigger(resource)
-                self._sendPutReply(message, resource)
+                hook, sendReply, replyArgs = self._resourcePutHook, self._sendPutReply, ()
 
-            elif message.codeDetail == RequestCode.POST:
+            elif method == RequestCode.POST:
                 log.debug('Handling resource POST request...')
-                resource.value = message.typedPayload()
-                self._resourcePostHook.trigger(resource)
-                self._sendPostReply(message, resource)
+                hook, sendReply, replyArgs = self._resourcePostHook, self._sendPostReply, ()
+            else:
+                if len(self._router):
+                    route, params, code = self._router.lookup(method, path)
+                    self._sendClientError(message, code)
+                return
+                
+            handler, blocking, params, code = self._resolveHandler(method, path, hook)
+            if not handler:
+                log.debug('No route for {0}'.format(path))
+                self._sendClientError(message, code)
+                return
+                    
+            if self._admission and not self._admission.admit(self._msgSocket.queueDepth()):
+                self._sendServiceUnavailable(message, self._admission.retryAfter)
+                return
+
+            resource = self._newResource(path, sourceAddress=message.address)
+
+            # only reads the first query segment
+            resource.pathQuery = message.firstQuery()
+            resource.params    = params
+            if method != RequestCode.GET:
+                resource.setValueSource(message)
+
+            if probe.dispatch.enabled:
+                probe.dispatch.fire(message.address, None, message)
+            start = probe.clock() if probe.handler.enabled or self._admission else 0
+
+            if blocking:
+                self._offload(message, resource, handler, start, sendReply, replyArgs)
+                # Released when the handler completes
+                resource = None
+                return
+            
+            handler(resource)
+            self._recordHandlerTime(message, start)
+            sendReply(message, resource, *replyArgs)
 
         except IgnoreRequestException:
             log.info('Ignoring request')
+            self._ignoreCount += 1
         except:
             log.exception('Error handling message; will send error reply')
+            self._errorCount += 1
             self._sendErrorReply(message, resource)
+        finally:
+            if self._resourcePool and resource:
+                self._resourcePool.release(resource)
+            
+    def _resolveHandler(self, method, path, hook):
+        '''Finds the handler for a request. A route for the path takes precedence 
+        over the handlers registered for the event.
+        
+        :param hook: EventHook for the request method
+        :returns: tuple (handler, blocking, params, None) if found; otherwise 
+                  (None, False, None, ClientResponseCode) for the error reply
+        '''
+        handler  = hook.trigger
+        blocking = hook in self._blockingHooks
+        params   = None
+        if len(self._router):
+            route, params, code = self._router.lookup(method, path)
+            if route:
+                handler, blocking = route.handler, route.blocking
+            elif not len(hook):
+                return (None, False, None, code)
+        return (handler, blocking, params, None)
+            
+    def _offload(self, request, resource, handler, start, sendReply, replyArgs):
+        '''Runs the provided handler for the resource on the handler pool, and
+        sends the reply on the loop when complete.
+        
+        :param handler: function Accepts the resource; for example the trigger()
+                                 method of an EventHook
+        :param sendReply: function Sends the reply for a successful handler
+        :param replyArgs: tuple Additional arguments for sendReply
+        '''
+        # Decode the value on the loop, and detach it and the request from the
+        # receive buffer and message pool.
+        value = resource.value
+        if isinstance(value, memoryview):
+            resource.value = bytes(value)
+        request = self._detachRequest(request)
+        
+        def task():
+            handler(resource)
+            
+        def onDone(error):
+            try:
+                self._recordHandlerTime(request, start)
+                if self._responseCache and request.codeDetail != RequestCode.GET:
+                    # A GET may have cached the old representation meanwhile.
+                    self._responseCache.invalidate(resource.path)
+                if error is None:
+                    sendReply(request, resource, *replyArgs)
+                elif isinstance(error, IgnoreRequestException):
+                    log.info('Ignoring request')
+                    self._ignoreCount += 1
+                else:
+                    log.error('Error handling message; will send error reply: {0!r}'.format(
+                                                                                error))
+                    self._errorCount += 1
+                    self._sendErrorReply(request, resource)
+            finally:
+                if self._resourcePool:
+                    self._resourcePool.release(resource)
+                    
+        if not self._handlerPool.submit(request.address, task, onDone):
+            log.warning('Handler backlog full; rejecting request')
+            self._sendServiceUnavailable(request)
+            if self._resourcePool:
+                self._resourcePool.release(resource)
+                
+    def _detachRequest(self, request):
+        '''Returns a copy of the provided request with the attributes needed to
+        reply, independent of the receive buffer and message pool.'''
+        detached             = CoapMessage(request.address)
+        detached.endpoint    = request.endpoint
+        detached.messageType = request.messageType
+        detached.messageId   = request.messageId
+        detached.tokenLength = request.tokenLength
+        detached.token       = bytes(request.token) if request.token else None
+        return detached
+            
+    def _recordHandlerTime(self, request, start):
+        '''Fires the 'handler' probe, if enabled, with the elapsed time since 
+        start, and adds the time to admission control.'''
+        if probe.handler.enabled or self._admission:
+            elapsed = probe.clock() - start
+            if probe.handler.enabled:
+                probe.handler.fire(request.address, None, elapsed)
+            if self._admission:
+                self._admission.recordHandlerTime(elapsed)
             
     def _createReplyTemplate(self, request, resource):
         '''Creates a reply message with common code for any reply
         
         :returns: CoapMessage Created reply
         '''
-        msg             = CoapMessage()
+        msg             = self._newMessage()
         msg.address     = request.address
+        msg.endpoint    = request.endpoint
         msg.tokenLength = request.tokenLength
-        msg.token       = request.token
-        msg.codeClass   = resource.resultClass
-        msg.codeDetail  = resource.resultCode
-                                    
+        # Copy, since the request token may be a view over a receive buffer
+        msg.token       = bytes(request.token) if request.token else None
+        if resource:
+            msg.codeClass   = resource.resultClass
+            msg.codeDetail  = resource.resultCode
+        msg.messageType, msg.messageId = self._replyTypeAndId(request)
+        return msg
+        
+    def _replyTypeAndId(self, request):
+        '''Returns the message type and message ID for a reply to the provided 
+        request.
+        
+        :returns: tuple (MessageType, message ID)
+        '''
         if request.messageType == MessageType.CON:
-            msg.messageType = MessageType.ACK
-            msg.messageId   = request.messageId
+            return (MessageType.ACK, request.messageId)
         elif request.messageType == MessageType.NON:
-            msg.messageType = MessageType.NON
-            msg.messageId   = self._popMessageId()
+            return (MessageType.NON, self._popMessageId())
         else:
-            log.error('Sending Reset due to unexpected messageType: {0}', msg.messageType)
-            msg.messageType = MessageType.RST
-            msg.messageId   = request.messageId
+            log.error('Sending Reset due to unexpected messageType: {0}'.format(
+                                                                request.messageType))
+            return (MessageType.RST, request.messageId)
             
-        return msg
+    def _sendStaticReply(self, request, template):
+        '''Sends a reply to a GET request for a static resource.
+        
+        :param request: CoapMessage
+        :param template: MessageTemplate Reply content
+        '''
+        msgType, msgId = self._replyTypeAndId(request)
+        msgBytes       = template.render(msgType, msgId, request.token)
+        if self._dedup and msgType == MessageType.ACK:
+            self._dedup.store(request.address, msgId, msgBytes)
+        (request.endpoint or self._msgSocket).sendRaw(msgBytes, request.address)
+    
+    def _sendCachedReply(self, request, path, etags):
+        '''Sends a reply to a GET request from the response cache, if fresh. 
+        Sends 2.03 Valid if the request includes the cached ETag.
+        
+        :param etags: list ETag option values from the request, as bytes
+        :returns: bool True if sent
+        '''
+        entry = self._responseCache.lookup(path, request.firstQuery())
+        if not entry:
+            return False
+        if entry.valid and entry.etag in etags:
+            self._sendStaticReply(request, entry.valid)
+        else:
+            self._sendStaticReply(request, entry.content)
+        return True
+        
+    def _sendStatsReply(self, request):
+        '''Sends a reply to a GET request for the stats resource.'''
+        msg            = self._createReplyTemplate(request, None)
+        msg.codeClass  = CodeClass.Success
+        msg.codeDetail = SuccessResponseCode.Content
+        msg.payloadStr(json.dumps(self.stats(), sort_keys=True))
+        msg.addOption( CoapOption(OptionType.ContentFormat, MediaType.Json) )
+        
+        self._sendReply(msg)
     
-    def _sendGetReply(self, request, resource):
+    def _sendGetReply(self, request, resource, block2=None, observe=None, etags=None):
         '''Sends a reply to a GET request with the content for the provided resource.
+        Uses block-wise transfer for a producer value, or a value larger than 
+        one block.
         
         :param request: CoapMessage
+        :param block2: int Block2 option value from the request, or None
+        :param observe: int Observe option value from the request, or None; 0 to
+                        register the requester as an observer, 1 to deregister
+        :param etags: list ETag option values from the request, as bytes, or None
         '''
         if not resource.resultClass:
             resource.resultClass = CodeClass.Success
             resource.resultCode  = SuccessResponseCode.Content
+        if observe == 1:
+            self._observeRegistry.remove(resource.path, request.address, request.token)
+            
+        # Only add option for a string, and assume text-plain format.
+        mediaType = MediaType.TextPlain if resource.type == 'string' else None
+        value     = resource.value
+        
+        if resource.resultClass == CodeClass.Success:
+            if block.isProducer(value):
+                self._startBlockTransfer(request, value, mediaType, block2)
+                return
+            if isinstance(value, (str, bytes, bytearray)) and (block2 is not None or
+                                    len(value) > block.blockSize(self._maxBlockSzx)):
+                self._startBlockTransfer(request, value, mediaType, block2)
+                return
 
         msg         = self._createReplyTemplate(request, resource)
-        msg.payload = bytearray(resource.value, soscoap.BYTESTR_ENCODING) \
+        msg.payload = bytearray(value, soscoap.BYTESTR_ENCODING) \
                                     if resource.type == 'string' \
-                                    else resource.value
+                                    else value
                                     
-        # Only add option for a string, and assume text-plain format.
-        if resource.type == 'string':
-            msg.addOption( CoapOption(OptionType.ContentFormat, MediaType.TextPlain) )
+        if resource.resultClass == CodeClass.Success:
+            if observe == 0:
+                sequence = self._observeRegistry.add(resource.path, request)
+                msg.addOption( CoapOption(OptionType.Observe, sequence) )
+            if resource.etag:
+                msg.addOption( CoapOption(OptionType.ETag, resource.etag) )
+            if resource.maxAge is not None:
+                msg.addOption( CoapOption(OptionType.MaxAge, resource.maxAge) )
+                if self._responseCache and observe is None:
+                    self._responseCache.store(resource.path, resource.pathQuery, 
+                                              msg.payload, mediaType, resource.maxAge,
+                                              resource.etag)
+            if resource.etag and etags and bytes(resource.etag) in etags:
+                msg.codeDetail = SuccessResponseCode.Valid
+                msg.payload    = None
+                mediaType      = None
+        if mediaType is not None:
+            msg.addOption( CoapOption(OptionType.ContentFormat, mediaType) )
+            
+        self._sendReply(msg)
+        
+    def notify(self, path):
+        '''Sends the current representation of the resource at the provided path
+        to its observers. Triggers the ResourceGet event once for the resource,
+        with None for its sourceAddress, and serializes the notification once. 
+        Sends up to notifyBatch notifications immediately, and the rest on later
+        passes of the loop. A handler runs on the loop, even if registered as
+        blocking. Call from the loop thread.
+        
+        A reply that is not successful ends the observation for all observers.
+        
+        :param path: str URI path for the resource
+        :returns: int Count of observers to notify
+        '''
+        removed = self._observeRegistry.removeUnacknowledged()
+        if removed:
+            log.info('Removed {0} observers for unacknowledged notification'.format(
+                                                                        removed))
+        observers = self._observeRegistry.observers(path)
+        if not observers:
+            return 0
+            
+        handler, blocking, params, code = self._resolveHandler(RequestCode.GET, path,
+                                                               self._resourceGetHook)
+        resource        = SosResourceTransfer(path)
+        resource.params = params
+        try:
+            if not handler:
+                resource.resultClass = CodeClass.ClientError
+                resource.resultCode  = code
+            else:
+                handler(resource)
+        except IgnoreRequestException:
+            log.info('Ignoring notification for {0}'.format(path))
+            return 0
+        except:
+            log.exception('Error handling notification; will send error notification')
+            resource.resultClass = CodeClass.ServerError
+            resource.resultCode  = ServerResponseCode.InternalServerError
+        
+        msg             = CoapMessage()
+        msg.messageType = MessageType.NON
+        if not resource.resultClass:
+            resource.resultClass = CodeClass.Success
+            resource.resultCode  = SuccessResponseCode.Content
+        msg.codeClass  = resource.resultClass
+        msg.codeDetail = resource.resultCode
+        if resource.resultClass == CodeClass.Success:
+            msg.addOption( CoapOption(OptionType.Observe, 
+                                      self._observeRegistry.nextSequence(path)) )
+            if resource.type == 'string':
+                msg.payload = bytearray(resource.value, soscoap.BYTESTR_ENCODING)
+                msg.addOption( CoapOption(OptionType.ContentFormat, MediaType.TextPlain) )
+            else:
+                msg.payload = resource.value
+        else:
+            self._observeRegistry.removePath(path)
+            
+        self._notifications.append([MessageTemplate(msg), path, observers, 0])
+        if not self._notifyScheduled:
+            self._sendNotifications()
+        return len(observers)
+        
+    def _sendNotifications(self):
+        '''Sends up to notifyBatch pending notifications, and schedules another
+        pass on the loop to send any remaining.'''
+        self._notifyScheduled = False
+        notifications = self._notifications
+        registry      = self._observeRegistry
+        budget        = self._notifyBatch
+        now           = time.time()
+        confirmBefore = now - registry.conInterval
+        while notifications and budget > 0:
+            entry = notifications[0]
+            template, path, observers, index = entry
+            end   = min(index + budget, len(observers))
+            for observer in observers[index:end]:
+                msgId   = self._popMessageId()
+                confirm = observer.confirmedAt <= confirmBefore
+                msgType = MessageType.CON if confirm else MessageType.NON
+                (observer.endpoint or self._msgSocket).sendRaw(
+                                template.render(msgType, msgId, observer.token),
+                                observer.address)
+                registry.recordNotified(msgId, path, observer, confirm, now)
+            budget -= end - index
+            if end == len(observers):
+                notifications.popleft()
+            else:
+                entry[3] = end
+                
+        if notifications:
+            self._msgSocket.enableCallFromThread()
+            self._msgSocket.callFromThread(self._sendNotifications)
+            self._notifyScheduled = True
+        
+    def _startBlockTransfer(self, request, source, mediaType, block2):
+        '''Starts a Block2 transfer for the provided representation, and sends the
+        block requested, or the first block. For a request past the first block,
+        the representation is regenerated, so skips to the requested block.
+        
+        :param source: Producer or bytes-like representation; see BlockProducer
+        :param mediaType: int Content-Format for the representation, or None
+        :param block2: int Block2 option value from the request, or None
+        '''
+        if block2 is None:
+            num, szx = 0, self._maxBlockSzx
+        else:
+            num, more, szx = block.decodeBlock(block2)
+            
+        producer = BlockProducer(source, mediaType)
+        if num and not producer.skip(num * block.blockSize(szx)):
+            log.info('Block2 num {0} past end of representation'.format(num))
+            producer.close()
+            self._sendClientError(request, ClientResponseCode.BadOption)
+            return
+            
+        self._sendBlock(request, producer, num, szx)
+        
+    def _continueBlockTransfer(self, request, block2):
+        '''Sends the next block of the Block2 transfer in progress for the request's
+        peer and token, without triggering the ResourceGet event.
+        
+        :param block2: int Block2 option value from the request
+        :returns: bool True if sent; False if no transfer in progress for the
+                  requested block, so the request must be handled from the start
+        '''
+        key      = (request.address, bytes(request.token) if request.token else b'')
+        producer = self._blockTransfers.get(key)
+        if not producer:
+            return False
+            
+        num, more, szx = block.decodeBlock(block2)
+        if producer.offset != num * block.blockSize(szx):
+            # Restart, or repeated request after a lost reply
+            log.debug('Block2 num {0} out of sequence; restarting transfer'.format(num))
+            del self._blockTransfers[key]
+            producer.close()
+            return False
             
-        self._msgSocket.send(msg)
+        self._sendBlock(request, producer, num, szx, key)
+        return True
+        
+    def _sendBlock(self, request, producer, num, szx, key=None):
+        '''Sends a reply with the next block from the provided producer, and 
+        retains the producer if more blocks follow.
+        
+        :param num: int Block number, at the producer's current offset
+        :param szx: int Block size exponent requested; limited to _maxBlockSzx
+        :param key: tuple Key for the producer in _blockTransfers, or None if not
+                    yet known
+        '''
+        if szx > self._maxBlockSzx:
+            # Client accepts smaller blocks; renumber for the size
+            num = (num << szx) >> self._maxBlockSzx
+            szx = self._maxBlockSzx
+        data, more = producer.readBlock(block.blockSize(szx))
+        
+        msg            = self._createReplyTemplate(request, None)
+        msg.codeClass  = CodeClass.Success
+        msg.codeDetail = SuccessResponseCode.Content
+        msg.payload    = data
+        if producer.mediaType is not None:
+            msg.addOption( CoapOption(OptionType.ContentFormat, producer.mediaType) )
+        msg.addOption( CoapOption(OptionType.Block2, block.encodeBlock(num, more, szx)) )
+        
+        if not key:
+            key = (request.address, bytes(request.token) if request.token else b'')
+        if more:
+            now = time.time()
+            if key not in self._blockTransfers:
+                self._purgeBlockTransfers(now)
+            producer.expires = now + soscoap.EXCHANGE_LIFETIME
+            self._blockTransfers[key] = producer
+        else:
+            self._blockTransfers.pop(key, None)
+            producer.close()
+            
+        self._sendReply(msg)
+        
+    def _purgeBlockTransfers(self, now):
+        '''Discards any Block2 transfer idle past its expiry time.'''
+        expired = [key for key, producer in self._blockTransfers.items()
+                       if producer.expires < now]
+        for key in expired:
+            self._blockTransfers.pop(key).close()
+            
+    def _sendClientError(self, request, code):
+        '''Sends a client error reply, for example for a path without a route.
+        
+        :param code: ClientResponseCode Detail for the reply
+        '''
+        msg            = self._createReplyTemplate(request, None)
+        msg.codeClass  = CodeClass.ClientError
+        msg.codeDetail = code
+        
+        self._sendReply(msg)
     
     def _sendPostReply(self, request, resource):
         '''Sends a reply to a POST request confirming the changes.
@@ -170,7 +921,7 @@ class CoapServer(object):
 
         msg = self._createReplyTemplate(request, resource)
         
-        self._msgSocket.send(msg)
+        self._sendReply(msg)
     
     def _sendPutReply(self, request, resource):
         '''Sends a reply to a PUT request confirming the changes.
@@ -183,8 +934,22 @@ class CoapServer(object):
 
         msg = self._createReplyTemplate(request, resource)
         
-        self._msgSocket.send(msg)
+        self._sendReply(msg)
     
+    def _sendServiceUnavailable(self, request, maxAge=None):
+        '''Sends a reply when the server is too busy to handle a request.
+        
+        :param maxAge: int Seconds for the client to wait before it retries, or
+                           None to omit the Max-Age option
+        '''
+        msg            = self._createReplyTemplate(request, None)
+        msg.codeClass  = CodeClass.ServerError
+        msg.codeDetail = ServerResponseCode.ServiceUnavailable
+        if maxAge is not None:
+            msg.addOption( CoapOption(OptionType.MaxAge, maxAge) )
+        
+        self._sendReply(msg)
+        
     def _sendErrorReply(self, request, resource):
         '''Sends a reply when an error has occurred in processing.
         
@@ -195,7 +960,25 @@ class CoapServer(object):
         msg.codeClass   = CodeClass.ServerError
         msg.codeDetail  = ServerResponseCode.InternalServerError
         
-        self._msgSocket.send(msg)
+        self._sendReply(msg)
+        
+    def _sendReply(self, msg):
+        '''Queues the provided reply to send on the socket the request arrived 
+        on, and releases it to the message pool after it is sent.
+        '''
+        msgSocket = msg.endpoint or self._msgSocket
+        if self._dedup and msg.messageType == MessageType.ACK:
+            # Serialize here to cache the reply for a duplicate request.
+            msgBytes = bytes(serialize(msg))
+            self._dedup.store(msg.address, msg.messageId, msgBytes)
+            msgSocket.sendRaw(msgBytes, msg.address)
+            if self._msgPool:
+                self._msgPool.release(msg)
+            return
+        if self._msgPool:
+            msgSocket.send(msg, self._msgPool.release)
+        else:
+            msgSocket.send(msg)
         
     def _popMessageId(self):
         '''Returns the next sequential message ID, and increments'''
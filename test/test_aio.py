@@ -0,0 +1,78 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the aio module. Exchanges a request and response over the loopback
+interface.
+'''
+import asyncio
+import logging
+import pytest
+import soscoap as coap
+from   soscoap import aio
+from   soscoap.message import CoapMessage
+from   soscoap.message import CoapOption
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def getTestResource(resource):
+    '''Callback for server ResourceGet event.'''
+    assert resource.path == '/ver'
+    resource.value = '0.1'
+    resource.type  = 'string'
+
+def test_getResource():
+    '''Tests a GET request from an AsyncCoapClient to an AsyncCoapServer.'''
+    async def run():
+        server = aio.AsyncCoapServer(port=0)
+        server.registerForResourceGet(getTestResource)
+        serving = asyncio.ensure_future(server.serve())
+        await server.open()
+        port = server._msgSocket.getsockname()[1]
+        
+        client   = aio.AsyncCoapClient(sourcePort=0, dest=('::1', port))
+        response = asyncio.get_event_loop().create_future()
+        client.registerForResponse(response.set_result)
+        await client.open()
+        
+        msg             = CoapMessage(('::1', port, 0, 0))
+        msg.messageType = coap.MessageType.NON
+        msg.codeClass   = coap.CodeClass.Request
+        msg.codeDetail  = coap.RequestCode.GET
+        msg.messageId   = client._popMessageId()
+        msg.addOption( CoapOption(coap.OptionType.UriPath, 'ver') )
+        client.send(msg)
+        
+        reply = await asyncio.wait_for(response, 2)
+        await client.close()
+        await server.close()
+        await serving
+        return reply
+        
+    reply = asyncio.new_event_loop().run_until_complete(run())
+    assert reply.codeDetail == coap.SuccessResponseCode.Content
+    assert reply.strPayload() == '0.1'
+
+def test_unsupportedOptions():
+    '''Rejects socket options asyncio does not apply, and callFromThread() before
+    open().'''
+    for kwargs in ({'rcvbuf': 65536}, {'sndbuf': 65536}, {'dropStats': True}):
+        with pytest.raises(ValueError):
+            aio.AsyncCoapServer(port=0, **kwargs)
+    
+    with pytest.raises(RuntimeError):
+        aio.AsyncMessageSocket(0).callFromThread(log.debug, 'not open')
+
+def test_start():
+    '''start() for the asyncore loop is not available.'''
+    server = aio.AsyncCoapServer(port=0)
+    with pytest.raises(RuntimeError):
+        server.start()
+    
+    client = aio.AsyncCoapClient()
+    with pytest.raises(RuntimeError):
+        client.start()
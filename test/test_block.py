@@ -0,0 +1,41 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the block module.
+'''
+import io
+import logging
+from   soscoap import block
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def test_blockOption():
+    '''Tests packing and unpacking of a block option value.'''
+    value = block.encodeBlock(5, True, 2)
+    assert value == 0x5A
+    assert block.decodeBlock(value) == (5, True, 2)
+    assert block.blockSize(2) == 64
+
+def test_fileProducer():
+    '''Tests reading blocks from a file-like producer.'''
+    producer = block.BlockProducer(io.BytesIO(b'x' * 40))
+    assert block.isProducer(producer._source)
+    
+    assert producer.readBlock(16) == (b'x' * 16, True)
+    assert producer.readBlock(16) == (b'x' * 16, True)
+    assert producer.readBlock(16) == (b'x' * 8, False)
+    assert producer.offset == 40
+
+def test_skip():
+    '''Tests skipping to a block, for string chunks and a bytes value.'''
+    producer = block.BlockProducer(iter(['abc', 'def', 'ghi']))
+    assert producer.skip(4)
+    assert producer.readBlock(4) == (b'efgh', True)
+    
+    producer = block.BlockProducer(b'abcdef')
+    assert not producer.skip(8)
@@ -0,0 +1,140 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the cache module, and its use by the server.
+'''
+import logging
+import soscoap as coap
+from   soscoap.cache import ResponseCache
+from   soscoap.loopback import LoopbackNetwork
+from   soscoap.message import CoapMessage
+from   soscoap.message import CoapOption
+from   soscoap import message as msgModule
+from   soscoap.server import CoapServer
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def optionValue(msg, optionType):
+    option = msg.findOption(optionType)
+    return option[0].value if option else None
+
+def test_lookup():
+    '''Counts down Max-Age, and expires an entry.'''
+    cache = ResponseCache(maxEntries=1)
+    cache.store('/temp', None, b'20', None, 60, b'\x01', now=100.0)
+    
+    entry = cache.lookup('/temp', None, now=130.5)
+    reply = msgModule.buildFrom(entry.content.render(coap.MessageType.ACK, 1))
+    assert optionValue(reply, coap.OptionType.MaxAge) == 30
+    assert reply.payload == b'20'
+    reply = msgModule.buildFrom(entry.valid.render(coap.MessageType.ACK, 1))
+    assert reply.codeDetail == coap.SuccessResponseCode.Valid
+    assert not reply.payload
+    
+    assert cache.lookup('/temp', 'q', now=130.5) is None
+    # Full until the entry expires
+    cache.store('/hum', None, b'50', None, 60, now=150.0)
+    assert cache.lookup('/hum', None, now=150.0) is None
+    cache.store('/hum', None, b'50', None, 60, now=160.0)
+    assert cache.lookup('/hum', None, now=160.0) is not None
+    assert cache.lookup('/temp', None, now=160.0) is None
+    
+def test_server():
+    '''Serves a repeated GET from the cache, replies 2.03 to a matching ETag, and 
+    invalidates on PUT.'''
+    net    = LoopbackNetwork()
+    server = CoapServer(net.socket(5683), responseCache=ResponseCache())
+    calls  = []
+    def getTemp(resource):
+        calls.append(resource.path)
+        resource.type   = 'string'
+        resource.value  = '20'
+        resource.maxAge = 60
+        resource.etag   = b'\x07'
+    server.registerForResourceGet(getTemp)
+    server.registerForResourcePut(lambda resource: None)
+    client  = net.socket(0)
+    replies = []
+    client.registerForReceive(replies.append)
+    
+    def request(code, messageId, etag=None):
+        msg             = CoapMessage(net.address(5683))
+        msg.messageType = coap.MessageType.CON
+        msg.codeClass   = coap.CodeClass.Request
+        msg.codeDetail  = code
+        msg.messageId   = messageId
+        if etag:
+            msg.addOption( CoapOption(coap.OptionType.ETag, etag) )
+        msg.addOption( CoapOption(coap.OptionType.UriPath, 'temp') )
+        client.send(msg)
+        net.run()
+        return replies[-1]
+    
+    reply = request(coap.RequestCode.GET, 1)
+    assert reply.strPayload() == '20'
+    assert optionValue(reply, coap.OptionType.MaxAge) == 60
+    assert optionValue(reply, coap.OptionType.ETag)   == b'\x07'
+    
+    reply = request(coap.RequestCode.GET, 2)
+    assert reply.messageId    == 2
+    assert reply.strPayload() == '20'
+    reply = request(coap.RequestCode.GET, 3, etag=b'\x07')
+    assert reply.codeDetail == coap.SuccessResponseCode.Valid
+    assert len(calls) == 1
+    assert server.stats()['cacheHits'] == 2
+    
+    request(coap.RequestCode.PUT, 4)
+    reply = request(coap.RequestCode.GET, 5, etag=b'\x07')
+    assert reply.codeDetail == coap.SuccessResponseCode.Valid
+    assert len(calls) == 2
+    
+def test_blockingPut():
+    '''Invalidates when a blocking PUT handler completes, after a GET has cached
+    the old representation meanwhile.'''
+    import threading
+    import time
+    net    = LoopbackNetwork()
+    server = CoapServer(net.socket(5683), responseCache=ResponseCache())
+    temp   = ['20']
+    def getTemp(resource):
+        resource.type   = 'string'
+        resource.value  = temp[0]
+        resource.maxAge = 60
+    release = threading.Event()
+    def putTemp(resource):
+        release.wait(2)
+        temp[0] = '21'
+    server.registerForResourceGet(getTemp)
+    server.registerForResourcePut(putTemp, blocking=True)
+    client  = net.socket(0)
+    replies = []
+    client.registerForReceive(replies.append)
+    
+    def send(code, messageId):
+        msg             = CoapMessage(net.address(5683))
+        msg.messageType = coap.MessageType.CON
+        msg.codeClass   = coap.CodeClass.Request
+        msg.codeDetail  = code
+        msg.messageId   = messageId
+        msg.addOption( CoapOption(coap.OptionType.UriPath, 'temp') )
+        client.send(msg)
+        net.run()
+    
+    send(coap.RequestCode.PUT, 1)
+    send(coap.RequestCode.GET, 2)
+    assert [reply.strPayload() for reply in replies] == ['20']
+    
+    release.set()
+    deadline = time.time() + 2
+    while len(replies) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+        net.run()
+    assert replies[1].codeDetail == coap.SuccessResponseCode.Changed
+    
+    send(coap.RequestCode.GET, 3)
+    assert replies[2].strPayload() == '21'
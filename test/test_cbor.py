@@ -0,0 +1,59 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the cbor module. Examples from Appendix A of RFC 7049.
+'''
+import logging
+import pytest
+from   soscoap import cbor
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+examples = [
+    (0,                  b'\x00'),
+    (23,                 b'\x17'),
+    (24,                 b'\x18\x18'),
+    (1000,               b'\x19\x03\xe8'),
+    (1000000000000,      b'\x1b\x00\x00\x00\xe8\xd4\xa5\x10\x00'),
+    (-1000,              b'\x39\x03\xe7'),
+    (1.1,                b'\xfb\x3f\xf1\x99\x99\x99\x99\x99\x9a'),
+    (False,              b'\xf4'),
+    (None,               b'\xf6'),
+    (b'\x01\x02\x03\x04', b'\x44\x01\x02\x03\x04'),
+    (u'\u00fc',          b'\x62\xc3\xbc'),
+    ([1, [2, 3], [4, 5]], b'\x83\x01\x82\x02\x03\x82\x04\x05'),
+    ({'a': 1},           b'\xa1\x61\x61\x01'),
+]
+
+def test_roundTrip():
+    for value, encoded in examples:
+        assert cbor.dumps(value) == encoded
+        assert cbor.loads(encoded) == value
+        
+def test_decodeOnly():
+    '''Decodes forms that the encoder does not produce'''
+    # half precision
+    assert cbor.loads(b'\xf9\x3c\x00') == 1.0
+    assert cbor.loads(b'\xf9\xc4\x00') == -4.0
+    # indefinite length
+    assert cbor.loads(b'\x9f\x01\x82\x02\x03\xff') == [1, [2, 3]]
+    assert cbor.loads(b'\x7f\x65\x73\x74\x72\x65\x61\x64\x6d\x69\x6e\x67\xff') == 'streaming'
+    assert cbor.loads(b'\xbf\x61\x61\x01\xff') == {'a': 1}
+    # tag 1, epoch time
+    assert cbor.loads(b'\xc1\x1a\x51\x4b\x67\xb0') == 1363896240
+    
+def test_malformed():
+    for data in (b'\x19\x03', b'\x62\xc3', b'\x00\x00', b'\xff', b'\x1c'):
+        with pytest.raises(ValueError):
+            cbor.loads(data)
+    # Indefinite length integer or tag; array or map as a map key; text chunk
+    # in an indefinite byte string
+    for data in (b'\x1f', b'\x3f', b'\xdf\x00', b'\xa1\x80\x00', b'\xa1\xa0\x00',
+                 b'\x5f\x61\x61\xff'):
+        with pytest.raises(ValueError):
+            cbor.loads(data)
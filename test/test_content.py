@@ -0,0 +1,51 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the content module.
+'''
+import logging
+import pytest
+import soscoap as coap
+from   soscoap import cbor
+from   soscoap import content
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def test_json():
+    payload = content.encode(coap.MediaType.Json, {'v': -69})
+    assert payload == b'{"v":-69}'
+    assert content.decode(coap.MediaType.Json, payload) == {'v': -69}
+    
+def test_senmlJson():
+    '''Resolves base values, from Section 5.1.2 of RFC 8428'''
+    payload = (b'[{"bn":"urn:dev:ow:10e2073a01080063:","bt":1.276020076001e+09,'
+               b'"bu":"A","bver":5,"n":"voltage","u":"V","v":120.1},'
+               b'{"n":"current","t":-5,"v":1.2}]')
+    records = content.decode(coap.MediaType.SenmlJson, payload)
+    
+    assert records[0] == {'n': 'urn:dev:ow:10e2073a01080063:voltage', 
+                          't': 1.276020076001e+09, 'u': 'V', 'v': 120.1}
+    assert records[1] == {'n': 'urn:dev:ow:10e2073a01080063:current', 
+                          't': 1.276020071001e+09, 'u': 'A', 'v': 1.2}
+    
+def test_senmlCbor():
+    records = [{'n': 'temp', 'u': 'Cel', 'v': 23.5}]
+    payload = content.encode(coap.MediaType.SenmlCbor, records)
+    
+    assert cbor.loads(payload) == [{0: 'temp', 1: 'Cel', 2: 23.5}]
+    assert content.decode(coap.MediaType.SenmlCbor, payload) == records
+    
+def test_senmlLabels():
+    '''Keeps an application label starting with 'b', and an unknown CBOR label'''
+    payload = cbor.dumps([{-2: 'dev:', 0: 'batt', 2: 3.7, 'batt': 'low', 23: 1}])
+    assert content.decode(coap.MediaType.SenmlCbor, payload) == [
+                            {'n': 'dev:batt', 'v': 3.7, 'batt': 'low', 23: 1}]
+    
+def test_unknown():
+    with pytest.raises(NotImplementedError):
+        content.decode(coap.MediaType.Exi, b'\x00')
@@ -0,0 +1,93 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the dedup module.
+'''
+import logging
+from   soscoap.dedup import DuplicateCache
+from   soscoap.loopback import LoopbackNetwork
+from   soscoap import message as msgModule
+from   soscoap.server import CoapServer
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+peer = ('::1', 42683, 0, 0)
+
+def test_check():
+    '''Detects a duplicate, and returns its reply when stored.'''
+    cache = DuplicateCache()
+    assert cache.check(peer, 1, 10.0) is None
+    assert cache.check(peer, 1, 10.0) == b''
+    cache.store(peer, 1, bytearray(b'\x60\x44\x00\x01'))
+    assert cache.check(peer, 1, 11.0) == b'\x60\x44\x00\x01'
+    assert cache.check(('::1', 42684, 0, 0), 1, 11.0) is None
+    assert cache.duplicateCount == 2
+    
+def test_expiry():
+    '''Expires entries after the lifetime, and evicts the oldest past the 
+    maximum count.'''
+    cache = DuplicateCache(maxEntries=3, lifetime=100)
+    for mid in range(4):
+        cache.check(peer, mid, 10.0 + mid)
+    assert len(cache._replies) == 3
+    assert cache.check(peer, 0, 20.0) is None
+    
+    # mid 1 evicted for mid 0; mid 2 expired
+    assert cache.check(peer, 2, 112.5) is None
+    assert cache.check(peer, 3, 112.5) == b''
+    assert len(cache._replies) == 3
+    
+def test_serverDuplicate():
+    '''A retransmitted PUT gets the original reply without running the handler.'''
+    net    = LoopbackNetwork()
+    server = CoapServer(net.socket(5683), dedup=DuplicateCache())
+    values = []
+    server.registerForResourcePut(lambda resource: values.append(resource.value))
+    client  = net.socket(0)
+    replies = []
+    client.registerForReceive(lambda msg: replies.append(msgModule.serialize(msg)))
+    
+    # CON PUT /ver, text payload '1'
+    request = msgModule.buildFrom(b'\x40\x03\x6C\x29\xB3\x76\x65\x72\xFF\x31', 
+                                  address=net.address(5683))
+    client.send(request)
+    client.send(request)
+    net.run()
+    client.send(request)
+    net.run()
+    
+    assert len(values)  == 1
+    assert len(replies) == 3
+    assert replies[0] == replies[1] == replies[2]
+    stats = server.stats()
+    assert stats['requests']   == 1
+    assert stats['duplicates'] == 2
+    
+def test_ring():
+    '''Keeps arrival order as the ring buffers fill, empty, and wrap.'''
+    cache = DuplicateCache(maxEntries=4, lifetime=10)
+    cache.check(peer, 1, 0.0)
+    cache.check(peer, 2, 1.0)
+    # Expires both before the buffers are full
+    assert cache.check(peer, 3, 20.0) is None
+    assert len(cache._replies) == 1
+    for mid in range(4, 9):
+        cache.check(peer, mid, 20.0 + mid)
+    assert cache._count == len(cache._replies) == 4
+    # mids 5-8 remain, and 5 expires first
+    assert sorted(cache.check(peer, mid, 31.0) for mid in (5, 6, 7, 8)) == [b''] * 4
+    # mid 5 expired, so mid 3 fits; then mid 5 again evicts mid 6
+    assert cache.check(peer, 3, 35.5) is None
+    assert cache.check(peer, 6, 35.5) == b''
+    assert cache.check(peer, 5, 35.5) is None
+    assert cache.check(peer, 6, 35.5) is None
+    
+    # Packs IPv6 and other host text
+    cache.store(peer, 8, b'\x60\x44\x00\x08')
+    assert cache.check(('::1', 42683), 8, 35.5) == b'\x60\x44\x00\x08'
+    assert cache.check(('fe80::1%eth0', 42683), 8, 35.5) is None
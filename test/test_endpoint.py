@@ -0,0 +1,68 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the endpoint module.
+'''
+import logging
+import socket
+import soscoap as coap
+from   soscoap.server import CoapServer
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def getTestResource(resource):
+    resource.type  = 'string'
+    resource.value = '0.1'
+
+def test_replyEndpoint():
+    '''A server with two endpoints replies on the socket the request arrived on.'''
+    server = CoapServer(port=0, endpoints=[('::1', 0)])
+    server.registerForResourceGet(getTestResource)
+    endpoints = server._msgSocket.endpoints
+    assert len(endpoints) == 2
+    port = endpoints[1].socket.getsockname()[1]
+    
+    client = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    client.settimeout(1.0)
+    try:
+        # CON GET /ver
+        client.sendto(b'\x40\x01\x6C\x29\xB3\x76\x65\x72', ('::1', port))
+        endpoints[1].handle_read_event()
+        endpoints[1].handle_write_event()
+        
+        reply, address = client.recvfrom(1024)
+        assert address[1] == port
+        assert reply[:4] == b'\x60\x45\x6C\x29'
+        
+        stats = server.stats()
+        assert stats['endpoints'] == 2
+        assert stats['received']  == 1
+        assert stats['sent']      == 1
+    finally:
+        client.close()
+        server._msgSocket.close()
+
+def test_queueLevelEndpoint():
+    '''A high outgoing queue pauses reading only on its own endpoint.'''
+    server = CoapServer(port=0, endpoints=[('::1', 0)])
+    endpoints = server._msgSocket.endpoints
+    try:
+        endpoints[0]._queueLevelHook.trigger(True, 4)
+        endpoints[1]._queueLevelHook.trigger(True, 4)
+        assert endpoints[0].readPaused
+        assert endpoints[1].readPaused
+        
+        # First endpoint drains; second endpoint still high
+        endpoints[0]._queueLevelHook.trigger(False, 0)
+        assert not endpoints[0].readPaused
+        assert endpoints[1].readPaused
+        
+        endpoints[1]._queueLevelHook.trigger(False, 0)
+        assert not endpoints[1].readPaused
+    finally:
+        server._msgSocket.close()
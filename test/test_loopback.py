@@ -0,0 +1,74 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the loopback module.
+'''
+import logging
+import soscoap as coap
+from   soscoap.client import CoapClient
+from   soscoap.loopback import LoopbackNetwork
+from   soscoap import message as msgModule
+from   soscoap.server import CoapServer
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def getTestResource(resource):
+    resource.type  = 'string'
+    resource.value = '0.1'
+    
+def createGet(net, port, messageId):
+    '''Returns a CON GET /ver request for the endpoint at port.'''
+    msg = msgModule.buildFrom(b'\x40\x01\x00\x00\xB3\x76\x65\x72', 
+                              address=net.address(port))
+    msg.messageId = messageId
+    return msg
+
+def test_serverClient():
+    '''A client receives the reply from a server over the network.'''
+    net    = LoopbackNetwork(latency=0.01)
+    server = CoapServer(net.socket(5683))
+    server.registerForResourceGet(getTestResource)
+    client = CoapClient(net.socket(0))
+    responses = []
+    client.registerForResponse(responses.append)
+    
+    for i in range(10):
+        client.send(createGet(net, 5683, i))
+    assert net.run() == 20
+    assert [msg.messageId for msg in responses] == list(range(10))
+    assert responses[0].payload == b'0.1'
+    assert abs(net.now - 0.02) < 1e-9
+    assert server.stats()['requests'] == 10
+    
+def test_lossAndReorder():
+    '''Loss and reordering are repeatable for a seed.'''
+    def runOnce():
+        net      = LoopbackNetwork(latency=0.01, loss=0.2, reorder=0.3, seed=7)
+        source   = net.socket(0)
+        dest     = net.socket(5683)
+        received = []
+        dest.registerForReceive(lambda msg: received.append(msg.messageId))
+        for i in range(100):
+            source.send(createGet(net, 5683, i))
+        net.run()
+        return received
+        
+    received = runOnce()
+    assert received == runOnce()
+    assert 60 < len(received) < 100
+    assert received != sorted(received)
+    
+def test_queueSize():
+    '''Drops datagrams past the queue size for an endpoint.'''
+    net    = LoopbackNetwork(queueSize=4)
+    source = net.socket(0)
+    dest   = net.socket(5683)
+    for i in range(6):
+        source.send(createGet(net, 5683, i))
+    assert net.run() == 4
+    assert dest.stats()['kernelDrops'] == 2
@@ -10,6 +10,7 @@ import logging
 import pytest
 import soscoap as coap
 from   soscoap import message as msgModule
+import sys
 
 logging.basicConfig(filename='test.log', level=logging.DEBUG, 
                     format='%(asctime)s %(module)s %(message)s')
@@ -138,3 +139,216 @@ def test_PayloadFormat():
     assert optList[0].type == coap.OptionType.ContentFormat
 
     assert msg.typedPayload() == '2014,125'
+
+@pytest.mark.skipif(sys.version_info.major == 2, reason='copies on Python2')
+def test_zeroCopy():
+    '''Token and payload are views over the source bytes rather than copies'''
+    source = bytearray(b'\x51\x02\xe9\xe8\x7b\xb3\x72\x73\x73\x11\x32\xff\x7b\x22\x76\x22\x3a\x2d\x36\x39\x7d')
+    msg    = msgModule.buildFrom(source)
+    
+    assert msg.token   == b'\x7b'
+    assert msg.payload == b'{"v":-69}'
+    
+    source[4] = 0x7c
+    assert msg.token == b'\x7c'
+    
+def test_retain():
+    '''Retained token, options, and payload are copies of the source bytes'''
+    source = bytearray(b'\x51\x02\xe9\xe8\x7b\xb3\x72\x73\x73\x11\x32\xff\x7b\x22\x76\x22\x3a\x2d\x36\x39\x7d')
+    msg    = msgModule.buildFrom(source, lazy=True)
+    assert msg.absolutePath() == '/rss'
+    msg.retain()
+    
+    source[:] = bytearray(len(source))
+    assert msg.token   == b'\x7b'
+    assert msg.payload == b'{"v":-69}'
+    assert msg.contentFormat() == coap.MediaType.Json
+    
+def test_uintValue():
+    '''Reads a multi-byte uint option value'''
+    # NON PUT /ping with 2-byte Max-Age of 0x0102
+    msg = msgModule.buildFrom(b'\x50\x03\x03\x17\xb4\x70\x69\x6e\x67\x32\x01\x02')
+    
+    assert msg.findOption(coap.OptionType.MaxAge)[0].value == 258
+    assert msgModule.buf2int(b'\x01\x00\x00') == 65536
+
+def test_lazyOptions():
+    '''Decodes options on demand for a lazily built message'''
+    msg = msgModule.buildFrom(jsonContentPostMsg, lazy=True)
+    
+    assert msg._rawOptions == [(11, 6, 9), (12, 10, 11)]
+    assert msg.absolutePath() == '/rss'
+    assert isinstance(msg._rawOptions[0], msgModule.CoapOption)
+    assert msg._rawOptions[1] == (12, 10, 11)
+    
+    assert msg.jsonPayload()['v'] == -69
+    assert len(msg.options)         == 2
+    assert msg.options[1].value     == coap.MediaType.Json
+    assert msg._rawOptions          is None
+
+    assert msgModule.serialize(msg) == jsonContentPostMsg
+
+# NON GET /ver?q=1 with ETag 0x0102 and Block2 num 2, szx 6; deltas 4, 11, 8
+queryMsg = b'\x50\x01\x03\x17\x42\x01\x02\x73\x76\x65\x72\x43\x71\x3d\x31\x81\x26'
+
+def test_optionTable():
+    '''Reads opaque, string and Block options, and reserializes'''
+    msg = msgModule.buildFrom(queryMsg)
+    
+    assert [o.type for o in msg.options] == [coap.OptionType.ETag, 
+                                             coap.OptionType.UriPath,
+                                             coap.OptionType.UriQuery,
+                                             coap.OptionType.Block2]
+    assert msg.options[0].value == b'\x01\x02'
+    assert msg.options[2].value == 'q=1'
+    assert msg.options[3].value == 0x26
+    
+    assert msgModule.serialize(msg) == queryMsg
+    
+def test_extendedOption():
+    '''Reads and writes option delta and length extended bytes'''
+    msg = msgModule.CoapMessage()
+    msg.messageType = coap.MessageType.NON
+    msg.codeDetail  = coap.RequestCode.GET
+    msg.addOption(msgModule.CoapOption(coap.OptionType.UriPath, 'a'*20))
+    msg.addOption(msgModule.CoapOption(coap.OptionType.ProxyUri, 'b'*300))
+    
+    msgBytes = msgModule.serialize(msg)
+    # Uri-Path: delta 11, length 13+7
+    assert msgBytes[4:6] == b'\xbd\x07'
+    # Proxy-Uri: delta 13+11, length 269+31
+    assert msgBytes[26:30] == b'\xde\x0b\x00\x1f'
+    
+    msg = msgModule.buildFrom(msgBytes)
+    assert msg.absolutePath() == '/' + 'a'*20
+    assert msg.findOption(coap.OptionType.ProxyUri)[0].value == 'b'*300
+    
+def test_unknownOption():
+    '''Reads an option number not in the OptionType enum as opaque'''
+    msg = msgModule.buildFrom(b'\x50\x01\x03\x17\xd1\x96\x33')
+    
+    assert msg.options[0].type.number == 163
+    assert msg.options[0].value       == b'\x33'
+    
+def test_unknownCriticalOption():
+    '''Records an unknown critical option without registering its number'''
+    count = len(msgModule._optionCodecs)
+    # Option 9, odd so critical
+    for lazy in (False, True):
+        msg = msgModule.buildFrom(b'\x40\x01\x00\x01\x91\x00', lazy=lazy)
+        assert msg.unknownCritical == 9
+    # Option 2, even so elective
+    msg = msgModule.buildFrom(b'\x40\x01\x00\x01\x21\x00')
+    assert msg.unknownCritical is None
+    assert msg.options[0].value == b'\x00'
+    assert len(msgModule._optionCodecs) == count
+    
+    # Option number 269 + 0xFFFF is past the maximum
+    with pytest.raises(RuntimeError):
+        msgModule.buildFrom(b'\x40\x01\x00\x01\xe0\xff\xff')
+    
+def test_badOptionNibble():
+    '''Rejects a delta of 15 that is not a payload marker'''
+    with pytest.raises(RuntimeError):
+        msgModule.buildFrom(b'\x50\x01\x03\x17\xf1\x33')
+
+def test_serializeInto():
+    '''Writes each sample message into a caller-supplied buffer'''
+    for msgBytes in (verGetMsg, tokenMsg, pingPutMsg, textContentPutMsg, 
+                     binaryContentPutMsg, jsonContentPostMsg, queryMsg):
+        msg  = msgModule.buildFrom(msgBytes)
+        size = msgModule.serializedSize(msg)
+        assert size == len(msgBytes)
+        
+        buffer = bytearray(size + 2)
+        assert msgModule.serializeInto(msg, buffer, 2) == size
+        assert buffer[2:] == msgBytes
+        
+    # Fails at any write past the end, without growing the buffer
+    for length in (3, 6, size - 1):
+        buffer = bytearray(length)
+        with pytest.raises(IndexError):
+            msgModule.serializeInto(msg, buffer)
+        assert len(buffer) == length
+        
+def test_serializeExtended():
+    '''serializeInto() matches serialize() for extended options and multi-byte uint'''
+    msg = msgModule.CoapMessage()
+    msg.messageType = coap.MessageType.ACK
+    msg.codeClass   = coap.CodeClass.ServerError
+    msg.codeDetail  = coap.ServerResponseCode.ServiceUnavailable
+    msg.addOption(msgModule.CoapOption(coap.OptionType.UriPath, 'a'*20))
+    msg.addOption(msgModule.CoapOption(coap.OptionType.MaxAge, 0x010000))
+    msg.addOption(msgModule.CoapOption(coap.OptionType.ProxyUri, 'b'*300))
+    
+    buffer = bytearray(msgModule.serializedSize(msg))
+    msgModule.serializeInto(msg, buffer)
+    assert buffer == msgModule.serialize(msg)
+    # 5.03
+    assert buffer[1] == 0xA3
+
+@pytest.mark.parametrize('useNumpy', [False, 
+                                      pytest.param(True, marks=pytest.mark.skipif(
+                                          msgModule.numpy is None, reason='no NumPy'))])
+def test_batch(useNumpy):
+    '''Reads many messages into columns'''
+    batch = msgModule.buildBatch([verGetMsg, tokenMsg, jsonContentPostMsg, b'\x40\x01', 
+                                  queryMsg], useNumpy=useNumpy)
+    
+    assert len(batch) == 5
+    assert list(batch.valid)       == [1, 1, 1, 0, 1]
+    assert list(batch.messageType[:3]) == [coap.MessageType.CON, coap.MessageType.CON,
+                                           coap.MessageType.NON]
+    assert list(batch.codeDetail[:3])  == [coap.RequestCode.GET, coap.RequestCode.GET,
+                                           coap.RequestCode.POST]
+    assert batch.messageId[0]   == 27689
+    assert batch.tokenLength[1] == 1
+    
+    assert batch.path(0) == '/ver'
+    assert batch.path(1) == '/ver'
+    assert batch.path(2) == '/rss'
+    assert batch.path(4) == '/ver'
+    assert batch.contentFormat[0] == -1
+    assert batch.contentFormat[2] == coap.MediaType.Json
+    assert batch.payload(0) == None
+    assert batch.payload(2) == b'{"v":-69}'
+    
+def test_batchOffsets():
+    '''Reads messages from a concatenated buffer'''
+    source = verGetMsg + pingPutMsg
+    batch  = msgModule.buildBatch(source, [0, len(verGetMsg), len(source)])
+    
+    assert batch.path(1)    == '/ping'
+    assert batch.payload(1) == b'2014,125'
+
+def test_optionIndex():
+    '''Finds options by number, and invalidates memoized values on change'''
+    msg = msgModule.buildFrom(queryMsg)
+    
+    assert msg.absolutePath()  == '/ver'
+    assert msg.firstQuery()    == 'q=1'
+    assert msg.contentFormat() == None
+    
+    # insert out of order
+    msg.addOption(msgModule.CoapOption(coap.OptionType.UriPath, 'minor'))
+    msg.addOption(msgModule.CoapOption(coap.OptionType.ContentFormat, 
+                                       coap.MediaType.Json))
+    assert [o.type.number for o in msg.options] == [4, 11, 11, 12, 15, 23]
+    assert msg.absolutePath()  == '/ver/minor'
+    assert msg.contentFormat() == coap.MediaType.Json
+    assert len(msg.findOption(coap.OptionType.UriPath)) == 2
+    
+    msg.options = []
+    assert msg.absolutePath() == None
+    assert msg.findOption(coap.OptionType.UriPath) == []
+
+def test_typedPayloadMemo():
+    '''Decodes the payload once, and again only if it changes'''
+    msg   = msgModule.buildFrom(jsonContentPostMsg)
+    value = msg.typedPayload()
+    
+    assert value == {'v': -69}
+    assert msg.typedPayload() is value
+    
+    msg.payloadStr('{"v":-70}')
+    assert msg.typedPayload() == {'v': -70}
@@ -7,6 +7,7 @@
 Tests for the msgsock module. The main issues are send and receive handling.
 '''
 import asyncore
+import errno
 from   flexmock import flexmock
 import logging
 import pytest
@@ -92,3 +93,143 @@ def test_send():
     # Cannot use the lower level asyncore.write(). It wraps an empty except handler, 
     # and so we cannot fail the test.
     msgSocket.handle_write_event()
+    
+def test_sendRaw():
+    (createStubSocket()
+        .should_receive('sendto')
+        .replace_with( lambda bytestr,addr: verifySend(bytestr,addr) ))
+
+    msgSocket = msgsock.MessageSocket()
+    msgSocket.sendRaw(b'\x60\x45\x00\x00\xff\x30\x2e\x31', ('::1', 42683, 0, 0))
+    msgSocket.handle_write_event()
+    
+def test_receiveZeroCopy():
+    '''Tests receive into a reusable buffer, and retain of a message.'''
+    source = b'\x41\x01\x6C\x29\x66\xB3\x76\x65\x72\xff\x30\x2e\x31'
+    def recvInto(buf):
+        buf[:len(source)] = source
+        return (len(source), ('::1', 42683, 0, 0))
+        
+    createStubSocket().should_receive('recvfrom_into').replace_with(recvInto)
+    
+    received = []
+    def reader(msg):
+        assert isinstance(msg.payload, memoryview)
+        assert msg.absolutePath() == '/ver'
+        msg.retain()
+        received.append(msg)
+    
+    msgSocket = msgsock.MessageSocket(bufsize=64, zeroCopy=True)
+    msgSocket.registerForReceive(reader)
+    msgSocket.handle_read_event()
+    
+    assert len(msgSocket._recvBuffers) == 1
+    buf = msgSocket._recvBuffers[0]
+    assert len(buf) == 64
+    buf[:] = bytearray(64)
+    
+    msg = received[0]
+    assert msg.token   == b'\x66'
+    assert msg.payload == b'0.1'
+    
+def test_bufsize():
+    createStubSocket()
+    with pytest.raises(ValueError):
+        msgsock.MessageSocket(bufsize=msgsock.MAX_BUFSIZE+1)
+    
+def test_receiveBatch():
+    '''Tests a batch read that drains the socket.'''
+    datagrams = [(b'\x40\x01\x6C\x29\xB3\x76\x65\x72', ('::1', 42683, 0, 0)),
+                 (b'\x40', ('::1', 42683, 0, 0)),
+                 (b'\x40\x01\x6C\x2A\xB3\x76\x65\x72', ('::1', 42684, 0, 0))]
+    def recvfrom(bufsize):
+        if datagrams:
+            return datagrams.pop(0)
+        raise socket.error(errno.EAGAIN, 'no data')
+        
+    createStubSocket().should_receive('recvfrom').replace_with(recvfrom)
+    
+    batches  = []
+    received = []
+    msgSocket = msgsock.MessageSocket(readBatch=8)
+    msgSocket.registerForReceiveBatch(lambda msgs: batches.append(list(msgs)))
+    msgSocket.registerForReceive(received.append)
+    msgSocket.handle_read_event()
+    
+    # Skips the short datagram
+    assert len(batches) == 1
+    assert [msg.messageId for msg in batches[0]] == [0x6C29, 0x6C2A]
+    assert received == batches[0]
+    
+def test_sendQueue():
+    '''Tests multi-message flush, retry on EAGAIN, and queue level events.'''
+    sent = []
+    def sendto(bytestr, addr):
+        if len(sent) == 3:
+            sent.append(None)
+            raise socket.error(errno.EAGAIN, 'buffer full')
+        sent.append(bytes(bytestr))
+        
+    createStubSocket().should_receive('sendto').replace_with(sendto)
+    
+    levels    = []
+    msgSocket = msgsock.MessageSocket(highWater=4, lowWater=1)
+    msgSocket.registerForQueueLevel(lambda isHigh, depth: levels.append((isHigh, depth)))
+    
+    for i in range(5):
+        msgSocket.sendRaw(bytearray([0x60, 0x45, 0, i]), ('::1', 42683, 0, 0))
+    assert levels == [(True, 4)]
+    
+    msgSocket.handle_write_event()
+    assert sent[:3] == [b'\x60\x45\x00\x00', b'\x60\x45\x00\x01', b'\x60\x45\x00\x02']
+    assert msgSocket.queueDepth() == 2
+    assert levels == [(True, 4)]
+    
+    msgSocket.handle_write_event()
+    assert sent[-1] == b'\x60\x45\x00\x04'
+    assert levels == [(True, 4), (False, 0)]
+    assert not msgSocket.writable()
+    
+def test_callFromThread():
+    '''Tests a call from another thread, which wakes the loop.'''
+    import threading
+    msgSocket = msgsock.MessageSocket(0)
+    msgSocket.enableCallFromThread()
+    
+    calls  = []
+    thread = threading.Thread(target=msgSocket.callFromThread, args=(calls.append, 1))
+    thread.start()
+    thread.join()
+    try:
+        asyncore.loop(timeout=1.0, count=1)
+        assert calls == [1]
+    finally:
+        msgSocket._waker.handle_close()
+        msgSocket.close()
+    
+def test_stats():
+    '''Tests counters, including kernel drops on a small receive buffer.'''
+    msgSocket = msgsock.MessageSocket(0, rcvbuf=4096, dropStats=True)
+    port      = msgSocket.socket.getsockname()[1]
+    received  = []
+    msgSocket.registerForReceive(received.append)
+    
+    client = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    try:
+        # NON GET /ver, with padding payload
+        for i in range(100):
+            client.sendto(b'\x50\x01\x6C\x29\xB3\x76\x65\x72\xff' + b'x' * 500, 
+                          ('::1', port))
+        msgSocket.handle_read_event()
+        
+        stats = msgSocket.stats()
+        assert len(received)     == 1
+        assert stats['received'] == 1
+        assert stats['rcvbuf']   >= 4096
+        assert stats['sendQueue'] == 0
+        if stats['kernelDrops'] is not None:
+            assert stats['kernelDrops'] > 0
+            assert stats['receiveQueueBytes'] > 0
+    finally:
+        client.close()
+        msgSocket.close()
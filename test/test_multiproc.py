@@ -0,0 +1,98 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the multiproc module. Runs worker processes on the loopback interface.
+'''
+import logging
+import pytest
+import socket
+import time
+import soscoap as coap
+from   soscoap import multiproc
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'),
+                                reason='requires SO_REUSEPORT')
+
+def getTestResource(resource):
+    '''Callback for server ResourceGet event.'''
+    resource.value = '0.1'
+    resource.type  = 'string'
+    
+def freePort():
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    sock.bind(('::1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def test_serverGroup():
+    '''Tests a request to a group, and restart of a worker.'''
+    port  = freePort()
+    group = multiproc.CoapServerGroup(workers=2, port=port, statsInterval=0.1,
+                                      restartDelay=0)
+    group.registerForResourceGet(getTestResource)
+    group.startWorkers()
+    try:
+        client = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        client.settimeout(0.2)
+        # NON GET /ver; retry until a worker is listening
+        for i in range(25):
+            client.sendto(b'\x50\x01\x6C\x29\xB3\x76\x65\x72', ('::1', port))
+            try:
+                reply = client.recv(1024)
+                break
+            except socket.timeout:
+                pass
+        client.close()
+        assert reply.endswith(b'\xff0.1')
+        
+        deadline = time.time() + 5
+        while group.stats().get('requests', 0) < 1 and time.time() < deadline:
+            group.supervise(0.1)
+        assert group.stats()['requests'] >= 1
+        
+        group._workers[0].terminate()
+        group._workers[0].join()
+        group.supervise()
+        stats = group.stats()
+        assert stats['restarts'] == 1
+        assert stats['workers']  == 2
+        assert stats['requests'] >= 1
+    finally:
+        group.stop()
+        
+class StubProcess(object):
+    '''Stands in for a worker multiprocessing.Process.'''
+    def __init__(self, pid, alive):
+        self.pid   = pid
+        self.alive = alive
+        
+    def is_alive(self):
+        return self.alive
+
+def test_statsGauges():
+    '''Sums counters from all workers, but gauges only from live workers.'''
+    group = multiproc.CoapServerGroup(workers=2)
+    def report(requests, sendQueue):
+        return {'requests': requests, 'sent': requests, 'sendQueue': sendQueue,
+                'observers': 1, 'rcvbuf': 4096, 'kernelDrops': None}
+    # Worker 0 restarted; pid 10 exited
+    group._workers    = [StubProcess(12, True), StubProcess(11, True)]
+    group._statsByPid = {10: report(5, 3), 11: report(2, 1), 12: report(1, 0)}
+    group._restarts   = 1
+    
+    stats = group.stats()
+    assert stats['requests']  == 8
+    assert stats['sent']      == 8
+    assert stats['sendQueue'] == 1
+    assert stats['observers'] == 2
+    assert stats['rcvbuf']    == 8192
+    assert 'kernelDrops' not in stats
+    assert stats['workers']   == 2
@@ -0,0 +1,191 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for Observe support, in the observe and server modules.
+'''
+import logging
+import soscoap as coap
+from   soscoap.loopback import LoopbackNetwork
+from   soscoap import message as msgModule
+from   soscoap.message import CoapMessage
+from   soscoap.message import CoapOption
+from   soscoap.observe import CON_INTERVAL
+from   soscoap.server import CoapServer
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def createObserve(net, token, observe):
+    '''Returns a CON GET /temp request with an Observe option.'''
+    msg             = CoapMessage(net.address(5683))
+    msg.messageType = coap.MessageType.CON
+    msg.codeClass   = coap.CodeClass.Request
+    msg.codeDetail  = coap.RequestCode.GET
+    msg.messageId   = token[0]
+    msg.token       = token
+    msg.tokenLength = len(token)
+    msg.addOption( CoapOption(coap.OptionType.UriPath, 'temp') )
+    msg.addOption( CoapOption(coap.OptionType.Observe, observe) )
+    return msg
+    
+def observeValue(msg):
+    option = msg.findOption(coap.OptionType.Observe)
+    return option[0].value if option else None
+
+def test_notify():
+    '''Registers observers, and sends notifications in batches.'''
+    net     = LoopbackNetwork()
+    server  = CoapServer(net.socket(5683), notifyBatch=2)
+    temp    = ['20']
+    def getTemp(resource):
+        resource.type  = 'string'
+        resource.value = temp[0]
+    server.registerForResourceGet(getTemp)
+    
+    received = {}
+    clients  = []
+    for i in range(5):
+        client = net.socket(0)
+        token  = bytes(bytearray([i + 1, 0xAA]))
+        received[token] = []
+        client.registerForReceive(lambda msg: received[bytes(msg.token)].append(msg))
+        client.send(createObserve(net, token, 0))
+        clients.append(client)
+    net.run()
+    assert server.stats()['observers'] == 5
+    for messages in received.values():
+        assert observeValue(messages[0]) == 0
+        assert messages[0].strPayload()  == '20'
+    
+    temp[0] = '21'
+    assert server.notify('/temp') == 5
+    # Sends two now, and schedules the rest
+    assert net.pending() == 2
+    net.run()
+    for messages in received.values():
+        assert len(messages) == 2
+        notification = messages[1]
+        assert notification.messageType == coap.MessageType.NON
+        assert observeValue(notification) == 1
+        assert notification.strPayload()  == '21'
+    assert server.notify('/none') == 0
+    
+    # Deregister one, and reject a notification with Reset for another
+    clients[0].send(createObserve(net, bytes(bytearray([1, 0xAA])), 1))
+    net.run()
+    reset             = CoapMessage(net.address(5683))
+    reset.messageType = coap.MessageType.RST
+    reset.messageId   = received[bytes(bytearray([2, 0xAA]))][1].messageId
+    clients[1].send(reset)
+    net.run()
+    assert server.stats()['observers'] == 3
+    
+    server.notify('/temp')
+    net.run()
+    assert [len(received[token]) for token in sorted(received)] == [3, 2, 3, 3, 3]
+
+def test_confirmableNotify():
+    '''Sends a confirmable notification daily, and removes an observer that does
+    not acknowledge it.'''
+    net    = LoopbackNetwork()
+    server = CoapServer(net.socket(5683))
+    def getTemp(resource):
+        resource.type  = 'string'
+        resource.value = '20'
+    server.registerForResourceGet(getTemp)
+    
+    received = {}
+    clients  = []
+    for i in range(2):
+        client = net.socket(0)
+        token  = bytes(bytearray([i + 1, 0xAA]))
+        received[token] = []
+        client.registerForReceive(lambda msg: received[bytes(msg.token)].append(msg))
+        client.send(createObserve(net, token, 0))
+        clients.append(client)
+    net.run()
+    registry = server._observeRegistry
+    registry.ackTimeout = 0
+    
+    # Recently registered
+    server.notify('/temp')
+    net.run()
+    assert [received[token][1].messageType for token in sorted(received)] \
+                                == [coap.MessageType.NON, coap.MessageType.NON]
+    
+    for observer in registry.observers('/temp'):
+        observer.confirmedAt -= CON_INTERVAL
+    server.notify('/temp')
+    net.run()
+    notifications = [received[token][2] for token in sorted(received)]
+    assert [msg.messageType for msg in notifications] == [coap.MessageType.CON, 
+                                                          coap.MessageType.CON]
+    
+    # Only the first client acknowledges.
+    ack             = CoapMessage(net.address(5683))
+    ack.messageType = coap.MessageType.ACK
+    ack.messageId   = notifications[0].messageId
+    clients[0].send(ack)
+    net.run()
+    
+    assert server.notify('/temp') == 1
+    net.run()
+    assert server.stats()['observers'] == 1
+    assert [len(received[token]) for token in sorted(received)] == [4, 3]
+    assert received[sorted(received)[0]][3].messageType == coap.MessageType.NON
+
+def test_replyFromOtherPeer():
+    '''Ignores a Reset or ACK for a notification sent to another peer.'''
+    net    = LoopbackNetwork()
+    server = CoapServer(net.socket(5683))
+    def getTemp(resource):
+        resource.type  = 'string'
+        resource.value = '20'
+    server.registerForResourceGet(getTemp)
+    
+    received = {}
+    clients  = []
+    for i in range(2):
+        client = net.socket(0)
+        token  = bytes(bytearray([i + 1, 0xAA]))
+        received[token] = []
+        client.registerForReceive(lambda msg: received[bytes(msg.token)].append(msg))
+        client.send(createObserve(net, token, 0))
+        clients.append(client)
+    net.run()
+    registry = server._observeRegistry
+    registry.ackTimeout = 0
+    tokens   = sorted(received)
+    
+    def reply(client, msgType, messageId):
+        msg             = CoapMessage(net.address(5683))
+        msg.messageType = msgType
+        msg.messageId   = messageId
+        client.send(msg)
+        net.run()
+    
+    # The second client rejects the notification to the first.
+    server.notify('/temp')
+    net.run()
+    first = received[tokens[0]][1]
+    reply(clients[1], coap.MessageType.RST, first.messageId)
+    assert server.stats()['observers'] == 2
+    
+    # The second client acknowledges the notification to the first, and its own.
+    registry.conInterval = 0
+    server.notify('/temp')
+    net.run()
+    first  = received[tokens[0]][2]
+    second = received[tokens[1]][2]
+    assert first.messageType == coap.MessageType.CON
+    reply(clients[1], coap.MessageType.ACK, first.messageId)
+    reply(clients[1], coap.MessageType.ACK, second.messageId)
+    
+    # The first client's notification is still unacknowledged.
+    assert server.notify('/temp') == 1
+    assert [observer.address for observer in registry.observers('/temp')] \
+                                                    == [clients[1].address]
@@ -0,0 +1,66 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the offload module.
+'''
+import logging
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from   soscoap.offload import HandlerPool
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def test_keyOrder():
+    '''Tasks for a key run in order, and report completion in order.'''
+    loopCalls = queue.Queue()
+    pool      = HandlerPool(lambda func, *args: loopCalls.put((func, args)), threads=4)
+    
+    ran  = []
+    done = []
+    for i in range(8):
+        def task(i=i):
+            # Earlier tasks run longer
+            time.sleep(0.002 * (8 - i))
+            ran.append(i)
+        pool.submit('peer', task, lambda error, i=i: done.append((i, error)))
+    
+    for i in range(8):
+        func, args = loopCalls.get(timeout=2)
+        func(*args)
+    pool.shutdown()
+    
+    assert ran  == list(range(8))
+    assert done == [(i, None) for i in range(8)]
+    assert pool.pendingCount() == 0
+
+def test_backlog():
+    '''Rejects a task past maxPending, and reports a task error.'''
+    release   = threading.Event()
+    loopCalls = queue.Queue()
+    pool      = HandlerPool(lambda func, *args: loopCalls.put((func, args)), threads=1,
+                            maxPending=2)
+    
+    def blockedTask():
+        release.wait(2)
+        raise KeyError
+    
+    errors = []
+    assert pool.submit('a', blockedTask, errors.append)
+    assert pool.submit('b', blockedTask, errors.append)
+    assert not pool.submit('c', blockedTask, errors.append)
+    
+    release.set()
+    for i in range(2):
+        func, args = loopCalls.get(timeout=2)
+        func(*args)
+    pool.shutdown()
+    assert [type(e) for e in errors] == [KeyError, KeyError]
@@ -0,0 +1,41 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the overload module.
+'''
+import logging
+from   soscoap.overload import AdmissionControl
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def test_rate():
+    '''Sheds requests past the rate limit until the next window.'''
+    ac = AdmissionControl(maxRate=3)
+    assert [ac.admit(0, 10.0) for i in range(5)] == [True]*3 + [False]*2
+    assert ac.shedCount == 2
+    assert ac.admit(0, 11.0)
+    
+def test_queue():
+    '''Sheds requests while the outgoing queue is deep.'''
+    ac = AdmissionControl(maxQueue=100)
+    assert ac.admit(99, 10.0)
+    assert not ac.admit(100, 10.0)
+    
+def test_handlerTime():
+    '''Admits one request per window while handler time is high, until the 
+    average recovers.'''
+    ac = AdmissionControl(maxHandlerTime=0.1, weight=0.5)
+    ac.recordHandlerTime(0.5)
+    assert ac.handlerTime == 0.25
+    assert ac.admit(0, 10.0)
+    assert not ac.admit(0, 10.5)
+    
+    ac.recordHandlerTime(0.0)
+    ac.recordHandlerTime(0.0)
+    assert ac.handlerTime < 0.1
+    assert ac.admit(0, 10.6)
@@ -0,0 +1,46 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the pool module.
+'''
+import logging
+import pytest
+from   soscoap import message as msgModule
+from   soscoap import pool as poolModule
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def test_reuse():
+    '''Acquires a released instance, reinitialized'''
+    pool = poolModule.ObjectPool(msgModule.CoapMessage)
+    
+    msg = pool.acquire(('::1', 42683, 0, 0))
+    assert msg.address == ('::1', 42683, 0, 0)
+    msg.messageId = 5
+    pool.release(msg)
+    
+    msg2 = pool.acquire()
+    assert msg2 is msg
+    assert msg2.address   == None
+    assert msg2.messageId == 0
+    
+def test_maxSize():
+    '''Does not retain more than maxSize idle instances'''
+    pool = poolModule.ObjectPool(msgModule.CoapMessage, maxSize=1)
+    
+    pool.release(msgModule.CoapMessage())
+    pool.release(msgModule.CoapMessage())
+    assert len(pool._free) == 1
+    
+def test_slots():
+    '''Pooled classes have no per-instance dict'''
+    from soscoap.resource import SosResourceTransfer
+    
+    for obj in (msgModule.CoapMessage(), SosResourceTransfer('/ver'),
+                msgModule.CoapOption(msgModule.coap.OptionType.UriPath, 'ver')):
+        assert not hasattr(obj, '__dict__')
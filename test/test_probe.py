@@ -0,0 +1,59 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the probe module.
+'''
+from   flexmock import flexmock
+import logging
+import pytest
+import socket
+from   soscoap import probe
+import soscoap.msgsock as msgsock
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def test_enabled():
+    '''Enables a probe only while an observer is registered'''
+    observer = lambda name, timestamp, address, size, info: None
+    assert not probe.receive.enabled
+    
+    probe.register('receive', observer)
+    assert probe.receive.enabled
+    
+    probe.unregister('receive', observer)
+    assert not probe.receive.enabled
+    
+    with pytest.raises(KeyError):
+        probe.register('foo', observer)
+    
+def test_receive():
+    '''Fires receive and decode probes when a socket reads a message'''
+    mockSocket = flexmock(
+        setblocking = lambda flag: None,
+        fileno      = lambda: 0,
+        bind        = lambda addr: None,
+        close       = lambda: None)
+    flexmock(socket.socket).new_instances(mockSocket)
+    mockSocket.should_receive('recvfrom').and_return( 
+                    (b'\x40\x01\x6C\x29\xB3\x76\x65\x72', ('::1', 42683, 0, 0)) )
+    
+    fired = []
+    observer = lambda name, timestamp, address, size, info: fired.append(
+                                                            (name, address, size, info))
+    probe.register('receive', observer)
+    probe.register('decode', observer)
+    probe.register('receive', probe.logHexDump)
+    try:
+        msgSocket = msgsock.MessageSocket()
+        msgSocket.handle_read_event()
+    finally:
+        probe.clear()
+    
+    assert [f[0] for f in fired] == ['receive', 'decode']
+    assert fired[0][1:3] == (('::1', 42683, 0, 0), 8)
+    assert fired[1][3].absolutePath() == '/ver'
@@ -20,3 +20,17 @@ def test_resource():
     rsc.value = 'bar'
 
     assert rsc.path == '/rsc/foo'
+    
+def test_valueSource():
+    '''Decodes the value from a message payload on first access'''
+    from soscoap import message as msgModule
+    # NON POST /rss with Content-Format JSON
+    msg = msgModule.buildFrom(b'\x51\x02\xe9\xe8\x7b\xb3\x72\x73\x73\x11\x32\xff'
+                              b'\x7b\x22\x76\x22\x3a\x2d\x36\x39\x7d')
+    
+    rsc = rscModule.SosResourceTransfer('/rss')
+    rsc.setValueSource(msg)
+    assert rsc._value is rscModule._UNSET
+    
+    assert rsc.value == {'v': -69}
+    assert rsc._valueSource is None
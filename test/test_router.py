@@ -0,0 +1,54 @@
+# Copyright (c) 2017, Ken Bannister
+# All rights reserved. 
+#  
+# Released under the Mozilla Public License 2.0, as published at the link below.
+# http://opensource.org/licenses/MPL-2.0
+'''
+Tests for the router module.
+'''
+import logging
+import pytest
+from   soscoap import ClientResponseCode
+from   soscoap import RequestCode
+from   soscoap.router import ResourceRouter
+
+logging.basicConfig(filename='test.log', level=logging.DEBUG, 
+                    format='%(asctime)s %(module)s %(message)s')
+log = logging.getLogger(__name__)
+
+def test_lookup():
+    '''Matches literal and parameter segments; a literal takes precedence.'''
+    router = ResourceRouter()
+    router.add(RequestCode.GET, '/', 'root')
+    router.add(RequestCode.GET, '/sensor/{id}', 'sensor')
+    router.add(RequestCode.GET, '/sensor/all', 'all')
+    router.add(RequestCode.PUT, '/sensor/{id}/value', 'value')
+    assert len(router) == 4
+    
+    route, params, code = router.lookup(RequestCode.GET, '/sensor/7')
+    assert route.handler == 'sensor' and params == {'id': '7'} and code is None
+    route, params, code = router.lookup(RequestCode.GET, '/sensor/all')
+    assert route.handler == 'all' and params == {}
+    route, params, code = router.lookup(RequestCode.PUT, '/sensor/all/value')
+    assert route.handler == 'value' and params == {'id': 'all'}
+    route, params, code = router.lookup(RequestCode.GET, None)
+    assert route.handler == 'root'
+    
+def test_noRoute():
+    '''Reports 4.04 for an unknown path, and 4.05 for an unknown method.'''
+    router = ResourceRouter()
+    router.add(RequestCode.GET, '/sensor/{id}', 'sensor')
+    
+    assert router.lookup(RequestCode.GET, '/sensor')     == (None, None, ClientResponseCode.NotFound)
+    assert router.lookup(RequestCode.GET, '/sensor/7/x') == (None, None, ClientResponseCode.NotFound)
+    assert router.lookup(RequestCode.POST, '/sensor/7')  == (None, None, 
+                                                        ClientResponseCode.MethodNotAllowed)
+    
+def test_conflict():
+    '''Rejects a duplicate route, and a conflicting parameter name.'''
+    router = ResourceRouter()
+    router.add(RequestCode.GET, '/sensor/{id}', 'sensor')
+    with pytest.raises(ValueError):
+        router.add(RequestCode.GET, '/sensor/{id}', 'again')
+    with pytest.raises(ValueError):
+        router.add(RequestCode.PUT, '/sensor/{name}', 'name')
@@ -156,3 +156,348 @@ def test_postResource():
     msg = msgModule.buildFrom(b'\x50\x02\xd0\x07\xb4\x70\x69\x6e\x67\xff\x32\x30\x31\x34\x2c\x31\x32\x35', 
                               address=('::1', 42683, 0, 0))
     server._handleMessage(msg)
+
+#
+# Pooled messages and resources
+#
+
+def test_pooledReply():
+    '''Tests release of a pooled reply after it is sent.'''
+    mockMsgSocket = flexmock(
+        registerForReceive = lambda handler: None,
+        create_socket      = lambda family,type: None,
+        bind               = lambda addr: None)
+
+    sent = []
+    mockMsgSocket.should_receive('send').replace_with(
+                                lambda msg, onSent: sent.append((msg, onSent)))
+
+    # Must import server module here -- after definition of mock MessageSocket
+    from soscoap import server as srvModule
+    server = srvModule.CoapServer(mockMsgSocket, pooled=True)
+    server.registerForResourceGet(getTestResource)
+    
+    msg = msgModule.buildFrom(b'\x40\x01\x6C\x29\xB3\x76\x65\x72', 
+                              address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    
+    assert len(server._resourcePool._free) == 1
+    reply, onSent = sent[0]
+    assert reply.payload == '0.1'
+    
+    onSent(reply)
+    assert server._msgPool._free == [reply]
+
+#
+# Static resources
+#
+
+def test_staticResource():
+    '''Tests a reply for a static resource, without triggering ResourceGet.'''
+    mockMsgSocket = flexmock(
+        registerForReceive = lambda handler: None,
+        create_socket      = lambda family,type: None,
+        bind               = lambda addr: None)
+
+    sent = []
+    mockMsgSocket.should_receive('sendRaw').replace_with(
+                                lambda msgBytes, address: sent.append((msgBytes, address)))
+
+    # Must import server module here -- after definition of mock MessageSocket
+    from soscoap import server as srvModule
+    server = srvModule.CoapServer(mockMsgSocket)
+    server.registerForResourceGet(getErrorResource)
+    server.registerStaticResource('/ver', '0.1')
+    
+    # CON GET /ver, with token 0x66
+    msg = msgModule.buildFrom(b'\x41\x01\x6C\x29\x66\xB3\x76\x65\x72', 
+                              address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    
+    msgBytes, address = sent[0]
+    assert address == ('::1', 42683, 0, 0)
+    # ACK 2.05, same message ID and token; Content-Format text/plain
+    assert msgBytes == b'\x61\x45\x6C\x29\x66\xC0\xff0.1'
+    
+    reply = msgModule.buildFrom(msgBytes)
+    assert reply.strPayload() == '0.1'
+
+#
+# Block-wise transfer
+#
+
+def test_blockTransfer():
+    '''Tests a Block2 transfer of a generator value, requesting 16 byte blocks.'''
+    mockMsgSocket = flexmock(
+        registerForReceive = lambda handler: None,
+        create_socket      = lambda family,type: None,
+        bind               = lambda addr: None)
+
+    sent = []
+    mockMsgSocket.should_receive('send').replace_with(lambda msg: sent.append(msg))
+
+    calls = []
+    def getBigResource(resource):
+        assert resource.path == '/big'
+        calls.append(resource)
+        resource.value = (b'0123456789' for i in range(4))
+
+    # Must import server module here -- after definition of mock MessageSocket
+    from soscoap import server as srvModule
+    server = srvModule.CoapServer(mockMsgSocket)
+    server.registerForResourceGet(getBigResource)
+    
+    def requestBlock(optionBytes):
+        # CON GET /big, with token 0x66, and Block2 option
+        msg = msgModule.buildFrom(b'\x41\x01\x6C\x29\x66\xB3big' + optionBytes, 
+                                  address=('::1', 42683, 0, 0))
+        server._handleMessage(msg)
+        reply = sent[-1]
+        return reply.findOption(coap.OptionType.Block2)[0].value, reply.payload
+        
+    # num 0, szx 0
+    assert requestBlock(b'\xC0') == (0x08, b'0123456789012345')
+    assert len(server._blockTransfers) == 1
+    # num 1
+    assert requestBlock(b'\xC1\x10') == (0x18, b'6789012345678901')
+    assert len(calls) == 1
+    # num 2, last
+    assert requestBlock(b'\xC1\x20') == (0x20, b'23456789')
+    assert server._blockTransfers == {}
+    
+    # Repeat num 1; regenerates the value
+    assert requestBlock(b'\xC1\x10') == (0x18, b'6789012345678901')
+    assert len(calls) == 2
+    # Past the end
+    msg = msgModule.buildFrom(b'\x41\x01\x6C\x29\x66\xB3big\xC1\x50', 
+                              address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    assert sent[-1].codeClass  == coap.CodeClass.ClientError
+    assert sent[-1].codeDetail == coap.ClientResponseCode.BadOption
+
+def test_defaultBlockFits():
+    '''A client MessageSocket with the default buffer receives a complete first
+    block of a large representation.'''
+    from soscoap import block
+    from soscoap import msgsock
+    from soscoap import server as srvModule
+    def getBigResource(resource):
+        resource.value = b'x' * 2000
+    server = srvModule.CoapServer(port=0)
+    server.registerForResourceGet(getBigResource)
+    serverSock = server._msgSocket.endpoints[0]
+    client     = msgsock.MessageSocket(0)
+    received   = []
+    client.registerForReceive(received.append)
+    try:
+        # CON GET /big, with an 8 byte token
+        msg = msgModule.buildFrom(b'\x48\x01\x6C\x29' + b'\x66' * 8 + b'\xB3big',
+                                  address=('::1', serverSock.socket.getsockname()[1], 0, 0))
+        client.send(msg)
+        client.handle_write_event()
+        serverSock.handle_read_event()
+        serverSock.handle_write_event()
+        client.handle_read_event()
+        
+        reply = received[0]
+        num, more, szx = block.decodeBlock(reply.findOption(coap.OptionType.Block2)[0].value)
+        assert (num, more) == (0, True)
+        assert len(reply.payload) == block.blockSize(szx) == 512
+        assert bytes(reply.payload) == b'x' * 512
+    finally:
+        client.close()
+        server._msgSocket.close()
+
+#
+# Batch handling
+#
+
+def test_handleBatch():
+    '''Tests handling of a batch of requests.'''
+    mockMsgSocket = flexmock(
+        registerForReceiveBatch = lambda handler: None,
+        create_socket      = lambda family,type: None,
+        bind               = lambda addr: None)
+
+    sent = []
+    mockMsgSocket.should_receive('send').replace_with(lambda msg: sent.append(msg))
+
+    # Must import server module here -- after definition of mock MessageSocket
+    from soscoap import server as srvModule
+    server = srvModule.CoapServer(mockMsgSocket, readBatch=4)
+    server.registerForResourceGet(getTestResource)
+    
+    msgs = [msgModule.buildFrom(b'\x40\x01\x6C' + bytearray([mid]) + b'\xB3\x76\x65\x72', 
+                                address=('::1', 42683, 0, 0)) for mid in (1, 2)]
+    server._handleBatch(msgs)
+    
+    assert [reply.messageId for reply in sent] == [0x6C01, 0x6C02]
+
+#
+# Blocking handlers
+#
+
+def test_blockingHandler():
+    '''Tests a PUT handler run on the handler thread pool.'''
+    import threading
+    mockMsgSocket = flexmock(
+        registerForReceive   = lambda handler: None,
+        enableCallFromThread = lambda: None,
+        callFromThread       = lambda func, *args: func(*args),
+        create_socket        = lambda family,type: None,
+        bind                 = lambda addr: None)
+
+    replied = threading.Event()
+    sent    = []
+    def send(msg, onSent=None):
+        sent.append(msg)
+        replied.set()
+    mockMsgSocket.should_receive('send').replace_with(send)
+
+    values = []
+    def putResource(resource):
+        assert threading.current_thread().name.startswith('coap-handler')
+        values.append(resource.value)
+
+    # Must import server module here -- after definition of mock MessageSocket
+    from soscoap import server as srvModule
+    server = srvModule.CoapServer(mockMsgSocket, pooled=True)
+    server.registerForResourcePut(putResource, blocking=True)
+    
+    # NON PUT /ping with token 0x66; payload '1'
+    source = bytearray(b'\x51\x03\x03\x17\x66\xb4ping\xff1')
+    msg    = msgModule.buildFrom(source, address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    source[:] = bytearray(len(source))
+    
+    assert replied.wait(2)
+    assert values == [b'1']
+    assert sent[0].codeDetail == coap.SuccessResponseCode.Changed
+    assert sent[0].token == b'\x66'
+    assert len(server._resourcePool._free) == 1
+
+#
+# Stats resource
+#
+
+def test_statsResource():
+    '''Tests a GET for the stats resource.'''
+    mockMsgSocket = flexmock(
+        registerForReceive = lambda handler: None,
+        stats              = lambda: {'received': 1, 'sent': 0},
+        create_socket      = lambda family,type: None,
+        bind               = lambda addr: None)
+
+    sent = []
+    mockMsgSocket.should_receive('send').replace_with(lambda msg: sent.append(msg))
+
+    # Must import server module here -- after definition of mock MessageSocket
+    from soscoap import server as srvModule
+    server = srvModule.CoapServer(mockMsgSocket)
+    server.registerStatsResource()
+    
+    # CON GET /stats
+    msg = msgModule.buildFrom(b'\x40\x01\x6C\x29\xB5stats', address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    
+    reply = sent[0]
+    assert reply.findOption(coap.OptionType.ContentFormat)[0].value == coap.MediaType.Json
+    stats = reply.jsonPayload()
+    assert stats['received'] == 1
+    assert stats['requests'] == 1
+    assert stats['errors']   == 0
+    
+def test_admission():
+    '''Tests a 5.03 reply with Max-Age when admission control sheds a request.'''
+    mockMsgSocket = flexmock(
+        registerForReceive = lambda handler: None,
+        queueDepth         = lambda: 500,
+        create_socket      = lambda family,type: None,
+        bind               = lambda addr: None)
+
+    sent = []
+    mockMsgSocket.should_receive('send').replace_with(lambda msg: sent.append(msg))
+
+    # Must import server module here -- after definition of mock MessageSocket
+    from soscoap import server as srvModule
+    from soscoap.overload import AdmissionControl
+    server = srvModule.CoapServer(mockMsgSocket, 
+                                  admission=AdmissionControl(maxQueue=100, retryAfter=3))
+    server.registerForResourceGet(getTestResource)
+    
+    # CON GET /ver
+    msg = msgModule.buildFrom(b'\x40\x01\x6C\x29\xB3\x76\x65\x72', 
+                              address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    
+    reply = sent[0]
+    assert reply.codeClass  == coap.CodeClass.ServerError
+    assert reply.codeDetail == coap.ServerResponseCode.ServiceUnavailable
+    assert reply.findOption(coap.OptionType.MaxAge)[0].value == 3
+    assert server._admission.shedCount == 1
+    
+def test_route():
+    '''Tests dispatch to the handler for a path, and replies without a route.'''
+    mockMsgSocket = flexmock(
+        registerForReceive = lambda handler: None,
+        create_socket      = lambda family,type: None,
+        bind               = lambda addr: None)
+
+    sent = []
+    mockMsgSocket.should_receive('send').replace_with(lambda msg: sent.append(msg))
+
+    # Must import server module here -- after definition of mock MessageSocket
+    from soscoap import server as srvModule
+    server = srvModule.CoapServer(mockMsgSocket)
+    
+    def getVersion(resource):
+        resource.type  = 'string'
+        resource.value = resource.params['name']
+    server.registerForResourceGet(getVersion, path='/{name}')
+    
+    # CON GET /ver
+    msg = msgModule.buildFrom(b'\x40\x01\x6C\x29\xB3\x76\x65\x72', 
+                              address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    assert sent[0].payload == b'ver'
+    
+    # CON GET /ver/1
+    msg = msgModule.buildFrom(b'\x40\x01\x6C\x2A\xB3\x76\x65\x72\x01\x31', 
+                              address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    assert sent[1].codeClass  == coap.CodeClass.ClientError
+    assert sent[1].codeDetail == coap.ClientResponseCode.NotFound
+    
+    # CON PUT /ver
+    msg = msgModule.buildFrom(b'\x40\x03\x6C\x2B\xB3\x76\x65\x72', 
+                              address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    assert sent[2].codeDetail == coap.ClientResponseCode.MethodNotAllowed
+    
+def test_unknownCriticalOption():
+    '''Tests a 4.02 reply to a CON request with an unknown critical option.'''
+    mockMsgSocket = flexmock(
+        registerForReceive = lambda handler: None,
+        create_socket      = lambda family,type: None,
+        bind               = lambda addr: None)
+
+    sent = []
+    mockMsgSocket.should_receive('send').replace_with(lambda msg: sent.append(msg))
+
+    # Must import server module here -- after definition of mock MessageSocket
+    from soscoap import server as srvModule
+    server = srvModule.CoapServer(mockMsgSocket)
+    server.registerForResourceGet(getTestResource)
+    
+    # CON GET /ver, with option 13
+    msg = msgModule.buildFrom(b'\x40\x01\x6C\x29\xB3\x76\x65\x72\x21\x00', 
+                              address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    # NON GET /ver, with option 13; ignored
+    msg = msgModule.buildFrom(b'\x50\x01\x6C\x2A\xB3\x76\x65\x72\x21\x00', 
+                              address=('::1', 42683, 0, 0))
+    server._handleMessage(msg)
+    
+    assert len(sent) == 1
+    assert sent[0].codeClass  == coap.CodeClass.ClientError
+    assert sent[0].codeDetail == coap.ClientResponseCode.BadOption